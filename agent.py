@@ -19,6 +19,13 @@ from PIL import Image, ImageDraw
 from typing import Dict, Any, Optional
 import queue
 import os
+import random
+from protocol import PROTOCOL_VERSION, JSON, GZIP, IDENTITY, full_message, delta_message, encode_body, negotiate
+from spool import SpoolBuffer
+from collector import MetricsCollector, FixedRateScheduler
+from inventory import InventoryProbe, default_provider
+from processes import ProcessTable
+from transport import Transport, CircuitBreaker, CircuitOpenError, TransportError, TransportTimeout, backoff_delay
 
 def get_agent_version():
     try:
@@ -51,10 +58,22 @@ DEFAULT_CONFIG = {
     "report_interval": 10,
     "connection_timeout": 5,
     "retry_attempts": 3,
-    "retry_delay": 2,
+    "retry_delay": 2,  # base of the exponential backoff between retries
+    "retry_max_delay": 30,
+    "circuit_failure_threshold": 5,  # consecutive failures before requests stop for a while
+    "circuit_reset_timeout": 30,
+    "http2": True,  # used for https:// URLs when httpx and h2 are installed
     "log_level": "INFO",
     "max_log_size": 10485760,  # 10MB
-    "enable_notifications": True
+    "enable_notifications": True,
+    "full_snapshot_interval": 360,  # reports between full snapshots in delta mode
+    "spool_dir": "spool",  # undelivered reports are buffered here
+    "spool_max_mb": 50,
+    "catchup_batch_size": 100,  # buffered reports per upload
+    "catchup_batches_per_minute": 6,
+    "catchup_max_jitter": 30,  # seconds to wait at random before draining after a reconnect
+    "medium_tier_ticks": 6,  # disk layout / interface counters refresh every N reports
+    "inventory_ttl": 86400  # seconds; installed programs also refresh when the registry changes
 }
 
 class Config:
@@ -88,14 +107,83 @@ class Config:
         self.config[key] = value
         self.save_config()
 
+class TokenBucket:
+    """Allow ``rate`` operations per second on average, in bursts of up to ``capacity``"""
+
+    def __init__(self, rate: float, capacity: float = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def acquire(self):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            # Jittered wait so agents that reconnected together drift apart
+            time.sleep((1 - self.tokens) / self.rate * random.uniform(1.0, 1.5))
+
+# Sections refreshed less often than every tick; their collection time is reported
+TIERED_SECTIONS = ("disk_partitions", "network_interfaces", "installed_programs")
+
 class SystemMonitor:
-    def __init__(self):
+    def __init__(self, inventory_provider=None):
         self.config = Config()
         self.setup_logging()
         self.last_data = {}
         self.connection_status = {"connected": False, "last_success": None, "error_count": 0}
         self.status_queue = queue.Queue()
         self.running = True
+
+        # Delta protocol state: switched on once the server advertises support
+        self.protocol_version = 1
+        self.acked_seq = 0
+        self.acked_snapshot = None
+        self.reports_since_full = 0
+        self.force_full = True
+
+        # Wire format: plain JSON until the server lists what else it accepts
+        self.content_type = JSON
+        self.content_encoding = IDENTITY
+
+        # Reports that could not be delivered, uploaded in batches later
+        self.spool = self.open_spool()
+        self.catchup_wakeup = threading.Event()
+
+        # One keep-alive client for every request to the server
+        self.transport = Transport(
+            timeout=self.config.get('connection_timeout', 5),
+            http2=self.config.get('http2', True),
+            breaker=CircuitBreaker(
+                failure_threshold=self.config.get('circuit_failure_threshold', 5),
+                reset_timeout=self.config.get('circuit_reset_timeout', 30)
+            )
+        )
+
+        # Non-blocking collection: slow probes run concurrently, CPU is a delta between ticks
+        self.stop_event = threading.Event()
+        self.collector = MetricsCollector()
+        self.inventory_provider = inventory_provider or default_provider()
+        self.disk_partitions = None
+        medium = max(int(self.config.get("medium_tier_ticks", 6)), 1)
+        inventory = InventoryProbe(self.inventory_provider)
+        # Fast tier: every tick
+        self.collector.register("disk", self.get_disk_info, default={})
+        self.process_table = ProcessTable()
+        self.collector.register("processes", self.process_table.sample, default={"cpu": [], "memory": [], "io": []})
+        # Medium tier: every `medium_tier_ticks` ticks
+        self.collector.register("disk_partitions", self.get_disk_partitions, default=[], every=medium)
+        self.collector.register("network_interfaces", self.get_network_interfaces, default={}, every=medium)
+        # Inventory: on TTL or registry change, never waited for
+        self.collector.register(
+            "installed_programs", inventory, every=None, background=True,
+            ttl=self.config.get("inventory_ttl", 86400), changed=inventory.changed
+        )
+        self.scheduler = FixedRateScheduler(self.config.get('report_interval', 10))
         
     def setup_logging(self):
         log_level = getattr(logging, self.config.get('log_level', 'INFO'))
@@ -130,25 +218,34 @@ class SystemMonitor:
             logging.error(f"Network interface data get error: {e}")
         return interfaces
     
-    def get_disk_info(self) -> Dict[str, Dict[str, Any]]:
-        """Get disk usage for all mounted drives"""
-        disks = {}
+    def get_disk_partitions(self):
+        """Refresh the list of mounted volumes (the disk layout)"""
         try:
-            for partition in psutil.disk_partitions():
-                try:
-                    usage = psutil.disk_usage(partition.mountpoint)
-                    disks[partition.device] = {
-                        "mountpoint": partition.mountpoint,
-                        "fstype": partition.fstype,
-                        "total": usage.total,
-                        "used": usage.used,
-                        "free": usage.free,
-                        "percent": (usage.used / usage.total) * 100
-                    }
-                except (PermissionError, OSError):
-                    continue
+            self.disk_partitions = [
+                (partition.device, partition.mountpoint, partition.fstype)
+                for partition in psutil.disk_partitions()
+            ]
         except Exception as e:
             logging.error(f"Disk bilgisi alınamadı: {e}")
+        return self.disk_partitions or []
+
+    def get_disk_info(self) -> Dict[str, Dict[str, Any]]:
+        """Get disk usage for the known mounted drives"""
+        disks = {}
+        partitions = self.disk_partitions if self.disk_partitions is not None else self.get_disk_partitions()
+        for device, mountpoint, fstype in partitions:
+            try:
+                usage = psutil.disk_usage(mountpoint)
+                disks[device] = {
+                    "mountpoint": mountpoint,
+                    "fstype": fstype,
+                    "total": usage.total,
+                    "used": usage.used,
+                    "free": usage.free,
+                    "percent": (usage.used / usage.total) * 100
+                }
+            except (PermissionError, OSError):
+                continue
         return disks
     
     def check_for_updates(self, server_response: dict):
@@ -199,60 +296,11 @@ class SystemMonitor:
         
 
     def get_top_processes(self, limit=5):
-        processes = []
-        for p in psutil.process_iter(['name', 'cpu_percent']):
-            try:
-                name = p.info['name'] or "Unknown"
-                cpu = p.info['cpu_percent']
-                if name.lower() != "system idle process":
-                    processes.append({'name': name, 'cpu': cpu})
-            except (psutil.NoSuchProcess, psutil.AccessDenied):
-                continue
-
-        sorted_procs = sorted(processes, key=lambda x: x['cpu'], reverse=True)[:limit]
-        return sorted_procs
+        """Top processes by CPU over the collector's last interval"""
+        return self.process_table.top(limit, "cpu")
 
     def get_installed_programs(self):
-        try:
-            si = None
-            if platform.system() == "Windows":
-                si = subprocess.STARTUPINFO()
-                si.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-
-            combined = []
-            for reg_path in [
-                "HKLM:\\Software\\Wow6432Node\\Microsoft\\Windows\\CurrentVersion\\Uninstall\\*",
-                "HKLM:\\Software\\Microsoft\\Windows\\CurrentVersion\\Uninstall\\*"
-            ]:
-                result = subprocess.run(
-                    ['powershell', '-Command',
-                    f"Get-ItemProperty {reg_path} | "
-                    "Where-Object { $_.DisplayName -ne $null } | "
-                    "Select-Object DisplayName, DisplayVersion | ConvertTo-Json"],
-                    capture_output=True, text=True, timeout=15,
-                    startupinfo=si
-                )
-                if result.returncode != 0 or not result.stdout.strip():
-                    continue
-                try:
-                    data = json.loads(result.stdout)
-                    if isinstance(data, dict):
-                        data = [data]
-                    combined.extend(data)
-                except json.JSONDecodeError:
-                    continue
-
-            programs = []
-            for entry in combined:
-                name = (entry.get("DisplayName") or "").strip()
-                version = (entry.get("DisplayVersion") or "Unknown").strip()
-                if name:
-                    programs.append({"name": name, "version": version})
-
-            return programs
-        except Exception as e:
-            logging.error(f"Installed programs info error: {e}")
-            return []
+        return self.inventory_provider.programs()
 
     
     def get_metrics(self) -> Dict[str, Any]:
@@ -265,25 +313,7 @@ class SystemMonitor:
                 hostname = platform.node()
                 ip = "127.0.0.1"
             
-            # CPU info
-            cpu_percent = psutil.cpu_percent(interval=1)
-            cpu_count = psutil.cpu_count()
-            cpu_freq = psutil.cpu_freq()
-            
-            # Memory info
-            memory = psutil.virtual_memory()
-            swap = psutil.swap_memory()
-            
-            # Network info
-            net_io = psutil.net_io_counters()
-            network_interfaces = self.get_network_interfaces()
-            
-            # Disk info
-            disk_info = self.get_disk_info()
-            
-            
-            # Process count
-            process_count = len(psutil.pids())
+            sample = self.collector.collect()
             
             self.last_data = {
                 "timestamp": datetime.now().isoformat(),
@@ -292,41 +322,22 @@ class SystemMonitor:
                 "os": f"{platform.system()} {platform.release()}",
                 "architecture": platform.architecture()[0],
                 "uptime": self.get_system_uptime(),
-                
-                "cpu": {
-                    "percent": cpu_percent,
-                    "count": cpu_count,
-                    "frequency": cpu_freq._asdict() if cpu_freq else None
-                },
-                
-                "memory": {
-                    "percent": memory.percent,
-                    "total": memory.total,
-                    "available": memory.available,
-                    "used": memory.used,
-                    "free": memory.free
-                },
-                
-                "swap": {
-                    "percent": swap.percent,
-                    "total": swap.total,
-                    "used": swap.used,
-                    "free": swap.free
-                },
-                
-                "network": {
-                    "total_sent": net_io.bytes_sent,
-                    "total_recv": net_io.bytes_recv,
-                    "interfaces": network_interfaces
-                },
-                
-                "disk": disk_info,
-                "installed_programs": self.get_installed_programs(),
+                "cpu": sample["cpu"],
+                "memory": sample["memory"],
+                "swap": sample["swap"],
+                "network": {**sample["network_totals"], "interfaces": sample["network_interfaces"]},
+                "disk": sample["disk"],
                 "agent_version": self.config.get("agent_version", "1.0.0"),
-                "top_processes": self.get_top_processes(),
+                "top_processes": sample["processes"]["cpu"],
+                "top_memory_processes": sample["processes"]["memory"],
+                "top_io_processes": sample["processes"]["io"],
                 "status": "ok",
-                "process_count": process_count
+                "process_count": sample["process_count"],
+                "collected_at": self.collector.get_freshness(TIERED_SECTIONS)
             }
+            # Left out until the first inventory finishes; the server keeps its last known list
+            if self.last_data["collected_at"]["installed_programs"] is not None:
+                self.last_data["installed_programs"] = sample["installed_programs"]
             
             return self.last_data
             
@@ -334,21 +345,62 @@ class SystemMonitor:
             logging.error(f"Metrics info error: {e}")
             return {}
     
+    def build_report_message(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Wrap metrics for the negotiated protocol: plain, full snapshot or delta"""
+        if self.protocol_version < PROTOCOL_VERSION:
+            return data
+
+        if (
+            self.force_full
+            or self.acked_snapshot is None
+            or self.acked_snapshot.get("hostname") != data.get("hostname")
+            or self.reports_since_full >= self.config.get("full_snapshot_interval", 360)
+        ):
+            return full_message(data, self.acked_seq + 1)
+        return delta_message(self.acked_snapshot, data, self.acked_seq)
+
+    def acknowledge_report(self, message: Dict[str, Any], data: Dict[str, Any], server_response: dict):
+        """Record what the server now holds so the next report can be a delta"""
+        if message.get("protocol") == PROTOCOL_VERSION:
+            self.acked_seq = message["seq"]
+            self.acked_snapshot = data
+            if message.get("type") == "full":
+                self.reports_since_full = 0
+                self.force_full = False
+            else:
+                self.reports_since_full += 1
+        elif server_response.get("protocol", 1) >= PROTOCOL_VERSION:
+            logging.info(f"Server supports protocol v{PROTOCOL_VERSION}, switching to delta reports")
+            self.protocol_version = PROTOCOL_VERSION
+            self.force_full = True
+
+        accept = server_response.get("accept")
+        if isinstance(accept, dict):
+            wire_format = negotiate(accept.get("content_types"), accept.get("content_encodings"))
+            if wire_format != (self.content_type, self.content_encoding):
+                logging.info(f"Switching report encoding to {wire_format[0]} ({wire_format[1]})")
+                self.content_type, self.content_encoding = wire_format
+
     def send_data_with_retry(self, data: Dict[str, Any]) -> bool:
         """Send data with retry mechanism"""
         retry_attempts = self.config.get('retry_attempts', 3)
         retry_delay = self.config.get('retry_delay', 2)
+        retry_max_delay = self.config.get('retry_max_delay', 30)
         
         for attempt in range(retry_attempts):
+            message = self.build_report_message(data)
             try:
-                response = requests.post(
+                headers = {
+                    'Content-Type': self.content_type,
+                    'Authorization': f"Bearer {self.config.get('auth_token', '')}"
+                }
+                if self.content_encoding != IDENTITY:
+                    headers['Content-Encoding'] = self.content_encoding
+                response = self.transport.post(
                     self.config.get('dashboard_url'),
-                    json=data,
+                    data=encode_body(message, self.content_type, self.content_encoding),
                     timeout=self.config.get('connection_timeout', 5),
-                    headers={
-                    'Content-Type': 'application/json',
-                    'Authorization': f"Bearer {self.config.get('auth_token', '')}"
-                    }
+                    headers=headers
                 )
                 
                 if response.ok:
@@ -360,22 +412,41 @@ class SystemMonitor:
                     logging.info(f"✅ [{data.get('hostname', 'Unknown')}] Report sent succesfully!")
 
                     try:
-                        self.check_for_updates(response.json())
+                        server_response = response.json()
+                    except ValueError:
+                        server_response = {}
+                    self.acknowledge_report(message, data, server_response)
+
+                    try:
+                        self.check_for_updates(server_response)
                     except Exception as e:
                         logging.error(f"Update check error: {e}")
                     return True
+                elif response.status_code == 409:
+                    # Server lost track of our snapshot: resend everything right away
+                    logging.info("Server requested a full snapshot")
+                    self.force_full = True
+                    continue
+                elif response.status_code == 415 and (self.content_type, self.content_encoding) != (JSON, IDENTITY):
+                    # Server no longer understands our encoding (e.g. rolled back): fall back to JSON
+                    logging.info("Server rejected report encoding, falling back to plain JSON")
+                    self.content_type, self.content_encoding = JSON, IDENTITY
+                    continue
                 else:
                     logging.warning(f"⚠️ HTTP {response.status_code}: {response.text}")
                     
-            except requests.exceptions.Timeout:
+            except CircuitOpenError:
+                logging.warning("⛔ Server marked down, skipping send")
+                break
+            except TransportTimeout:
                 logging.error(f"❌ Timeout (Try {attempt + 1}/{retry_attempts})")
-            except requests.exceptions.ConnectionError:
+            except TransportError:
                 logging.error(f"❌ Connection Error (Try {attempt + 1}/{retry_attempts})")
             except Exception as e:
                 logging.error(f"❌ Error: {e} (Try {attempt + 1}/{retry_attempts})")
             
             if attempt < retry_attempts - 1:
-                time.sleep(retry_delay)
+                time.sleep(backoff_delay(attempt, retry_delay, retry_max_delay))
         
         self.connection_status.update({
             "connected": False,
@@ -384,27 +455,115 @@ class SystemMonitor:
         
         return False
     
+    def open_spool(self) -> Optional[SpoolBuffer]:
+        try:
+            return SpoolBuffer(
+                self.config.get("spool_dir", "spool"),
+                max_bytes=int(self.config.get("spool_max_mb", 50) * 1024 * 1024)
+            )
+        except Exception as e:
+            logging.error(f"Spool unavailable, undelivered reports will be lost: {e}")
+            return None
+
+    def spool_report(self, data: Dict[str, Any], captured_at: float):
+        """Keep an undelivered report for the catch-up upload"""
+        if self.spool is None:
+            return
+        record = dict(data)
+        record.pop("installed_programs", None)  # current state only, resent live
+        record["captured_at"] = captured_at
+        try:
+            self.spool.append(record)
+        except Exception as e:
+            logging.error(f"Spool write error: {e}")
+
+    def upload_batch(self, records) -> bool:
+        """POST buffered reports to the batch endpoint, always compressed"""
+        url = self.config.get("batch_url") or self.config.get("dashboard_url", "").rstrip("/") + "/batch"
+        content_encoding = GZIP if self.content_encoding == IDENTITY else self.content_encoding
+        headers = {
+            'Content-Type': self.content_type,
+            'Content-Encoding': content_encoding,
+            'Authorization': f"Bearer {self.config.get('auth_token', '')}"
+        }
+        try:
+            response = self.transport.post(
+                url,
+                data=encode_body({"reports": records}, self.content_type, content_encoding),
+                timeout=self.config.get('connection_timeout', 5) * 3,
+                headers=headers,
+                label="batch"
+            )
+        except TransportError as e:
+            logging.warning(f"Catch-up upload failed: {e}")
+            return False
+
+        if response.ok:
+            logging.info(f"Uploaded {len(records)} buffered reports")
+            return True
+        if response.status_code == 404:
+            logging.warning("Server has no batch endpoint, keeping buffered reports")
+        else:
+            logging.warning(f"⚠️ Catch-up upload HTTP {response.status_code}: {response.text}")
+            retry_after = response.headers.get("Retry-After", "")
+            if retry_after.isdigit():
+                time.sleep(int(retry_after) + random.uniform(0, int(retry_after)))
+        return False
+
+    def catchup_loop(self):
+        """Drain the spool while the server is reachable, rate limited and jittered"""
+        batches_per_minute = max(float(self.config.get("catchup_batches_per_minute", 6)), 0.1)
+        bucket = TokenBucket(batches_per_minute / 60.0)
+
+        while self.running:
+            self.catchup_wakeup.wait(timeout=60)
+            self.catchup_wakeup.clear()
+            if not self.spool or not self.connection_status.get("connected"):
+                continue
+
+            # Spread out agents that all come back when the server does
+            time.sleep(random.uniform(0, self.config.get("catchup_max_jitter", 30)))
+            while self.running and self.spool and self.connection_status.get("connected"):
+                bucket.acquire()
+                records, position = self.spool.read_batch(self.config.get("catchup_batch_size", 100))
+                if records and not self.upload_batch(records):
+                    break
+                self.spool.commit(position)
+
+            if self.spool and self.spool.dropped_records:
+                logging.warning(f"Spool overflowed, {self.spool.dropped_records} oldest reports were dropped")
+
     def send_loop(self):
         """Main sending loop"""
         logging.info("Monitoring agent started")
         
         while self.running:
+            # Ticks stay on interval boundaries however long collection and sending take
+            self.scheduler.set_interval(self.config.get('report_interval', 10))
+            if not self.scheduler.wait(self.stop_event):
+                break
             try:
                 data = self.get_metrics()
                 if data:
+                    captured_at = time.time()
                     success = self.send_data_with_retry(data)
+                    if not success:
+                        self.spool_report(data, captured_at)
+                    elif self.spool:
+                        self.catchup_wakeup.set()
                     self.status_queue.put(("status_update", success))
                 else:
                     logging.error("Metrics Error")
                     
             except Exception as e:
                 logging.error(f"Send loop error: {e}")
-            
-            time.sleep(self.config.get('report_interval', 10))
     
     def stop(self):
         """Stop the monitoring agent"""
         self.running = False
+        self.stop_event.set()
+        self.collector.shutdown()
+        self.transport.close()
         logging.info("Monitoring agent stopping...")
 
 class AgentGUI:
@@ -553,6 +712,48 @@ class AgentGUI:
             row.pack(fill="x", pady=3)
             tk.Label(row, text=f"{label}:", font=("Arial", 10, "bold"), width=20, anchor="w").pack(side="left")
             tk.Label(row, text=str(value), font=("Arial", 10), anchor="w").pack(side="left")
+
+        timing_frame = ttk.LabelFrame(frame, text="Collection Timings", padding=10)
+        timing_frame.pack(fill="x", pady=10)
+
+        scheduler = self.monitor.scheduler.get_stats()
+        timing_info = [("Tick Lag / Skipped", f"{scheduler['last_lag_ms']} ms / {scheduler['skipped']}")]
+        for name, timing in sorted(self.monitor.collector.get_timings().items()):
+            timing_info.append((name, f"last {timing['last_ms']} ms, avg {timing['avg_ms']} ms, max {timing['max_ms']} ms"))
+
+        for label, value in timing_info:
+            row = tk.Frame(timing_frame)
+            row.pack(fill="x", pady=1)
+            tk.Label(row, text=f"{label}:", font=("Arial", 9, "bold"), width=20, anchor="w").pack(side="left")
+            tk.Label(row, text=value, font=("Arial", 9), anchor="w").pack(side="left")
+
+        transport_frame = ttk.LabelFrame(frame, text="Transport", padding=10)
+        transport_frame.pack(fill="x", pady=10)
+
+        transport = self.monitor.transport.get_stats()
+        transport_info = [
+            ("Protocol", transport["http_version"]),
+            ("Circuit", transport["circuit"]),
+            ("Requests / Errors / Skipped", f"{transport['requests']} / {transport['errors']} / {transport['rejected']}"),
+        ]
+        for label, value in transport_info:
+            row = tk.Frame(transport_frame)
+            row.pack(fill="x", pady=1)
+            tk.Label(row, text=f"{label}:", font=("Arial", 9, "bold"), width=24, anchor="w").pack(side="left")
+            tk.Label(row, text=str(value), font=("Arial", 9), anchor="w").pack(side="left")
+
+        for endpoint, histogram in sorted(transport["latency"].items()):
+            tk.Label(
+                transport_frame,
+                text=f"{endpoint} latency: avg {histogram['avg_ms']} ms, p50 ≤{histogram['p50_ms']} ms, p95 ≤{histogram['p95_ms']} ms",
+                font=("Arial", 9, "bold"), anchor="w"
+            ).pack(fill="x", pady=(6, 1))
+            peak = max((count for _, count in histogram["buckets"]), default=0) or 1
+            for bound, count in histogram["buckets"]:
+                bucket = "> 5000 ms" if bound == float("inf") else f"≤ {bound} ms"
+                bar = "█" * round(count / peak * 30)
+                tk.Label(transport_frame, text=f"{bucket:>10}  {bar} {count}",
+                         font=("Consolas", 9), anchor="w").pack(fill="x")
     
     def populate_logs_tab(self, frame):
         """Populate logs tab"""
@@ -660,6 +861,7 @@ def main():
         # Start monitoring thread
         monitor_thread = threading.Thread(target=monitor.send_loop, daemon=True)
         monitor_thread.start()
+        threading.Thread(target=monitor.catchup_loop, daemon=True).start()
         
         # Start GUI
         gui.run_tray()
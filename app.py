@@ -1,10 +1,23 @@
-from flask import Flask, jsonify, render_template, request, send_from_directory, redirect, url_for
+from flask import Flask, Response, jsonify, render_template, request, send_from_directory, redirect, url_for
+import math
 import time
+import json
+import base64
 import logging
-from datetime import datetime
+from datetime import datetime, timedelta
 import os
-from db import insert_report, get_all_reports, get_client_history, get_current_clients
-from recommender import get_recommendations
+from db import REPORT_FILTER_METRICS, REPORT_FILTER_OPERATORS, insert_report, insert_reports_batch, get_reports_page, iter_reports, iter_metric_rows, get_fleet_series, get_top_hosts, get_client_history, get_current_clients, get_pool_stats, get_client_snapshot
+from recommender import start_recommender
+from ingest import create_ingest_queue
+from rollups import (RESOLUTIONS, METRICS, DEFAULT_MAX_POINTS, choose_resolution, window_resolution,
+                     merge_histograms, summarize_fleet_bucket, histogram_bins)
+from statecache import create_state_cache
+from export import CONTENT_TYPES, EXPORT_COLUMNS, encode as encode_export, parse_time
+from stream import StreamHub, STREAM_MAX_RATE, streaming_supported
+from fleetmetrics import FleetExporter
+import metrics
+from protocol import (PROTOCOL_VERSION, UnsupportedEncoding, resolve_message, decode_body,
+                      supported_content_types, supported_content_encodings)
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -15,113 +28,525 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
-clients = {}  # hostname -> latest data
+app.config["LIVE_STREAM"] = streaming_supported()  # asgi_app.py turns it on for its event loop
+state_cache = create_state_cache()  # hostname -> latest data, shared by the workers on this host
+stream_hub = StreamHub(state_cache)  # pushes state cache changes to /api/stream subscribers
+fleet_exporter = FleetExporter(state_cache)  # /metrics/fleet, re-rendered per state cache generation
 REQUIRED_AGENT_VERSION = "1.0.1"  # En son ajan versiyonu
+MAX_BATCH_REPORTS = int(os.getenv("MAX_BATCH_REPORTS", "1000"))
+MAX_REPORTS_PAGE = int(os.getenv("MAX_REPORTS_PAGE", "1000"))
+ingest_queue = create_ingest_queue()  # None when INGEST_MODE=sync
+STARTED_AT = time.time()
+
+report_decode_seconds = metrics.DECODE_SECONDS.labels()
+_ingested = {endpoint: (metrics.INGEST_REPORTS.labels(endpoint), metrics.INGEST_BYTES.labels(endpoint))
+             for endpoint in ("report", "batch")}
+
+def count_ingest(endpoint, reports, size):
+    counter, bytes_counter = _ingested[endpoint]
+    counter.inc(reports)
+    bytes_counter.inc(size or 0)
+
+@app.before_request
+def start_request_timer():
+    request.environ["winperf.started"] = time.perf_counter()
+
+@app.after_request
+def record_request(response):
+    started = request.environ.get("winperf.started")
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule is not None else "<unmatched>"
+        metrics.route_metrics(route).observe(time.perf_counter() - started, response.status_code)
+    return response
 
 @app.route("/")
 def index():
-    return render_template("dashboard.html")
+    return render_template("dashboard.html", live_stream=app.config["LIVE_STREAM"])
 
-@app.route("/api/report", methods=["POST"])
-def api_report():
+def load_snapshot(hostname, seq):
+    """Base document for a delta report: this worker's copy if it is at ``seq``, else the database's"""
+    snapshot = state_cache.get(hostname)
+    if snapshot is not None and snapshot.get("seq") == seq:
+        return snapshot
+    return get_client_snapshot(hostname)
 
-    auth_header = request.headers.get("Authorization", "")
+def accepted_formats():
+    """Body formats advertised to agents so they can upgrade from plain JSON"""
+    return {
+        "content_types": supported_content_types(),
+        "content_encodings": supported_content_encodings()
+    }
+
+def auth_error(auth_header):
+    """Error message for a missing or wrong bearer token, None when authorized"""
     if not auth_header.startswith("Bearer "):
-        return jsonify({"error": "Missing or invalid authorization header"}), 401
+        return "Missing or invalid authorization header"
     token = auth_header.split(" ")[1]
     if token != API_SECRET:
-        return jsonify({"error": "Unauthorized"}), 401
-    
+        return "Unauthorized"
+    return None
+
+def check_auth():
+    """Error response for a missing or wrong bearer token, None when authorized"""
+    error = auth_error(request.headers.get("Authorization", ""))
+    if error:
+        return jsonify({"error": error}), 401
+    return None
+
+def stamp_report(data, previous=None):
+    """Add the server-side fields to an accepted live report.
+
+    ``previous`` is the host's last document, needed only when the agent
+    omitted ``installed_programs`` (it has not collected them yet).
+    """
+    data["last_seen"] = time.time()
+    data["server_timestamp"] = datetime.now().isoformat()
+    if "installed_programs" not in data:
+        # Agents omit the inventory until they have collected it: keep the last known list
+        data["installed_programs"] = (previous or {}).get("installed_programs", [])
+
+    agent_version = data.get("agent_version", "0.0.0")
+    data["status"] = "outdated" if agent_version < REQUIRED_AGENT_VERSION else "ok"
+
+    # Rules are evaluated in the background over recent samples; store the host's current advice with the report
+    data["recommendations"] = state_cache.annotations(data["hostname"]).get("recommendations", [])
+    return data
+
+def report_accepted(data):
+    """Response body of an accepted live report"""
+    return {
+        "status": "ok",
+        "timestamp": data["server_timestamp"],
+        "agent_status": data["status"],
+        "required_version": REQUIRED_AGENT_VERSION,
+        "protocol": PROTOCOL_VERSION,
+        "accept": accepted_formats()
+    }
+
+def stamp_batch(reports):
+    """Spooled reports ready for ``insert_reports_batch``, stamped with their ``captured_at`` time"""
+    batch = []
+    for data in reports:
+        if not isinstance(data, dict) or "hostname" not in data:
+            continue
+        captured_at = data.pop("captured_at", None)
+        data["last_seen"] = captured_at if isinstance(captured_at, (int, float)) else time.time()
+        data["server_timestamp"] = datetime.fromtimestamp(data["last_seen"]).isoformat()
+        data["status"] = "outdated" if data.get("agent_version", "0.0.0") < REQUIRED_AGENT_VERSION else "ok"
+        batch.append(data)
+    return batch
+
+def read_report_body():
+    """Decode the request body; returns (message, error_response)"""
+    started = time.perf_counter()
     try:
-        data = request.json
-        if not data or "hostname" not in data:
-            logger.warning(f"Invalid data received: {data}")
-            return jsonify({"error": "Invalid data - hostname required"}), 400
+        message = decode_body(request.get_data(), request.content_type, request.content_encoding)
+        report_decode_seconds.observe(time.perf_counter() - started)
+        return message, None
+    except UnsupportedEncoding as e:
+        return None, (jsonify({"error": str(e), "accept": accepted_formats()}), 415)
+    except Exception as e:
+        logger.warning(f"Undecodable report body: {e}")
+        return None, (jsonify({"error": "Malformed report body"}), 400)
 
-        data["last_seen"] = time.time()
-        data["server_timestamp"] = datetime.now().isoformat()
-        data["installed_programs"] = data.get("installed_programs", [])
+@app.route("/api/report", methods=["POST"])
+def api_report():
+    error = check_auth()
+    if error:
+        return error
 
-        agent_version = data.get("agent_version", "0.0.0")
-        data["status"] = "outdated" if agent_version < REQUIRED_AGENT_VERSION else "ok"
+    message, error = read_report_body()
+    if error:
+        return error
 
-        clients[data["hostname"]] = data
-        insert_report(data)
+    try:
+        if not isinstance(message, dict) or "hostname" not in message:
+            logger.warning(f"Invalid data received: {message}")
+            return jsonify({"error": "Invalid data - hostname required"}), 400
 
-        if "cpu" in data and "memory" in data and "disk" in data:
-            cpu_percent = data["cpu"].get("percent", 0) if isinstance(data["cpu"], dict) else data.get("cpu", 0)
-            memory_percent = data["memory"].get("percent", 0) if isinstance(data["memory"], dict) else data.get("ram", 0)
+        data = resolve_message(message, load_snapshot)
+        if data is None:
+            logger.info(f"Snapshot mismatch for {message['hostname']}, requesting resync")
+            return jsonify({"status": "resync", "protocol": PROTOCOL_VERSION}), 409
 
-            disk_percent = 0
-            if isinstance(data.get("disk"), dict):
-                disk_info = list(data["disk"].values())
-                if disk_info:
-                    disk_percent = disk_info[0].get("percent", 0)
+        previous = None
+        if "installed_programs" not in data:
+            previous = state_cache.get(data["hostname"]) or get_client_snapshot(data["hostname"])
+        stamp_report(data, previous)
 
-            metrics = {
-                "cpu": cpu_percent,
-                "ram": memory_percent,
-                "disk": disk_percent
-            }
+        if ingest_queue is None:
+            insert_report(data)
 
-            top_processes = data.get("top_processes", [])
-            recommendations = get_recommendations(metrics, top_processes)
-            data["recommendations"] = recommendations
+        if ingest_queue is not None and not ingest_queue.submit(data):
+            logger.warning(f"Ingest queue full, rejecting report from {data['hostname']}")
+            response = jsonify({"error": "Server busy, retry later"})
+            response.headers["Retry-After"] = "5"
+            return response, 503
 
+        state_cache.put(data["hostname"], data)
+        stream_hub.notify()
+        count_ingest("report", 1, request.content_length)
         logger.info(f"Report received from {data['hostname']}")
-        return jsonify({
-            "status": "ok",
-            "timestamp": data["server_timestamp"],
-            "agent_status": data["status"],
-            "required_version": REQUIRED_AGENT_VERSION
-        })
+        return jsonify(report_accepted(data))
 
     except Exception as e:
         logger.error(f"Error processing report: {str(e)}")
         return jsonify({"error": "Internal server error"}), 500
 
+@app.route("/api/report/batch", methods=["POST"])
+def api_report_batch():
+    """Backlog upload from an agent's local spool: plain reports stamped with ``captured_at``"""
+    error = check_auth()
+    if error:
+        return error
+
+    message, error = read_report_body()
+    if error:
+        return error
+
+    reports = message.get("reports") if isinstance(message, dict) else message
+    if not isinstance(reports, list):
+        return jsonify({"error": "Invalid data - reports list required"}), 400
+    if len(reports) > MAX_BATCH_REPORTS:
+        return jsonify({"error": f"Too many reports, at most {MAX_BATCH_REPORTS} per batch"}), 413
+
+    try:
+        # Already batched by the agent: write in one transaction, bypassing the ingest queue
+        accepted = insert_reports_batch(stamp_batch(reports))
+    except Exception as e:
+        logger.error(f"Error storing report batch: {str(e)}")
+        return jsonify({"error": "Internal server error"}), 500
+
+    count_ingest("batch", accepted, request.content_length)
+    logger.info(f"Stored {accepted} buffered reports ({len(reports) - accepted} rejected)")
+    return jsonify({"status": "ok", "accepted": accepted, "rejected": len(reports) - accepted})
+
 @app.route("/reports")
 def reports_page():
     return render_template("reports.html")
 
+def encode_page_cursor(after):
+    timestamp, report_id = after
+    return base64.urlsafe_b64encode(f"{timestamp.isoformat()}|{report_id}".encode()).decode().rstrip("=")
+
+def decode_page_cursor(cursor):
+    padded = cursor + "=" * (-len(cursor) % 4)
+    timestamp, report_id = base64.urlsafe_b64decode(padded).decode().split("|")
+    return datetime.fromisoformat(timestamp), int(report_id)
+
+def report_filters(args=None):
+    """Listing filters from the query string: ``hostname`` (repeated or comma separated),
+    ``since``/``until`` and metric thresholds such as ``cpu_gt=90``"""
+    args = request.args if args is None else args
+    hostnames = [name for value in args.getlist("hostname") for name in value.split(",") if name]
+    filters = {"hostnames": hostnames or None}
+    for key in ("since", "until"):
+        value = args.get(key)
+        filters[key] = parse_time(value) if value else None
+
+    thresholds = []
+    for key, value in args.items():
+        metric, _, operator = key.rpartition("_")
+        if metric in REPORT_FILTER_METRICS and operator in REPORT_FILTER_OPERATORS:
+            thresholds.append((metric, operator, float(value)))
+    filters["thresholds"] = thresholds
+    return filters
+
 @app.route("/api/reports")
 def api_reports():
+    """Reports newest first, filtered and keyset-paginated.
+
+    The JSON body is one page; ``X-Next-Cursor`` (and a ``Link`` header) give
+    the ``cursor`` of the next one. ``format=ndjson`` streams every matching
+    report instead, one JSON object per line.
+    """
+    try:
+        filters = report_filters()
+        after = decode_page_cursor(request.args["cursor"]) if request.args.get("cursor") else None
+        limit = request.args.get("limit", type=int)
+    except (ValueError, TypeError, OverflowError, OSError) as e:
+        return jsonify({"error": f"Invalid query parameter: {e}"}), 400
+    if limit is not None and limit <= 0:
+        return jsonify({"error": "limit must be positive"}), 400
+
+    if request.args.get("format") == "ndjson":
+        def generate():
+            try:
+                for row in iter_reports(limit=limit, after=after, **filters):
+                    yield json.dumps(row) + "\n"
+            except Exception as e:
+                logger.error(f"Report stream aborted: {e}")
+
+        return Response(generate(), mimetype="application/x-ndjson")
+
     try:
-        rows = get_all_reports()
-        return jsonify(rows)
+        rows, next_after = get_reports_page(limit=min(limit or 100, MAX_REPORTS_PAGE), after=after, **filters)
     except Exception as e:
         logger.error(f"Error fetching reports: {str(e)}")
         return jsonify({"error": "Database fetch failed"}), 500
 
+    response = jsonify(rows)
+    if next_after is not None:
+        cursor = encode_page_cursor(next_after)
+        response.headers["X-Next-Cursor"] = cursor
+        args = request.args.to_dict(flat=False)
+        args["cursor"] = [cursor]
+        response.headers["Link"] = f'<{url_for("api_reports", **args)}>; rel="next"'
+    return response
+
+@app.route("/api/export")
+def api_export():
+    """Stream the typed metric history of ``hostname``(s) between ``since`` and ``until`` as CSV or Arrow"""
+    fmt = request.args.get("format", "csv")
+    columns = tuple(request.args.get("columns", ",".join(EXPORT_COLUMNS)).split(","))
+    unknown = [column for column in columns if column not in EXPORT_COLUMNS]
+    if unknown:
+        return jsonify({"error": f"Unknown columns: {', '.join(unknown)}"}), 400
+    try:
+        filters = report_filters()
+        filters.pop("thresholds")
+        chunks = encode_export(iter_metric_rows(columns, chunk_rows=10000, **filters), columns, fmt)
+    except (ValueError, OverflowError, OSError) as e:
+        return jsonify({"error": str(e)}), 400
+
+    def generate():
+        try:
+            yield from chunks
+        except Exception as e:
+            logger.error(f"Export aborted: {e}")
+
+    response = Response(generate(), mimetype=CONTENT_TYPES[fmt])
+    response.headers["Content-Disposition"] = f'attachment; filename="winperf-export.{fmt}"'
+    return response
+
+def warm_state_cache():
+    """Fill an empty state cache from clients_current (first worker start, or after a reboot)"""
+    if len(state_cache):
+        return
+    try:
+        rows = get_current_clients()
+    except Exception as e:
+        logger.error(f"Could not warm state cache: {e}")
+        return
+    state_cache.load(
+        {**row["raw_data"], "hostname": row["hostname"], "last_seen": row["last_seen"], "status": row["status"]}
+        for row in rows
+    )
+    logger.info(f"State cache warmed with {len(rows)} clients")
+
 @app.route("/api/clients")
 def api_clients():
-    """Get current client status from database (persistent)"""
+    """Latest state of every client, served from the state cache with ETag revalidation"""
     try:
-        rows = get_current_clients()
-        return jsonify({client["hostname"]: client for client in rows})
+        etag, body = state_cache.snapshot()
     except Exception as e:
-        logger.error(f"Failed to fetch current clients: {e}")
-        return jsonify({})
+        logger.error(f"State cache unavailable, reading clients from the database: {e}")
+        try:
+            rows = get_current_clients()
+            return jsonify({client["hostname"]: client for client in rows})
+        except Exception as e:
+            logger.error(f"Failed to fetch current clients: {e}")
+            return jsonify({})
+
+    if etag in request.if_none_match:
+        response = Response(status=304)
+    else:
+        response = Response(body, mimetype="application/json")
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    return response
 
+def stream_rate(value):
+    """Updates per second of a subscriber from ``max_rate``, at most STREAM_MAX_RATE"""
+    if value is None:
+        return STREAM_MAX_RATE
+    try:
+        rate = float(value)
+    except ValueError:
+        rate = math.nan
+    if not math.isfinite(rate) or rate <= 0:
+        raise ValueError("max_rate must be a positive number")
+    return min(rate, STREAM_MAX_RATE)
+
+@app.route("/api/stream")
+def api_stream():
+    """Server-sent events: the client map once, then the changed hosts as reports arrive"""
+    if not app.config["LIVE_STREAM"]:
+        # A sync worker would be held by the stream for as long as the dashboard stays open
+        return jsonify({"error": "Live updates need SERVER_MODE=asgi or gevent workers, poll /api/clients"}), 503
+    try:
+        max_rate = stream_rate(request.args.get("max_rate"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    subscriber = stream_hub.subscribe(max_rate)
+    if subscriber is None:
+        response = jsonify({"error": "Too many live subscribers, poll /api/clients instead"})
+        response.headers["Retry-After"] = "30"
+        return response, 503
+
+    response = Response(stream_hub.events(subscriber), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"  # keep reverse proxies from buffering events
+    return response
 
 @app.route("/api/client/<hostname>/history")
 def api_client_history(hostname):
+    hours = request.args.get("hours", 24, type=float)
+    resolution = request.args.get("resolution")
+    max_points = request.args.get("max_points", type=int)
+    if hours <= 0 or (max_points is not None and max_points <= 0):
+        return jsonify({"error": "hours and max_points must be positive"}), 400
+    if resolution not in (None, "auto", "raw", *RESOLUTIONS):
+        return jsonify({"error": f"Unknown resolution '{resolution}'"}), 400
+
+    # Without resolution/max_points every raw sample is returned, as before
+    if resolution == "auto" or (resolution is None and max_points is not None):
+        resolution = choose_resolution(hours, max_points or DEFAULT_MAX_POINTS)
+    resolution = resolution or "raw"
+
     try:
-        history = get_client_history(hostname)
-        return jsonify(history)
+        history = get_client_history(hostname, hours=hours, resolution=resolution)
+        response = jsonify(history)
+        response.headers["X-Resolution"] = resolution
+        return response
     except Exception as e:
         logger.error(f"Error fetching client history for {hostname}: {str(e)}")
         return jsonify({"error": "Failed to fetch client history"}), 500
 
+def fleet_window():
+    """``(since, hours)`` of a fleet query from ``hours`` (default 1)"""
+    hours = request.args.get("hours", 1, type=float)
+    if hours <= 0:
+        raise ValueError("hours must be positive")
+    return datetime.now().astimezone() - timedelta(hours=hours), hours
+
+@app.route("/api/fleet/percentiles")
+def api_fleet_percentiles():
+    """Fleet-wide avg/min/max and percentiles of one metric per time bucket"""
+    metric = request.args.get("metric", "cpu")
+    step = request.args.get("step")
+    hostnames = [name for value in request.args.getlist("hostname") for name in value.split(",") if name]
+    try:
+        since, hours = fleet_window()
+        quantiles = [float(q) for q in request.args.get("q", "0.5,0.95,0.99").split(",")]
+        if metric not in METRICS or any(not 0 <= q <= 1 for q in quantiles):
+            raise ValueError(f"metric must be one of {', '.join(METRICS)} and q within 0..1")
+        if step not in (None, *RESOLUTIONS):
+            raise ValueError(f"step must be one of {', '.join(RESOLUTIONS)}")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    resolution = step or choose_resolution(hours, request.args.get("max_points", DEFAULT_MAX_POINTS, type=int))
+    resolution = "1m" if resolution == "raw" else resolution
+    try:
+        rows = get_fleet_series(metric, since, resolution, hostnames=hostnames or None)
+    except Exception as e:
+        logger.error(f"Error computing fleet percentiles: {str(e)}")
+        return jsonify({"error": "Failed to compute fleet percentiles"}), 500
+
+    return jsonify({
+        "metric": metric,
+        "resolution": resolution,
+        "points": [summarize_fleet_bucket(row, metric, quantiles) for row in rows]
+    })
+
+@app.route("/api/fleet/top")
+def api_fleet_top():
+    """Top ``k`` hosts by the latest value of a metric, or by its avg/max over the last ``hours``"""
+    metric = request.args.get("metric", "cpu")
+    k = request.args.get("k", 10, type=int)
+    stat = request.args.get("stat", "avg")
+    try:
+        if not 0 < k <= 1000:
+            raise ValueError("k must be between 1 and 1000")
+        if "hours" in request.args:
+            since, hours = fleet_window()
+            hosts = get_top_hosts(metric, k, since=since, resolution=window_resolution(hours), stat=stat)
+        else:
+            hosts = get_top_hosts(metric, k)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error fetching top hosts: {str(e)}")
+        return jsonify({"error": "Failed to fetch top hosts"}), 500
+    return jsonify({"metric": metric, "stat": stat if "hours" in request.args else "latest", "hosts": hosts})
+
+@app.route("/api/fleet/histogram")
+def api_fleet_histogram():
+    """Distribution of every sample of a metric across the fleet over the last ``hours``"""
+    metric = request.args.get("metric", "cpu")
+    try:
+        since, hours = fleet_window()
+        if metric not in METRICS:
+            raise ValueError(f"metric must be one of {', '.join(METRICS)}")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    resolution = window_resolution(hours)
+    try:
+        rows = get_fleet_series(metric, since, resolution)
+    except Exception as e:
+        logger.error(f"Error computing fleet histogram: {str(e)}")
+        return jsonify({"error": "Failed to compute fleet histogram"}), 500
+
+    hist = merge_histograms(row[f"{metric}_hist"] for row in rows)
+    return jsonify({
+        "metric": metric,
+        "resolution": resolution,
+        "total": sum(hist or ()),
+        "bins": histogram_bins(hist, METRICS[metric])
+    })
+
 @app.route("/api/health")
 def api_health():
     return jsonify({
         "status": "healthy",
         "timestamp": datetime.now().isoformat(),
-        "active_clients": len(clients),
-        "uptime": time.time()
+        "active_clients": len(state_cache),
+        "uptime": round(time.time() - STARTED_AT, 1),
+        "db_pool": get_pool_stats(),
+        "ingest": ingest_queue.get_stats() if ingest_queue is not None else {"mode": "sync"},
+        "stream": stream_hub.get_stats(),
+        "recommender": recommender.get_stats() if recommender is not None else {"enabled": False}
     })
 
+@app.route("/metrics")
+def metrics_endpoint():
+    """Prometheus metrics of every worker on this host"""
+    return Response(metrics.exporter.collect(), content_type=metrics.CONTENT_TYPE)
+
+@app.route("/metrics/fleet")
+def fleet_metrics_endpoint():
+    """Latest CPU, memory, disk, network and process gauges of every host, from the state cache"""
+    return Response(fleet_exporter.render(), content_type=metrics.CONTENT_TYPE)
+
+def register_ingest_metrics(queue):
+    """Expose the ingest queue's own counters at scrape time"""
+    metrics.INGEST_QUEUE_DEPTH.set_function(lambda: {(): queue.depth()})
+    metrics.INGEST_WRITER.set_function(
+        lambda: {(outcome,): queue.stats[outcome] for outcome in ("accepted", "rejected", "written", "dropped")}
+    )
+
+def register_metrics():
+    """Expose the counters kept by the pool, the stream hub, the state cache and the recommender"""
+    def pool_connections():
+        stats = get_pool_stats()
+        return {("in_use",): stats["in_use"], ("idle",): stats["idle"]}
+
+    def pool_events():
+        stats = get_pool_stats()
+        return {(event,): stats[event] for event in ("checkouts", "waits", "exhausted", "reconnects", "discarded")}
+
+    metrics.DB_POOL_CONNECTIONS.set_function(pool_connections)
+    metrics.DB_POOL_EVENTS.set_function(pool_events)
+    metrics.STREAM_SUBSCRIBERS.set_function(lambda: {(): stream_hub.stats["subscribers"]})
+    metrics.STATE_CLIENTS.set_function(lambda: {(): len(state_cache)})
+    if ingest_queue is not None:
+        register_ingest_metrics(ingest_queue)
+    if recommender is not None:
+        metrics.RECOMMENDER_EVALUATIONS.set_function(lambda: {(): recommender.stats["evaluations"]})
+    metrics.exporter.start()
+
 @app.route("/updates/<path:filename>")
 def download_update(filename):
     updates_dir = os.path.join(os.getcwd(), "updates")
@@ -140,6 +565,11 @@ def redirect_to_dashboard(error):
 def internal_error(error):
     return jsonify({"error": "Internal server error"}), 500
 
+warm_state_cache()
+recommender = start_recommender(state_cache)  # None when RECOMMENDER_ENABLED=0
+register_metrics()
+
 if __name__ == "__main__":
     logger.info("Starting WinPerfAgent server...")
+    app.config["LIVE_STREAM"] = True  # the development server runs each request in its own thread
     app.run(host="0.0.0.0", port=5000, debug=True)
@@ -0,0 +1,105 @@
+"""Export throughput and memory: rows/s, output size and peak RSS per format.
+
+By default rows are synthetic, so only encoding is measured; ``--source db``
+reads them from the database configured in DATABASE_URL through the same
+server-side cursor as ``export.py``. Memory should stay flat as ``--rows``
+grows; only ``--chunk-rows`` should move it.
+
+    python benchmarks/bench_export.py --rows 10000000
+    python benchmarks/bench_export.py --source db --since 2024-05-01 --formats csv,parquet
+"""
+import os
+import sys
+import time
+import random
+import resource
+import argparse
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from export import CSV, ARROW, PARQUET, EXPORT_COLUMNS, encode, parse_time, supported_formats, write_parquet
+
+def synthetic_chunks(rows, hosts, chunk_rows, seed=1):
+    """Chunks of report rows shaped like ``db.iter_metric_rows``: per host, 10s apart"""
+    rng = random.Random(seed)
+    per_host = -(-rows // hosts)
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    chunk, produced = [], 0
+    for host in range(hosts):
+        hostname = f"host-{host:05d}"
+        cpu = rng.uniform(5, 60)
+        for index in range(per_host):
+            if produced == rows:
+                break
+            cpu = min(max(cpu + rng.gauss(0, 3), 0.0), 100.0)
+            chunk.append((
+                start + timedelta(seconds=10 * index), hostname,
+                round(cpu, 1), round(rng.uniform(30, 90), 1), round(rng.uniform(0, 20), 1),
+                round(rng.uniform(40, 95), 1), rng.uniform(0, 1e6), rng.uniform(0, 5e6), rng.randint(80, 300)
+            ))
+            produced += 1
+            if len(chunk) == chunk_rows:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+def peak_rss_mb():
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def run(fmt, chunks):
+    """Encode ``chunks`` as ``fmt``; returns (rows, bytes, seconds)"""
+    counted = {"rows": 0}
+
+    def counting(source):
+        for rows in source:
+            counted["rows"] += len(rows)
+            yield rows
+
+    started = time.perf_counter()
+    if fmt == PARQUET:
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "export.parquet")
+            write_parquet(counting(chunks), EXPORT_COLUMNS, path)
+            size = os.path.getsize(path)
+    else:
+        size = sum(len(data) for data in encode(counting(chunks), EXPORT_COLUMNS, fmt))
+    return counted["rows"], size, time.perf_counter() - started
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark metric history export")
+    parser.add_argument("--source", choices=("synthetic", "db"), default="synthetic")
+    parser.add_argument("--rows", type=int, default=10_000_000, help="synthetic rows (default: 10M)")
+    parser.add_argument("--hosts", type=int, default=3000, help="synthetic hosts (default: 3000)")
+    parser.add_argument("--since", type=parse_time, help="db source: start of the exported range")
+    parser.add_argument("--until", type=parse_time, help="db source: end of the exported range")
+    parser.add_argument("--chunk-rows", type=int, default=50000, help="rows per chunk (default: 50000)")
+    parser.add_argument("--formats", default=",".join((CSV, ARROW, PARQUET)),
+                        help="comma-separated formats (default: csv,arrow,parquet)")
+    args = parser.parse_args(argv)
+
+    formats = [fmt for fmt in args.formats.split(",") if fmt in supported_formats()]
+    skipped = set(args.formats.split(",")) - set(formats)
+    if skipped:
+        print(f"Not available (pyarrow missing?), skipped: {', '.join(sorted(skipped))}\n")
+
+    print(f"{'format':<8} {'rows':>11} {'MB':>9} {'seconds':>8} {'rows/s':>11} {'peak RSS MB':>12}")
+    for fmt in formats:
+        if args.source == "db":
+            from dotenv import load_dotenv
+            from db import iter_metric_rows
+            load_dotenv()
+            chunks = iter_metric_rows(EXPORT_COLUMNS, since=args.since, until=args.until,
+                                      chunk_rows=args.chunk_rows)
+        else:
+            chunks = synthetic_chunks(args.rows, args.hosts, args.chunk_rows)
+        rows, size, seconds = run(fmt, chunks)
+        # Peak RSS only grows, so formats later in the list show the maximum so far
+        print(f"{fmt:<8} {rows:>11} {size / 1e6:>9.1f} {seconds:>8.1f} {rows / seconds:>11.0f} {peak_rss_mb():>12.1f}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,97 @@
+"""Sync (gunicorn + Flask) versus ASGI (uvicorn + Starlette) under many agents.
+
+Each mode is started on a free port with the same worker count, then
+``--agents`` agents of the fleet simulator (``simulator.py``) report every
+``--interval`` seconds, staggered, for ``--duration`` seconds. Reported per
+mode: requests/s served, p50/p99 latency of /api/report and the error rate.
+The server needs DATABASE_URL and API_SECRET_TOKEN like a normal deployment.
+
+    python benchmarks/bench_server_modes.py --agents 5000 --duration 60
+    python benchmarks/bench_server_modes.py --modes asgi --url http://10.0.0.5:5000
+"""
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import subprocess
+
+import aiohttp
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from simulator import simulate
+
+MODE_COMMANDS = {
+    "sync": ["gunicorn", "-w", "{workers}", "-b", "127.0.0.1:{port}", "app:app"],
+    "asgi": ["gunicorn", "-w", "{workers}", "-k", "uvicorn.workers.UvicornWorker", "-b", "127.0.0.1:{port}",
+             "asgi_app:app"],
+}
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_server(mode, workers, port):
+    command = [part.format(workers=workers, port=port) for part in MODE_COMMANDS[mode]]
+    return subprocess.Popen(command, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+async def wait_healthy(url, timeout=60):
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() < deadline:
+            try:
+                async with session.get(f"{url}/api/health") as response:
+                    if response.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.5)
+    raise RuntimeError(f"{url} did not become healthy within {timeout}s")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the sync and ASGI servers under agent load")
+    parser.add_argument("--modes", default="sync,asgi", help="comma-separated modes (default: sync,asgi)")
+    parser.add_argument("--url", help="test an already running server instead of starting one per mode")
+    parser.add_argument("--agents", type=int, default=5000, help="simulated agents (default: 5000)")
+    parser.add_argument("--interval", type=float, default=10, help="seconds between reports per agent (default: 10)")
+    parser.add_argument("--duration", type=float, default=60, help="seconds of load per mode (default: 60)")
+    parser.add_argument("--workers", type=int, default=4, help="server worker processes (default: 4)")
+    parser.add_argument("--processes", type=int, default=1, help="simulator client processes (default: 1)")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args(argv)
+
+    token = os.getenv("API_SECRET_TOKEN", "")
+    results = {}
+    print(f"{'mode':<6} {'requests':>9} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for mode in args.modes.split(","):
+        server = None
+        url = args.url
+        if url is None:
+            port = free_port()
+            url = f"http://127.0.0.1:{port}"
+            server = start_server(mode, args.workers, port)
+        try:
+            asyncio.run(wait_healthy(url))
+            stats = simulate(f"{url}/api/report", token, args.agents, processes=args.processes,
+                             interval=args.interval, duration=args.duration)
+            result = stats["steady"].summary()
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait(timeout=30)
+        results[mode] = result
+        print(f"{mode:<6} {result['sent']:>9} {result['reports_per_s']:>8} {result['p50_ms']!s:>8} "
+              f"{result['p99_ms']!s:>8} {result['error_rate']:>7.2%}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"agents": args.agents, "interval": args.interval, "results": results}, f, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,95 @@
+"""Compare report wire formats: bytes on the wire and server-side decode CPU.
+
+Payloads are real ``monitor.get_system_metrics()`` samples from this machine
+plus a synthetic installed-programs list of agent-like size, sent both as a
+full protocol message and as a delta against the previous sample.
+
+    python benchmarks/bench_wire_formats.py --programs 400 --iterations 2000
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import monitor
+from protocol import (
+    JSON, MSGPACK, CBOR, GZIP, ZSTD, IDENTITY,
+    encode_body, decode_body, full_message, delta_message,
+    supported_content_types, supported_content_encodings
+)
+
+def synthetic_programs(count, seed=1):
+    """Installed-programs list shaped like ``SystemMonitor.get_installed_programs``"""
+    rng = random.Random(seed)
+    vendors = ["Microsoft", "Adobe", "Google", "Mozilla", "Oracle", "Intel", "NVIDIA", "JetBrains"]
+    products = ["Runtime", "Redistributable", "Driver", "Update", "Toolkit", "SDK", "Client", "Service"]
+    return [
+        {
+            "name": f"{rng.choice(vendors)} {rng.choice(products)} {index}",
+            "version": f"{rng.randint(1, 30)}.{rng.randint(0, 9)}.{rng.randint(0, 9999)}"
+        }
+        for index in range(count)
+    ]
+
+def sample_reports(programs):
+    """Two consecutive agent reports, ~1s apart"""
+    samples = []
+    for _ in range(2):
+        data = monitor.get_system_metrics()
+        data["agent_version"] = "1.0.1"
+        data["uptime"] = time.time()
+        data["installed_programs"] = programs
+        samples.append(data)
+    return samples
+
+def measure(document, content_type, content_encoding, iterations):
+    body = encode_body(document, content_type, content_encoding)
+    assert decode_body(body, content_type, content_encoding) == document
+
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        decode_body(body, content_type, content_encoding)
+        timings.append(time.perf_counter() - start)
+    return len(body), statistics.median(timings) * 1e6, statistics.quantiles(timings, n=100)[98] * 1e6
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark report wire formats")
+    parser.add_argument("--programs", type=int, default=400,
+                        help="synthetic installed programs per report (default: 400)")
+    parser.add_argument("--iterations", type=int, default=2000,
+                        help="decodes per format (default: 2000)")
+    args = parser.parse_args(argv)
+
+    previous, current = sample_reports(synthetic_programs(args.programs))
+    messages = {
+        "v1 report": current,
+        "v2 full": full_message(current, 2),
+        "v2 delta": delta_message(previous, current, 1),
+    }
+
+    types = [t for t in (JSON, MSGPACK, CBOR) if t in supported_content_types()]
+    encodings = [e for e in (IDENTITY, GZIP, ZSTD) if e in supported_content_encodings()]
+    skipped = {JSON, MSGPACK, CBOR, IDENTITY, GZIP, ZSTD} - set(types) - set(encodings)
+    if skipped:
+        print(f"Not installed, skipped: {', '.join(sorted(skipped))}\n")
+
+    print(f"{'message':<10} {'content type':<20} {'encoding':<9} {'bytes':>9} {'ratio':>6} "
+          f"{'decode p50 us':>14} {'decode p99 us':>14}")
+    for label, document in messages.items():
+        baseline = None
+        for content_type in types:
+            for content_encoding in encodings:
+                size, p50, p99 = measure(document, content_type, content_encoding, args.iterations)
+                baseline = baseline or size
+                print(f"{label:<10} {content_type:<20} {content_encoding:<9} {size:>9} "
+                      f"{size / baseline:>6.2f} {p50:>14.1f} {p99:>14.1f}")
+        print()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,121 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+# Sections kept in the content-addressed `report_blobs` table
+INSTALLED_PROGRAMS = "installed_programs"
+DISK_LAYOUT = "disk_layout"
+
+# Per-volume keys that describe the layout rather than the current usage
+DISK_LAYOUT_KEYS = ("mountpoint", "fstype", "total")
+
+# Sections already stored in their own `reports` columns; raw_data keeps the rest
+SPLIT_SECTIONS = ("cpu", "memory", "disk", "network", "top_processes", "recommendations", "installed_programs")
+
+BLOB_REFS_KEY = "_blobs"
+
+# A known blob is re-upserted (refreshing last_used) after this many seconds
+BLOB_TOUCH_INTERVAL = float(os.getenv("BLOB_TOUCH_INTERVAL", "21600"))
+BLOB_CACHE_SIZE = int(os.getenv("BLOB_CACHE_SIZE", "10000"))
+
+def content_hash(body):
+    """SHA-256 of the canonical JSON encoding of ``body``"""
+    canonical = json.dumps(body, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+def split_report(data):
+    """Separate the large, slowly changing sub-documents of a report.
+
+    Returns ``(stored, blobs)`` where ``stored`` is the report with those
+    sections replaced by hash references under ``_blobs`` and ``blobs`` maps
+    each hash to ``(kind, body)``. ``join_report`` reverses the split.
+    """
+    stored = dict(data)
+    refs = {}
+    blobs = {}
+
+    programs = stored.pop(INSTALLED_PROGRAMS, None)
+    if programs is not None:
+        digest = content_hash(programs)
+        refs[INSTALLED_PROGRAMS] = digest
+        blobs[digest] = (INSTALLED_PROGRAMS, programs)
+
+    disk = stored.get("disk")
+    if isinstance(disk, dict) and disk:
+        layout, usage = {}, {}
+        for device, volume in disk.items():
+            if not isinstance(volume, dict):
+                usage[device] = volume
+                continue
+            layout[device] = {key: volume[key] for key in DISK_LAYOUT_KEYS if key in volume}
+            usage[device] = {key: value for key, value in volume.items() if key not in DISK_LAYOUT_KEYS}
+        digest = content_hash(layout)
+        refs[DISK_LAYOUT] = digest
+        blobs[digest] = (DISK_LAYOUT, layout)
+        stored["disk"] = usage
+
+    if refs:
+        stored[BLOB_REFS_KEY] = refs
+    return stored, blobs
+
+def blob_refs(stored):
+    refs = stored.get(BLOB_REFS_KEY) if isinstance(stored, dict) else None
+    return refs if isinstance(refs, dict) else {}
+
+def join_report(stored, bodies):
+    """Rebuild the original report from ``stored`` and a ``{hash: body}`` mapping"""
+    refs = blob_refs(stored)
+    if not refs:
+        return stored
+
+    data = dict(stored)
+    data.pop(BLOB_REFS_KEY, None)
+
+    digest = refs.get(INSTALLED_PROGRAMS)
+    if digest is not None:
+        data[INSTALLED_PROGRAMS] = bodies.get(digest, [])
+
+    layout = bodies.get(refs.get(DISK_LAYOUT)) or {}
+    if isinstance(data.get("disk"), dict) and layout:
+        disk = {}
+        for device, usage in data["disk"].items():
+            if isinstance(usage, dict):
+                disk[device] = {**layout.get(device, {}), **usage}
+            else:
+                disk[device] = usage
+        data["disk"] = disk
+    return data
+
+class BlobCache:
+    """Bounded LRU of blob hashes this process has already written.
+
+    Hashes are only added after the transaction that stored them committed,
+    so a rolled-back write can never leave a report pointing at a missing blob.
+    """
+
+    def __init__(self, size=BLOB_CACHE_SIZE, touch_interval=BLOB_TOUCH_INTERVAL):
+        self.size = size
+        self.touch_interval = touch_interval
+        self._lock = threading.Lock()
+        self._seen = OrderedDict()  # hash -> monotonic time of the last write
+
+    def missing(self, blobs):
+        """Subset of ``blobs`` that must be (re)written"""
+        now = time.monotonic()
+        with self._lock:
+            return {
+                digest: blob for digest, blob in blobs.items()
+                if now - self._seen.get(digest, -self.touch_interval) >= self.touch_interval
+            }
+
+    def confirm(self, hashes):
+        now = time.monotonic()
+        with self._lock:
+            for digest in hashes:
+                self._seen[digest] = now
+                self._seen.move_to_end(digest)
+            while len(self._seen) > self.size:
+                self._seen.popitem(last=False)
@@ -0,0 +1,64 @@
+"""Backfill or replay agent reports from NDJSON files.
+
+Each input line is one payload as produced by ``SystemMonitor.get_metrics``.
+
+    python bulkload.py reports-2024-05-01.ndjson reports-2024-05-02.ndjson
+    zcat export.ndjson.gz | python bulkload.py -
+"""
+import sys
+import json
+import logging
+import argparse
+from dotenv import load_dotenv
+
+from db import bulk_load_reports
+
+logger = logging.getLogger(__name__)
+
+def iter_ndjson(paths):
+    """Yield payloads from NDJSON files one line at a time, skipping bad lines"""
+    for path in paths:
+        stream = sys.stdin if path == "-" else open(path, "r", encoding="utf-8")
+        try:
+            for line_no, line in enumerate(stream, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    data = json.loads(line)
+                except json.JSONDecodeError as e:
+                    logger.warning(f"{path}:{line_no}: invalid JSON ({e})")
+                    continue
+                if not isinstance(data, dict) or "hostname" not in data:
+                    logger.warning(f"{path}:{line_no}: hostname missing, skipped")
+                    continue
+                yield data
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk-load NDJSON agent reports with COPY")
+    parser.add_argument("paths", nargs="+", help="NDJSON files, or - for stdin")
+    parser.add_argument("--chunk-rows", type=int, default=50000,
+                        help="rows per COPY/commit (default: 50000)")
+    parser.add_argument("--progress-every", type=int, default=10000,
+                        help="log progress every N rows (default: 10000)")
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    stats = bulk_load_reports(
+        iter_ndjson(args.paths),
+        chunk_rows=args.chunk_rows,
+        progress_every=args.progress_every
+    )
+    logger.info(
+        f"Loaded {stats['rows']} reports in {stats['seconds']:.1f}s "
+        f"({stats['rows_per_second']:.0f} rows/s), {stats['clients']} clients updated"
+    )
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,292 @@
+"""Metric collection engine shared by the tray agent and ``monitor.py``.
+
+``MetricsCollector.collect()`` never sleeps: CPU usage is computed from the
+``cpu_times`` delta since the previous tick, cheap probes run inline and the
+expensive ones (disk usage, per-interface counters, process scans) run
+concurrently in a small thread pool. ``FixedRateScheduler`` paces the caller
+on wall-clock interval boundaries, so collection and send time no longer
+stretch the reporting period.
+"""
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import psutil
+
+logger = logging.getLogger(__name__)
+
+class ProbeTiming:
+    """Running duration statistics of one probe, in milliseconds"""
+
+    __slots__ = ("count", "errors", "timeouts", "last_ms", "max_ms", "total_ms")
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.last_ms = 0.0
+        self.max_ms = 0.0
+        self.total_ms = 0.0
+
+    def record(self, seconds, failed=False):
+        ms = seconds * 1000.0
+        self.count += 1
+        self.errors += 1 if failed else 0
+        self.last_ms = ms
+        self.max_ms = max(self.max_ms, ms)
+        self.total_ms += ms
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "last_ms": round(self.last_ms, 2),
+            "avg_ms": round(self.total_ms / self.count, 2) if self.count else 0.0,
+            "max_ms": round(self.max_ms, 2),
+        }
+
+class Probe:
+    """A registered probe and its refresh policy"""
+
+    __slots__ = ("name", "func", "concurrent", "default", "every", "ttl", "changed", "background")
+
+    def __init__(self, name, func, concurrent, default, every, ttl, changed, background):
+        self.name = name
+        self.func = func
+        self.concurrent = concurrent or background
+        self.default = default
+        self.every = every
+        self.ttl = ttl
+        self.changed = changed
+        self.background = background
+
+class MetricsCollector:
+    """Collect one sample per tick from registered probes.
+
+    A probe is a no-argument callable returning one section of the report.
+    ``concurrent`` probes run in the thread pool; one that is still running
+    when ``probe_timeout`` expires keeps its previous value for this tick
+    and is not resubmitted until it finishes. ``background`` probes are never
+    waited for: their result is picked up on the first tick after they finish.
+
+    Probes are refreshed in tiers: every ``every`` ticks, and/or once their
+    value is ``ttl`` seconds old or ``changed()`` returns True. In between,
+    the cached value is reused and ``get_freshness()`` tells how old it is.
+    """
+
+    def __init__(self, max_workers=4, probe_timeout=5.0):
+        self.probe_timeout = probe_timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="probe")
+        self._lock = threading.Lock()
+        self._probes = {}        # name -> Probe
+        self._timings = {}       # name -> ProbeTiming
+        self._values = {}        # name -> last successful value
+        self._collected_at = {}  # name -> epoch of that value
+        self._last_tick = {}     # name -> tick it was last started on
+        self._running = {}       # name -> future still running from an earlier tick
+        self._tick = 0
+        self._cpu_count = psutil.cpu_count()
+        self._cpu_times = psutil.cpu_times()  # baseline for the first tick
+
+        self.register("cpu", self._probe_cpu, concurrent=False, default={})
+        self.register("memory", self._probe_memory, concurrent=False, default={})
+        self.register("swap", self._probe_swap, concurrent=False, default={})
+        self.register("network_totals", self._probe_network_totals, concurrent=False, default={})
+        self.register("process_count", lambda: len(psutil.pids()), concurrent=False, default=0)
+
+    def register(self, name, func, concurrent=True, default=None, every=1, ttl=None, changed=None,
+                 background=False):
+        """Add a probe; ``every=None`` refreshes only on ``ttl`` expiry or ``changed()``"""
+        with self._lock:
+            self._probes[name] = Probe(name, func, concurrent, default, every, ttl, changed, background)
+            self._timings.setdefault(name, ProbeTiming())
+
+    def _probe_cpu(self):
+        times = psutil.cpu_times()
+        previous, self._cpu_times = self._cpu_times, times
+
+        def idle(t):
+            return t.idle + getattr(t, "iowait", 0.0)
+
+        total = sum(times) - sum(previous)
+        busy = total - (idle(times) - idle(previous))
+        percent = round(min(max(busy / total * 100.0, 0.0), 100.0), 1) if total > 0 else 0.0
+
+        cpu_freq = psutil.cpu_freq()
+        return {
+            "percent": percent,
+            "count": self._cpu_count,
+            "frequency": cpu_freq._asdict() if cpu_freq else None
+        }
+
+    def _probe_memory(self):
+        memory = psutil.virtual_memory()
+        return {
+            "percent": memory.percent,
+            "total": memory.total,
+            "available": memory.available,
+            "used": memory.used,
+            "free": memory.free
+        }
+
+    def _probe_swap(self):
+        swap = psutil.swap_memory()
+        return {
+            "percent": swap.percent,
+            "total": swap.total,
+            "used": swap.used,
+            "free": swap.free
+        }
+
+    def _probe_network_totals(self):
+        net_io = psutil.net_io_counters()
+        return {"total_sent": net_io.bytes_sent, "total_recv": net_io.bytes_recv}
+
+    def _timed(self, name, func):
+        started = time.perf_counter()
+        try:
+            value = func()
+        except Exception as e:
+            self._timings[name].record(time.perf_counter() - started, failed=True)
+            logger.error(f"Probe {name} failed: {e}")
+            raise
+        self._timings[name].record(time.perf_counter() - started)
+        return value
+
+    def _store(self, name, value):
+        self._values[name] = value
+        self._collected_at[name] = time.time()
+
+    def _due(self, probe, now):
+        if probe.name not in self._last_tick:
+            return True
+        if probe.every and self._tick - self._last_tick[probe.name] >= probe.every:
+            return True
+        collected_at = self._collected_at.get(probe.name)
+        if probe.ttl is not None and (collected_at is None or now - collected_at >= probe.ttl):
+            return True
+        if probe.changed is not None:
+            try:
+                return bool(probe.changed())
+            except Exception as e:
+                logger.error(f"Change check of probe {probe.name} failed: {e}")
+        return False
+
+    def collect(self, names=None):
+        """Run the due probes (of all, or only ``names``) and return ``{name: value}``"""
+        with self._lock:
+            probes = [
+                probe for name, probe in self._probes.items()
+                if names is None or name in names
+            ]
+        self._tick += 1
+        now = time.time()
+
+        # Harvest probes that finished after an earlier tick stopped waiting for them
+        for name, future in list(self._running.items()):
+            if future.done():
+                del self._running[name]
+                if future.exception() is None:
+                    self._store(name, future.result())
+
+        futures = {}
+        for probe in probes:
+            if not probe.concurrent or probe.name in self._running or not self._due(probe, now):
+                continue
+            self._last_tick[probe.name] = self._tick
+            future = self._executor.submit(self._timed, probe.name, probe.func)
+            self._running[probe.name] = future
+            if not probe.background:
+                futures[probe.name] = future
+
+        for probe in probes:
+            if probe.concurrent or not self._due(probe, now):
+                continue
+            self._last_tick[probe.name] = self._tick
+            try:
+                self._store(probe.name, self._timed(probe.name, probe.func))
+            except Exception:
+                pass
+
+        if futures:
+            wait(futures.values(), timeout=self.probe_timeout)
+        for name, future in futures.items():
+            if not future.done():
+                self._timings[name].timeouts += 1
+                logger.warning(f"Probe {name} still running after {self.probe_timeout}s, reusing last value")
+                continue
+            del self._running[name]
+            if future.exception() is None:
+                self._store(name, future.result())
+
+        return {probe.name: self._values.get(probe.name, probe.default) for probe in probes}
+
+    def get_freshness(self, names=None):
+        """Epoch at which each section's current value was collected (None: never)"""
+        return {
+            name: self._collected_at.get(name)
+            for name in self._probes
+            if names is None or name in names
+        }
+
+    def get_timings(self):
+        """Per-probe duration statistics"""
+        with self._lock:
+            return {name: timing.as_dict() for name, timing in self._timings.items()}
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+class FixedRateScheduler:
+    """Tick on wall-clock multiples of ``interval`` regardless of how long each tick's work took.
+
+    Deadlines advance by exactly ``interval``; when the caller falls more than
+    a whole interval behind, the missed ticks are skipped (and counted)
+    instead of firing back to back.
+    """
+
+    def __init__(self, interval, clock=time.time):
+        self.interval = float(interval)
+        self.clock = clock
+        self.ticks = 0
+        self.skipped = 0
+        self.last_lag = 0.0
+        now = clock()
+        self.next_tick = now - now % self.interval + self.interval
+
+    def wait(self, stop_event=None):
+        """Sleep until the next tick; returns False if ``stop_event`` was set meanwhile"""
+        delay = self.next_tick - self.clock()
+        if delay > 0:
+            if stop_event is not None:
+                if stop_event.wait(delay):
+                    return False
+            else:
+                time.sleep(delay)
+
+        now = self.clock()
+        self.last_lag = max(now - self.next_tick, 0.0)
+        missed = int(self.last_lag // self.interval)
+        if missed:
+            self.skipped += missed
+            logger.warning(f"Collection fell behind, skipped {missed} tick(s)")
+        self.next_tick += self.interval * (missed + 1)
+        self.ticks += 1
+        return True
+
+    def set_interval(self, interval):
+        interval = float(interval)
+        if interval != self.interval:
+            self.interval = interval
+            now = self.clock()
+            self.next_tick = now - now % interval + interval
+
+    def get_stats(self):
+        return {
+            "interval": self.interval,
+            "ticks": self.ticks,
+            "skipped": self.skipped,
+            "last_lag_ms": round(self.last_lag * 1000.0, 2),
+        }
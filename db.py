@@ -1,14 +1,30 @@
 import psycopg2
+import psycopg2.extensions
 import psycopg2.extras
+import psycopg2.pool
 import os
 import json
+import time
 import logging
+import threading
+import itertools
 from urllib.parse import urlparse
 from contextlib import contextmanager
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+
+import partitions
+import rollups
+import blobs
+from metrics import timed
 
 logger = logging.getLogger(__name__)
 
+# Connection pool configuration
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "5"))
+DB_POOL_HEALTHCHECK_IDLE = float(os.getenv("DB_POOL_HEALTHCHECK_IDLE", "30"))
+
 def get_connection():
     """Get database connection with proper error handling"""
     try:
@@ -27,33 +43,208 @@ def get_connection():
         logger.error(f"Database connection failed: {e}")
         raise
 
+class PoolExhaustedError(psycopg2.pool.PoolError):
+    """Raised when no connection becomes free within DB_POOL_TIMEOUT"""
+
+class ConnectionPool:
+    """Thread-safe pool of psycopg2 connections owned by a single process.
+
+    Checkout is bounded by a semaphore of ``maxconn`` slots, so callers wait
+    (up to ``timeout`` seconds) instead of failing as soon as the pool is busy.
+    Idle connections are validated on checkout and transparently replaced when
+    the server closed them.
+    """
+
+    def __init__(self, minconn=DB_POOL_MIN, maxconn=DB_POOL_MAX, timeout=DB_POOL_TIMEOUT,
+                 healthcheck_idle=DB_POOL_HEALTHCHECK_IDLE):
+        self.minconn = max(0, min(minconn, maxconn))
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.healthcheck_idle = healthcheck_idle
+        self.pid = os.getpid()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._idle = []  # (connection, returned_at)
+        self._size = 0
+        self.stats = {
+            "checkouts": 0,
+            "waits": 0,
+            "exhausted": 0,
+            "connects": 0,
+            "reconnects": 0,
+            "discarded": 0,
+        }
+
+        for _ in range(self.minconn):
+            try:
+                conn = self._connect()
+            except psycopg2.Error:
+                break
+            self._idle.append((conn, time.monotonic()))
+
+    def _connect(self):
+        conn = get_connection()
+        with self._lock:
+            self._size += 1
+            self.stats["connects"] += 1
+        return conn
+
+    def _close(self, conn):
+        with self._lock:
+            self._size -= 1
+            self.stats["discarded"] += 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _is_healthy(self, conn, returned_at):
+        if conn.closed:
+            return False
+        if time.monotonic() - returned_at < self.healthcheck_idle:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self):
+        """Check out a healthy connection, waiting for a free slot if needed"""
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.stats["waits"] += 1
+            if not self._slots.acquire(timeout=self.timeout):
+                with self._lock:
+                    self.stats["exhausted"] += 1
+                raise PoolExhaustedError(
+                    f"No database connection available within {self.timeout}s (max {self.maxconn})"
+                )
+
+        try:
+            while True:
+                with self._lock:
+                    item = self._idle.pop() if self._idle else None
+                if item is None:
+                    conn = self._connect()
+                    break
+                conn, returned_at = item
+                if self._is_healthy(conn, returned_at):
+                    break
+                logger.warning("Dropping broken pooled database connection")
+                with self._lock:
+                    self.stats["reconnects"] += 1
+                self._close(conn)
+        except Exception:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self.stats["checkouts"] += 1
+        return conn
+
+    def putconn(self, conn, discard=False):
+        """Return a connection to the pool, closing it if it is no longer usable"""
+        try:
+            if (
+                discard
+                or conn.closed
+                or conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE
+            ):
+                self._close(conn)
+            else:
+                with self._lock:
+                    self._idle.append((conn, time.monotonic()))
+        finally:
+            self._slots.release()
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats.update({
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._size - len(self._idle),
+                "min": self.minconn,
+                "max": self.maxconn,
+            })
+        return stats
+
+_pool = None
+_pool_lock = threading.Lock()
+# Pools inherited through fork() are kept referenced so their sockets are never
+# closed from the child, which would terminate the parent's sessions.
+_inherited_pools = []
+
+def get_pool():
+    """Return the connection pool for the current process, creating it after fork"""
+    global _pool
+    pool = _pool
+    if pool is not None and pool.pid == os.getpid():
+        return pool
+    with _pool_lock:
+        if _pool is None or _pool.pid != os.getpid():
+            if _pool is not None:
+                _inherited_pools.append(_pool)
+            _pool = ConnectionPool()
+        return _pool
+
+def get_pool_stats():
+    """Get checkout/wait/exhaustion counters of this process' pool"""
+    return get_pool().get_stats()
+
 @contextmanager
-def get_db_cursor():
-    """Context manager for database operations"""
+def get_db_cursor(name=None, itersize=2000, cursor_factory=None):
+    """Context manager for database operations
+
+    With ``name``, a server-side (named) cursor is used: rows are fetched
+    ``itersize`` at a time while iterating, so large results never sit in
+    memory at once. ``cursor_factory`` overrides the connection's dict rows,
+    e.g. ``psycopg2.extensions.cursor`` for plain tuples.
+    """
+    pool = get_pool()
     conn = None
     cur = None
+    discard = False
     try:
-        conn = get_connection()
-        cur = conn.cursor()
+        conn = pool.getconn()
+        kwargs = {"cursor_factory": cursor_factory} if cursor_factory else {}
+        cur = conn.cursor(name=name, **kwargs) if name else conn.cursor(**kwargs)
+        if name:
+            cur.itersize = itersize
         yield cur
         conn.commit()
     except Exception as e:
         if conn:
-            conn.rollback()
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                discard = True
+        if isinstance(e, (psycopg2.OperationalError, psycopg2.InterfaceError)):
+            discard = True
         logger.error(f"Database operation failed: {e}")
         raise
     finally:
         if cur:
-            cur.close()
+            try:
+                cur.close()
+            except psycopg2.Error:
+                discard = True
+        if conn and not discard and not conn.closed \
+                and conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            # Left mid-transaction without an exception, e.g. a streaming consumer stopped early
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                discard = True
         if conn:
-            conn.close()
+            pool.putconn(conn, discard=discard)
 
-def init_database():
-    """Initialize database tables"""
-    create_tables_sql = """
-    -- Main reports table
+REPORTS_TABLE_SQL = """
     CREATE TABLE IF NOT EXISTS reports (
-        id SERIAL PRIMARY KEY,
+        id BIGSERIAL,
         hostname VARCHAR(255) NOT NULL,
         ip_address INET,
         os_info TEXT,
@@ -65,15 +256,101 @@ def init_database():
         process_count INTEGER,
         top_processes JSONB,
         recommendations JSONB,
-        timestamp TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
-        raw_data JSONB
+        timestamp TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+        raw_data JSONB,
+        installed_programs JSONB,
+        cpu_percent REAL,
+        memory_percent REAL,
+        swap_percent REAL,
+        disk_percent REAL,
+        net_sent_rate DOUBLE PRECISION,
+        net_recv_rate DOUBLE PRECISION,
+        PRIMARY KEY (id, timestamp)
+    ) PARTITION BY RANGE (timestamp);
+"""
+
+# Brings tables created by older versions up to the typed-metrics schema
+TYPED_METRICS_SQL = """
+    ALTER TABLE reports ADD COLUMN IF NOT EXISTS installed_programs JSONB;
+    ALTER TABLE reports ADD COLUMN IF NOT EXISTS cpu_percent REAL;
+    ALTER TABLE reports ADD COLUMN IF NOT EXISTS memory_percent REAL;
+    ALTER TABLE reports ADD COLUMN IF NOT EXISTS swap_percent REAL;
+    ALTER TABLE reports ADD COLUMN IF NOT EXISTS disk_percent REAL;
+    ALTER TABLE reports ADD COLUMN IF NOT EXISTS net_sent_rate DOUBLE PRECISION;
+    ALTER TABLE reports ADD COLUMN IF NOT EXISTS net_recv_rate DOUBLE PRECISION;
+
+    -- Covering indexes: history and report listings are answered by index-only scans
+    CREATE INDEX IF NOT EXISTS idx_reports_hostname_timestamp_metrics ON reports(hostname, timestamp)
+        INCLUDE (cpu_percent, memory_percent, swap_percent, disk_percent,
+                 net_sent_rate, net_recv_rate, process_count);
+    -- id orders reports sharing a timestamp, so listings can page on (timestamp, id)
+    CREATE INDEX IF NOT EXISTS idx_reports_timestamp_id_metrics ON reports(timestamp, id)
+        INCLUDE (hostname, ip_address, os_info, cpu_percent, memory_percent, disk_percent, process_count);
+    -- Prefixes of the covering indexes: each only added an index write to every insert
+    DROP INDEX IF EXISTS idx_reports_hostname;
+    DROP INDEX IF EXISTS idx_reports_timestamp;
+    DROP INDEX IF EXISTS idx_reports_hostname_timestamp;
+
+    ALTER TABLE clients_current ADD COLUMN IF NOT EXISTS last_swap_percent REAL;
+    ALTER TABLE clients_current ADD COLUMN IF NOT EXISTS last_net_sent_rate DOUBLE PRECISION;
+    ALTER TABLE clients_current ADD COLUMN IF NOT EXISTS last_net_recv_rate DOUBLE PRECISION;
+"""
+
+# Content-addressed store for large, slowly changing report sections
+BLOBS_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS report_blobs (
+        hash CHAR(64) PRIMARY KEY,
+        kind VARCHAR(50) NOT NULL,
+        body JSONB NOT NULL,
+        created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+        last_used TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()
     );
+    CREATE INDEX IF NOT EXISTS idx_report_blobs_last_used ON report_blobs(last_used);
+"""
 
-    -- Index for faster queries
-    CREATE INDEX IF NOT EXISTS idx_reports_hostname ON reports(hostname);
-    CREATE INDEX IF NOT EXISTS idx_reports_timestamp ON reports(timestamp);
-    CREATE INDEX IF NOT EXISTS idx_reports_hostname_timestamp ON reports(hostname, timestamp);
+def _rollup_table_sql(resolution):
+    """DDL for one downsampled table: per host and bucket, min/max/sum/count/histogram per metric"""
+    metric_columns = "".join(
+        f"""
+        {metric}_min REAL,
+        {metric}_max REAL,
+        {metric}_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+        {metric}_count INTEGER NOT NULL DEFAULT 0,
+        {metric}_hist INTEGER[],"""
+        for metric in rollups.METRICS
+    )
+    return f"""
+    CREATE TABLE IF NOT EXISTS reports_rollup_{resolution} (
+        hostname VARCHAR(255) NOT NULL,
+        bucket TIMESTAMP WITH TIME ZONE NOT NULL,
+        samples INTEGER NOT NULL DEFAULT 0,{metric_columns}
+        PRIMARY KEY (hostname, bucket)
+    );
+    CREATE INDEX IF NOT EXISTS idx_reports_rollup_{resolution}_bucket ON reports_rollup_{resolution}(bucket);
+    """
 
+def _fleet_rollup_table_sql(resolution):
+    """DDL for one fleet-wide table: the per-host rollups of each closed bucket merged across hosts"""
+    metric_columns = "".join(
+        f"""
+        {metric}_min REAL,
+        {metric}_max REAL,
+        {metric}_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+        {metric}_count BIGINT NOT NULL DEFAULT 0,
+        {metric}_hist INTEGER[],"""
+        for metric in rollups.METRICS
+    )
+    return f"""
+    CREATE TABLE IF NOT EXISTS fleet_rollup_{resolution} (
+        bucket TIMESTAMP WITH TIME ZONE PRIMARY KEY,
+        hosts INTEGER NOT NULL DEFAULT 0,
+        samples BIGINT NOT NULL DEFAULT 0,{metric_columns[:-1]}
+    );
+    """
+
+def init_database():
+    """Initialize database tables"""
+    create_tables_sql = REPORTS_TABLE_SQL + """
     -- Clients summary table for current status
     CREATE TABLE IF NOT EXISTS clients_current (
         hostname VARCHAR(255) PRIMARY KEY,
@@ -88,142 +365,673 @@ def init_database():
         status VARCHAR(20) DEFAULT 'offline',
         raw_data JSONB
     );
-    """
+
+    -- Last network counters, used to derive byte rates for the rollups
+    ALTER TABLE clients_current ADD COLUMN IF NOT EXISTS last_net_sent BIGINT;
+    ALTER TABLE clients_current ADD COLUMN IF NOT EXISTS last_net_recv BIGINT;
+
+    -- Element-wise sum of two histogram arrays
+    CREATE OR REPLACE FUNCTION winperf_hist_add(a INTEGER[], b INTEGER[]) RETURNS INTEGER[]
+    LANGUAGE sql IMMUTABLE AS $$
+        SELECT CASE
+            WHEN a IS NULL THEN b
+            WHEN b IS NULL THEN a
+            ELSE ARRAY(SELECT COALESCE(x, 0) + COALESCE(y, 0) FROM unnest(a, b) AS t(x, y))
+        END
+    $$;
+
+    -- Histogram merge across rows
+    CREATE OR REPLACE AGGREGATE winperf_hist_sum(INTEGER[]) (SFUNC = winperf_hist_add, STYPE = INTEGER[]);
+    """ + TYPED_METRICS_SQL + BLOBS_TABLE_SQL + "".join(
+        _rollup_table_sql(name) + _fleet_rollup_table_sql(name) for name in rollups.RESOLUTIONS
+    )
     
     try:
         with get_db_cursor() as cur:
             cur.execute(create_tables_sql)
+            if partitions.is_partitioned(cur):
+                partitions.ensure_partitions(cur)
+            else:
+                logger.warning(
+                    "reports is not partitioned; run 'python db.py migrate-partitions' to convert it"
+                )
             logger.info("Database tables initialized successfully")
     except Exception as e:
         logger.error(f"Failed to initialize database: {e}")
         raise
 
-def insert_report(data):
-    """Insert a new system report"""
+def migrate_reports_to_partitioned(batch_rows=100000, drop_legacy=False):
+    """Convert an unpartitioned `reports` table into the partitioned layout.
+
+    The legacy table is renamed to `reports_legacy` (new reports go straight
+    to the partitioned table from then on) and its rows are copied over in
+    id-ordered batches, each in its own transaction.
+    """
     try:
         with get_db_cursor() as cur:
-            # Extract data with proper error handling
-            hostname = data.get("hostname")
-            ip_address = data.get("ip")
-            os_info = data.get("os")
-            architecture = data.get("architecture")
-            
-            
-            # Handle CPU data
-            cpu_data = data.get("cpu", {})
-            cpu_percent = cpu_data.get("percent", 0) if isinstance(cpu_data, dict) else cpu_data
-            
-            # Handle memory data
-            memory_data = data.get("memory", {})
-            memory_percent = memory_data.get("percent", 0) if isinstance(memory_data, dict) else data.get("ram", 0)
-            
-            # Handle disk data
-            disk_data = data.get("disk", {})
-            disk_percent = 0
-            if isinstance(disk_data, dict) and disk_data:
-                # Get the first disk's usage percentage
-                first_disk = list(disk_data.values())[0]
-                disk_percent = first_disk.get("percent", 0) if isinstance(first_disk, dict) else 0
-            
-            # Insert into reports table
+            if partitions.is_partitioned(cur):
+                logger.info("reports is already partitioned")
+                return 0
+            cur.execute("SELECT to_regclass('reports_legacy') IS NOT NULL AS exists")
+            if cur.fetchone()["exists"]:
+                raise RuntimeError("reports_legacy already exists; finish or drop the previous migration")
+
             cur.execute("""
-                INSERT INTO reports (
-                    hostname, ip_address, os_info, architecture,
-                    cpu_data, memory_data, disk_data, network_data,
-                    process_count, top_processes, recommendations, installed_programs, 
-                    last_cpu_percent, last_memory_percent, last_disk_percent, 
-                    raw_data
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """, (
-                hostname, ip_address, os_info, architecture,
-                json.dumps(cpu_data), json.dumps(memory_data), json.dumps(disk_data),  
-                json.dumps(data.get("network", {})),
-                data.get("process_count"), 
-                json.dumps(data.get("top_processes", [])),
-                json.dumps(data.get("recommendations", [])), 
-                json.dumps(data.get("installed_programs", [])), 
-                cpu_percent, memory_percent, disk_percent,
-                json.dumps(data)
-            ))
-            
-            # Update current status table
+                ALTER TABLE reports RENAME TO reports_legacy;
+                ALTER TABLE reports_legacy RENAME CONSTRAINT reports_pkey TO reports_legacy_pkey;
+                ALTER SEQUENCE IF EXISTS reports_id_seq RENAME TO reports_legacy_id_seq;
+                ALTER INDEX IF EXISTS idx_reports_hostname RENAME TO idx_reports_legacy_hostname;
+                ALTER INDEX IF EXISTS idx_reports_timestamp RENAME TO idx_reports_legacy_timestamp;
+                ALTER INDEX IF EXISTS idx_reports_hostname_timestamp RENAME TO idx_reports_legacy_hostname_timestamp;
+            """)
+            cur.execute(REPORTS_TABLE_SQL)
+            cur.execute("SELECT MIN(timestamp) AS oldest, MAX(id) AS max_id FROM reports_legacy")
+            bounds = cur.fetchone()
+            if bounds["max_id"]:
+                cur.execute("SELECT setval('reports_id_seq', %s)", (bounds["max_id"],))
+            partitions.ensure_partitions(cur, since=bounds["oldest"])
+
             cur.execute("""
-                INSERT INTO clients_current (
-                    hostname, ip_address, os_info, architecture,
-                    last_cpu_percent, last_memory_percent, last_disk_percent,
-                    process_count, last_seen, status, raw_data
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, NOW(), 'online', %s)
-                ON CONFLICT (hostname) DO UPDATE SET
-                    ip_address = EXCLUDED.ip_address,
-                    os_info = EXCLUDED.os_info,
-                    architecture = EXCLUDED.architecture,
-                    last_cpu_percent = EXCLUDED.last_cpu_percent,
-                    last_memory_percent = EXCLUDED.last_memory_percent,
-                    last_disk_percent = EXCLUDED.last_disk_percent,
-                    process_count = EXCLUDED.process_count,
-                    last_seen = NOW(),
-                    status = 'online',
-                    raw_data = EXCLUDED.raw_data
-            """, (
-                hostname, ip_address, os_info, architecture,
-                cpu_percent, memory_percent, disk_percent,
-                data.get("process_count"), json.dumps(data)
-            ))
-            
+                SELECT column_name FROM information_schema.columns
+                WHERE table_name = 'reports_legacy'
+                    AND column_name IN (
+                        SELECT column_name FROM information_schema.columns WHERE table_name = 'reports'
+                    )
+                ORDER BY ordinal_position
+            """)
+            columns = ", ".join(row["column_name"] for row in cur.fetchall())
+        init_database()
+
+        copied = 0
+        last_id = 0
+        while True:
+            with get_db_cursor() as cur:
+                cur.execute(f"""
+                    WITH batch AS (
+                        INSERT INTO reports ({columns})
+                        SELECT {columns} FROM reports_legacy
+                        WHERE id > %s AND id <= %s
+                        RETURNING id
+                    )
+                    SELECT COUNT(*) AS copied, MAX(id) AS last_id FROM batch
+                """, (last_id, last_id + batch_rows))
+                batch = cur.fetchone()
+                cur.execute("SELECT MAX(id) AS max_id FROM reports_legacy")
+                max_id = cur.fetchone()["max_id"] or 0
+            copied += batch["copied"]
+            last_id += batch_rows
+            logger.info(f"Migrated {copied} reports")
+            if last_id >= max_id:
+                break
+
+        if drop_legacy:
+            with get_db_cursor() as cur:
+                cur.execute("DROP TABLE reports_legacy")
+        logger.info(f"Partition migration finished: {copied} reports copied")
+        return copied
+
+    except Exception as e:
+        logger.error(f"Partition migration failed: {e}")
+        raise
+
+# Hot scalar metrics stored as typed columns next to the JSONB documents
+METRIC_COLUMNS = (
+    "cpu_percent", "memory_percent", "swap_percent", "disk_percent",
+    "net_sent_rate", "net_recv_rate", "process_count"
+)
+
+REPORT_COLUMNS = (
+    "hostname", "ip_address", "os_info", "architecture",
+    "cpu_data", "memory_data", "disk_data", "network_data",
+    "top_processes", "recommendations", "installed_programs", "raw_data"
+) + METRIC_COLUMNS + ("timestamp",)
+
+CLIENT_COLUMNS = (
+    "hostname", "ip_address", "os_info", "architecture",
+    "last_cpu_percent", "last_memory_percent", "last_swap_percent", "last_disk_percent",
+    "last_net_sent_rate", "last_net_recv_rate",
+    "process_count", "last_seen", "status", "raw_data",
+    "last_net_sent", "last_net_recv"
+)
+
+CLIENT_UPSERT_SQL = """
+    ON CONFLICT (hostname) DO UPDATE SET
+        ip_address = EXCLUDED.ip_address,
+        os_info = EXCLUDED.os_info,
+        architecture = EXCLUDED.architecture,
+        last_cpu_percent = EXCLUDED.last_cpu_percent,
+        last_memory_percent = EXCLUDED.last_memory_percent,
+        last_swap_percent = EXCLUDED.last_swap_percent,
+        last_disk_percent = EXCLUDED.last_disk_percent,
+        last_net_sent_rate = EXCLUDED.last_net_sent_rate,
+        last_net_recv_rate = EXCLUDED.last_net_recv_rate,
+        process_count = EXCLUDED.process_count,
+        last_seen = EXCLUDED.last_seen,
+        status = 'online',
+        raw_data = EXCLUDED.raw_data,
+        last_net_sent = EXCLUDED.last_net_sent,
+        last_net_recv = EXCLUDED.last_net_recv
+    WHERE clients_current.last_seen IS NULL OR clients_current.last_seen <= EXCLUDED.last_seen
+"""
+
+def _report_template(columns):
+    """Build an execute_values row template; timestamps arrive as epoch seconds"""
+    placeholders = [
+        "COALESCE(to_timestamp(%s), NOW())" if column in ("timestamp", "last_seen") else "%s"
+        for column in columns
+    ]
+    return "(" + ", ".join(placeholders) + ")"
+
+def _as_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def _network_totals(data):
+    """Cumulative (bytes_sent, bytes_recv) counters of a report"""
+    network = data.get("network")
+    if not isinstance(network, dict):
+        return None, None
+    return network.get("total_sent"), network.get("total_recv")
+
+def _report_epoch(data):
+    """Capture time of a report as epoch seconds (server receive time when known)"""
+    last_seen = data.get("last_seen")
+    if isinstance(last_seen, (int, float)):
+        return float(last_seen)
+    for key in ("server_timestamp", "timestamp"):
+        try:
+            return datetime.fromisoformat(data[key]).timestamp()
+        except (KeyError, TypeError, ValueError):
+            continue
+    return time.time()
+
+def _report_metrics(data, tracker):
+    """Typed values for METRIC_COLUMNS; byte rates come from ``tracker``"""
+    cpu_data = data.get("cpu", {})
+    cpu_percent = cpu_data.get("percent") if isinstance(cpu_data, dict) else cpu_data
+
+    memory_data = data.get("memory", {})
+    memory_percent = memory_data.get("percent") if isinstance(memory_data, dict) else data.get("ram")
+
+    swap_data = data.get("swap", {})
+    swap_percent = swap_data.get("percent") if isinstance(swap_data, dict) else None
+
+    disk_data = data.get("disk", {})
+    disk_percent = parse_disk_percent(disk_data) if isinstance(disk_data, dict) and disk_data else None
+
+    sent, recv = _network_totals(data)
+    sent_rate, recv_rate = tracker.update(
+        data.get("hostname"), _report_epoch(data), _as_float(sent), _as_float(recv)
+    )
+
+    process_count = data.get("process_count")
+    return {
+        "cpu_percent": _as_float(cpu_percent),
+        "memory_percent": _as_float(memory_percent),
+        "swap_percent": _as_float(swap_percent),
+        "disk_percent": _as_float(disk_percent),
+        "net_sent_rate": sent_rate,
+        "net_recv_rate": recv_rate,
+        "process_count": int(process_count) if isinstance(process_count, (int, float)) else None,
+    }
+
+def _report_row(data, metrics, stored):
+    """Values for one `reports` row, ordered like REPORT_COLUMNS.
+
+    ``stored`` is the report after blobs.split_report(); raw_data only keeps
+    what the dedicated columns and blobs do not already hold.
+    """
+    residual = {key: value for key, value in stored.items() if key not in blobs.SPLIT_SECTIONS}
+    return (
+        data.get("hostname"), data.get("ip"), data.get("os"), data.get("architecture"),
+        json.dumps(stored.get("cpu", {})), json.dumps(stored.get("memory", {})),
+        json.dumps(stored.get("disk", {})), json.dumps(stored.get("network", {})),
+        json.dumps(stored.get("top_processes", [])),
+        json.dumps(stored.get("recommendations", [])),
+        None,  # installed_programs live in report_blobs
+        json.dumps(residual),
+        *(metrics[column] for column in METRIC_COLUMNS),
+        data.get("last_seen")
+    )
+
+def _client_row(data, metrics, stored):
+    """Values for one `clients_current` row, ordered like CLIENT_COLUMNS"""
+    return (
+        data.get("hostname"), data.get("ip"), data.get("os"), data.get("architecture"),
+        metrics["cpu_percent"], metrics["memory_percent"],
+        metrics["swap_percent"], metrics["disk_percent"],
+        metrics["net_sent_rate"], metrics["net_recv_rate"],
+        metrics["process_count"], data.get("last_seen"), "online",
+        json.dumps(stored),
+        *_network_totals(data)
+    )
+
+_blob_cache = blobs.BlobCache()
+
+def _store_blobs(cur, pending):
+    """Write blobs this process has not stored recently; returns their hashes"""
+    pending = _blob_cache.missing(pending)
+    if not pending:
+        return set()
+    psycopg2.extras.execute_values(
+        cur,
+        """
+        INSERT INTO report_blobs (hash, kind, body) VALUES %s
+        ON CONFLICT (hash) DO UPDATE SET last_used = NOW()
+        """,
+        [(digest, kind, json.dumps(body)) for digest, (kind, body) in pending.items()]
+    )
+    return set(pending)
+
+def _load_blob_bodies(cur, hashes):
+    if not hashes:
+        return {}
+    cur.execute("SELECT hash, body FROM report_blobs WHERE hash = ANY(%s)", (list(hashes),))
+    return {row["hash"]: row["body"] for row in cur.fetchall()}
+
+def _accumulate_rollups(accumulator, data, metrics):
+    accumulator.add(data.get("hostname"), _report_epoch(data), {
+        "cpu": metrics["cpu_percent"],
+        "memory": metrics["memory_percent"],
+        "disk": metrics["disk_percent"],
+        "net_sent": metrics["net_sent_rate"],
+        "net_recv": metrics["net_recv_rate"],
+    })
+
+def _write_rollups(cur, accumulator):
+    """Merge accumulated buckets into the rollup tables in a single round trip"""
+    if not len(accumulator):
+        return
+    columns = ["hostname", "bucket", "samples"]
+    updates = ["samples = t.samples + EXCLUDED.samples"]
+    for metric in rollups.METRICS:
+        columns += [f"{metric}_min", f"{metric}_max", f"{metric}_sum", f"{metric}_count", f"{metric}_hist"]
+        updates += [
+            f"{metric}_min = LEAST(t.{metric}_min, EXCLUDED.{metric}_min)",
+            f"{metric}_max = GREATEST(t.{metric}_max, EXCLUDED.{metric}_max)",
+            f"{metric}_sum = t.{metric}_sum + EXCLUDED.{metric}_sum",
+            f"{metric}_count = t.{metric}_count + EXCLUDED.{metric}_count",
+            f"{metric}_hist = winperf_hist_add(t.{metric}_hist, EXCLUDED.{metric}_hist)",
+        ]
+    row_template = "(" + ", ".join(["%s"] * len(columns)) + ")"
+
+    statements = []
+    for resolution in rollups.RESOLUTIONS:
+        values = ", ".join(
+            cur.mogrify(row_template, row).decode() for row in accumulator.rows(resolution)
+        )
+        statements.append(f"""
+            INSERT INTO reports_rollup_{resolution} AS t ({', '.join(columns)}) VALUES {values}
+            ON CONFLICT (hostname, bucket) DO UPDATE SET {', '.join(updates)}
+        """)
+    cur.execute(";".join(statements))
+
+def _prepare_metrics(cur, reports):
+    """Pair each report with its typed metrics, oldest first.
+
+    Byte rates continue from the counters stored in clients_current, so this
+    must run before clients_current is upserted.
+    """
+    hostnames = list({data.get("hostname") for data in reports})
+    cur.execute("""
+        SELECT hostname, last_net_sent, last_net_recv, EXTRACT(EPOCH FROM last_seen) AS last_seen
+        FROM clients_current
+        WHERE hostname = ANY(%s)
+    """, (hostnames,))
+
+    tracker = rollups.RateTracker()
+    for row in cur.fetchall():
+        tracker.seed(row["hostname"], _as_float(row["last_seen"]),
+                     _as_float(row["last_net_sent"]), _as_float(row["last_net_recv"]))
+
+    return [(data, _report_metrics(data, tracker)) for data in sorted(reports, key=_report_epoch)]
+
+def _write_reports(cur, reports):
+    """Insert reports, fold them into the rollups and upsert clients_current.
+
+    Returns the blob hashes written; confirm them with the blob cache once
+    the transaction has committed.
+    """
+    samples = []
+    pending = {}
+    for data, metrics in _prepare_metrics(cur, reports):
+        stored, report_blobs = blobs.split_report(data)
+        pending.update(report_blobs)
+        samples.append((data, metrics, stored))
+    written = _store_blobs(cur, pending)
+
+    psycopg2.extras.execute_values(
+        cur,
+        f"INSERT INTO reports ({', '.join(REPORT_COLUMNS)}) VALUES %s",
+        [_report_row(data, metrics, stored) for data, metrics, stored in samples],
+        template=_report_template(REPORT_COLUMNS),
+        page_size=max(len(samples), 1)
+    )
+
+    accumulator = rollups.RollupAccumulator()
+    for data, metrics, _ in samples:
+        _accumulate_rollups(accumulator, data, metrics)
+    _write_rollups(cur, accumulator)
+
+    # A multi-row upsert may touch each hostname only once: the latest report wins.
+    # Late (buffered) reports never overwrite a newer current state.
+    latest = {}
+    for sample in samples:
+        latest[sample[0].get("hostname")] = sample
+
+    psycopg2.extras.execute_values(
+        cur,
+        f"""
+        INSERT INTO clients_current ({', '.join(CLIENT_COLUMNS)}) VALUES %s
+        {CLIENT_UPSERT_SQL}
+        """,
+        [_client_row(data, metrics, stored) for data, metrics, stored in latest.values()],
+        template=_report_template(CLIENT_COLUMNS),
+        page_size=max(len(latest), 1)
+    )
+    return written
+
+@timed
+def insert_report(data):
+    """Insert a new system report"""
+    try:
+        with get_db_cursor() as cur:
+            written = _write_reports(cur, [data])
+        _blob_cache.confirm(written)
     except Exception as e:
         logger.error(f"Failed to insert report for {data.get('hostname', 'unknown')}: {e}")
         raise
 
-def get_all_reports(limit=100):
-    """Get recent reports from all clients"""
+@timed
+def insert_reports_batch(reports):
+    """Insert many reports in a single transaction"""
+    if not reports:
+        return 0
     try:
         with get_db_cursor() as cur:
-            cur.execute("""
-                SELECT 
-                    hostname,
-                    ip_address,
-                    os_info,
-                    cpu_data,
-                    memory_data,
-                    disk_data,
-                    process_count,
-                    timestamp,
-                    raw_data
-                FROM reports
-                ORDER BY timestamp DESC
-                LIMIT %s
-            """, (limit,))
+            written = _write_reports(cur, reports)
+        _blob_cache.confirm(written)
+        return len(reports)
+    except Exception as e:
+        logger.error(f"Failed to insert batch of {len(reports)} reports: {e}")
+        raise
 
-            rows = cur.fetchall()
-            result = []
+def _copy_text(value):
+    """Encode one value for COPY ... FROM STDIN in text format"""
+    if value is None:
+        return "\\N"
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
 
-            for row in rows:
-                cpu_data = row["cpu_data"] or {}
-                memory_data = row["memory_data"] or {}
-                disk_data = row["disk_data"] or {}
-
-                result.append({
-                    "hostname": row["hostname"],
-                    "ip_address": str(row["ip_address"]) if row["ip_address"] else None,
-                    "os_info": row["os_info"],
-                    "cpu_percent": float(cpu_data.get("percent", 0)),
-                    "memory_percent": float(memory_data.get("percent", 0)),
-                    "disk_percent": parse_disk_percent(disk_data),
-                    "process_count": row["process_count"],
-                    "timestamp": row["timestamp"].isoformat() if row["timestamp"] else None
-                })
+def _report_timestamp(data):
+    """Best known capture time of a replayed report, as text Postgres can parse"""
+    return datetime.fromtimestamp(_report_epoch(data), tz=timezone.utc).isoformat()
 
-            return result
+class _CopyStream:
+    """Read-only file object that renders reports into COPY text lines on demand"""
+
+    def __init__(self, reports, render):
+        self._reports = reports
+        self._render = render
+        self._buffer = ""
+
+    def _next_line(self):
+        row = self._render(next(self._reports))
+        return "\t".join(_copy_text(value) for value in row) + "\n"
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            try:
+                self._buffer += self._next_line()
+            except StopIteration:
+                break
+        if size < 0:
+            chunk, self._buffer = self._buffer, ""
+        else:
+            chunk, self._buffer = self._buffer[:size], self._buffer[size:]
+        return chunk
+
+    def readline(self, size=-1):
+        if not self._buffer:
+            try:
+                self._buffer = self._next_line()
+            except StopIteration:
+                return ""
+        return self.read(len(self._buffer) if size < 0 else size)
+
+@timed
+def bulk_load_reports(reports, chunk_rows=50000, progress_every=10000, progress=None):
+    """Load an iterable of agent payloads into `reports` with COPY.
+
+    Rows are streamed to the server, so memory use does not depend on input
+    size; rollups are merged after every chunk. Each chunk of ``chunk_rows``
+    reports is committed separately, and `clients_current` is reconciled once
+    at the end: for every loaded host the newest report wins unless the table
+    already holds something newer.
+    """
+    reports = iter(reports)
+    stats = {"rows": 0, "clients": 0, "seconds": 0.0, "rows_per_second": 0.0}
+    started = time.monotonic()
+
+    accumulator = rollups.RollupAccumulator()
+    tracker = rollups.RateTracker()
+
+    pending = {}
+
+    def render(data):
+        metrics = _report_metrics(data, tracker)
+        stored, report_blobs = blobs.split_report(data)
+        pending.update(_blob_cache.missing(report_blobs))
+        _accumulate_rollups(accumulator, data, metrics)
+        stats["rows"] += 1
+        if progress_every and stats["rows"] % progress_every == 0:
+            elapsed = time.monotonic() - started
+            rate = stats["rows"] / elapsed if elapsed > 0 else 0.0
+            if progress:
+                progress(stats["rows"], rate)
+            else:
+                logger.info(f"Bulk load: {stats['rows']} rows ({rate:.0f} rows/s)")
+        return _report_row(data, metrics, stored)[:-1] + (_report_timestamp(data),)
+
+    copy_sql = f"COPY reports ({', '.join(REPORT_COLUMNS)}) FROM STDIN"
+    try:
+        with get_db_cursor() as cur:
+            cur.execute("SELECT COALESCE(MAX(id), 0) AS max_id FROM reports")
+            start_id = cur.fetchone()["max_id"]
+
+            while True:
+                loaded_before = stats["rows"]
+                chunk = itertools.islice(reports, chunk_rows)
+                cur.copy_expert(copy_sql, _CopyStream(chunk, render))
+                _write_rollups(cur, accumulator)
+                written = _store_blobs(cur, pending)
+                cur.connection.commit()
+                _blob_cache.confirm(written)
+                accumulator.clear()
+                pending.clear()
+                if stats["rows"] - loaded_before < chunk_rows:
+                    break
+
+            cur.execute(f"""
+                INSERT INTO clients_current ({', '.join(CLIENT_COLUMNS)})
+                SELECT DISTINCT ON (hostname)
+                    hostname, ip_address, os_info, architecture,
+                    cpu_percent, memory_percent, swap_percent, disk_percent,
+                    net_sent_rate, net_recv_rate,
+                    process_count, timestamp, 'online',
+                    raw_data || jsonb_build_object(
+                        'cpu', cpu_data, 'memory', memory_data, 'disk', disk_data,
+                        'network', network_data, 'top_processes', top_processes,
+                        'recommendations', recommendations
+                    ),
+                    (network_data->>'total_sent')::bigint, (network_data->>'total_recv')::bigint
+                FROM reports
+                WHERE id > %s
+                ORDER BY hostname, timestamp DESC
+                {CLIENT_UPSERT_SQL}
+            """, (start_id,))
+            stats["clients"] = cur.rowcount
 
     except Exception as e:
-        logger.error(f"Failed to fetch reports: {e}")
+        logger.error(f"Bulk load failed after {stats['rows']} rows: {e}")
         raise
 
+    stats["seconds"] = time.monotonic() - started
+    stats["rows_per_second"] = stats["rows"] / stats["seconds"] if stats["seconds"] > 0 else 0.0
+    return stats
+
+# Report listing filters: metric name -> typed column, and threshold operators
+REPORT_FILTER_METRICS = {
+    "cpu": "cpu_percent",
+    "memory": "memory_percent",
+    "swap": "swap_percent",
+    "disk": "disk_percent",
+    "net_sent": "net_sent_rate",
+    "net_recv": "net_recv_rate",
+    "process_count": "process_count",
+}
+REPORT_FILTER_OPERATORS = {"gt": ">", "gte": ">=", "lt": "<", "lte": "<="}
+
+REPORT_LISTING_SQL = """
+    SELECT
+        id,
+        hostname,
+        ip_address,
+        os_info,
+        cpu_percent,
+        memory_percent,
+        disk_percent,
+        process_count,
+        timestamp
+    FROM reports
+    {where}
+    ORDER BY timestamp DESC, id DESC
+"""
+
+def _report_summary(row):
+    return {
+        "id": row["id"],
+        "hostname": row["hostname"],
+        "ip_address": str(row["ip_address"]) if row["ip_address"] else None,
+        "os_info": row["os_info"],
+        "cpu_percent": row["cpu_percent"] or 0.0,
+        "memory_percent": row["memory_percent"] or 0.0,
+        "disk_percent": row["disk_percent"] or 0.0,
+        "process_count": row["process_count"],
+        "timestamp": row["timestamp"].isoformat() if row["timestamp"] else None
+    }
+
+def _report_filters(hostnames=None, since=None, until=None, thresholds=(), after=None):
+    """WHERE clause and parameters of a report listing.
+
+    ``thresholds`` holds ``(metric, operator, value)`` triples, e.g.
+    ``("cpu", "gt", 90)``; ``after`` is the ``(timestamp, id)`` of the last
+    row already returned, and only older rows match.
+    """
+    clauses, params = [], []
+    if hostnames:
+        clauses.append("hostname = ANY(%s)")
+        params.append(list(hostnames))
+    if since is not None:
+        clauses.append("timestamp >= %s")
+        params.append(since)
+    if until is not None:
+        clauses.append("timestamp < %s")
+        params.append(until)
+    for metric, operator, value in thresholds or ():
+        if metric not in REPORT_FILTER_METRICS or operator not in REPORT_FILTER_OPERATORS:
+            raise ValueError(f"Unknown filter {metric}_{operator}")
+        # float8 on both sides: asyncpg would bind a float against INTEGER process_count as int4 and fail
+        clauses.append(f"{REPORT_FILTER_METRICS[metric]} {REPORT_FILTER_OPERATORS[operator]} %s::float8")
+        params.append(value)
+    if after is not None:
+        clauses.append("(timestamp, id) < (%s, %s)")
+        params.extend(after)
+    return ("WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+@timed
+def get_all_reports(limit=100, since=None):
+    """Get recent reports from all clients
+
+    Passing ``since`` bounds the scan to recent partitions; without it the
+    newest partitions are read first and the scan stops at ``limit``.
+    """
+    rows, _ = get_reports_page(limit=limit, since=since)
+    return rows
 
+@timed
+def get_reports_page(limit=100, after=None, **filters):
+    """One page of reports, newest first, and the keyset of the next page (None on the last page)
+
+    Pages are addressed by the ``(timestamp, id)`` of their last row instead
+    of an OFFSET, so every page costs one index range scan however deep it is.
+    """
+    where, params = _report_filters(after=after, **filters)
+    try:
+        with get_db_cursor() as cur:
+            cur.execute(REPORT_LISTING_SQL.format(where=where) + " LIMIT %s", params + [limit + 1])
+            rows = cur.fetchall()
     except Exception as e:
         logger.error(f"Failed to fetch reports: {e}")
         raise
 
+    next_after = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_after = (rows[-1]["timestamp"], rows[-1]["id"])
+    return [_report_summary(row) for row in rows], next_after
+
+def iter_reports(limit=None, after=None, itersize=2000, **filters):
+    """Yield matching reports, newest first, through a server-side cursor
+
+    Memory stays bounded by ``itersize`` rows however many reports match.
+    The connection is held until the iteration ends or the generator is closed.
+    """
+    where, params = _report_filters(after=after, **filters)
+    sql = REPORT_LISTING_SQL.format(where=where)
+    if limit is not None:
+        sql += " LIMIT %s"
+        params.append(limit)
+    with get_db_cursor(name="iter_reports", itersize=itersize) as cur:
+        cur.execute(sql, params)
+        for row in cur:
+            yield _report_summary(row)
+
+def iter_metric_rows(columns=("timestamp", "hostname") + METRIC_COLUMNS, hostnames=None, since=None,
+                     until=None, chunk_rows=10000):
+    """Yield lists of up to ``chunk_rows`` row tuples of the typed ``columns``, per host then by time
+
+    Only ``timestamp``, ``hostname`` and METRIC_COLUMNS can be projected, so
+    the scan is answered from the covering (hostname, timestamp) index
+    without touching the JSONB columns.
+    """
+    allowed = ("timestamp", "hostname") + METRIC_COLUMNS
+    unknown = [column for column in columns if column not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown export columns: {', '.join(unknown)}")
+
+    where, params = _report_filters(hostnames=hostnames, since=since, until=until)
+    with get_db_cursor(name="iter_metric_rows", itersize=chunk_rows,
+                       cursor_factory=psycopg2.extensions.cursor) as cur:
+        cur.execute(f"""
+            SELECT {", ".join(columns)}
+            FROM reports
+            {where}
+            ORDER BY hostname, timestamp
+        """, params)
+        while True:
+            rows = cur.fetchmany(chunk_rows)
+            if not rows:
+                break
+            yield rows
+
 def parse_disk_percent(disk_data: dict) -> float:
     try:
         return max(
@@ -234,26 +1042,52 @@ def parse_disk_percent(disk_data: dict) -> float:
     except Exception:
         return 0.0
 
-def get_client_history(hostname, hours=24):
-    """Get historical data for a specific client"""
+@timed
+def get_client_history(hostname, hours=24, resolution="raw"):
+    """Get historical data for a specific client
+
+    ``resolution`` is "raw" for every stored report, or one of the rollup
+    resolutions in rollups.RESOLUTIONS for avg/min/max/p95 per bucket.
+    """
+    since = datetime.now(timezone.utc) - timedelta(hours=hours)
     try:
         with get_db_cursor() as cur:
+            if resolution in rollups.RESOLUTIONS:
+                cur.execute(f"""
+                    SELECT *
+                    FROM reports_rollup_{resolution}
+                    WHERE hostname = %s
+                        AND bucket > %s
+                    ORDER BY bucket ASC
+                """, (hostname, since))
+                return [rollups.summarize_bucket(row) for row in cur.fetchall()]
+
             cur.execute("""
                 SELECT 
-                    (cpu_data->>'percent')::decimal as cpu_percent,
-                    (memory_data->>'percent')::decimal as memory_percent,
+                    cpu_percent,
+                    memory_percent,
+                    swap_percent,
+                    disk_percent,
+                    net_sent_rate,
+                    net_recv_rate,
+                    process_count,
                     timestamp
                 FROM reports 
                 WHERE hostname = %s 
-                    AND timestamp > NOW() - INTERVAL '%s hours'
+                    AND timestamp > %s
                 ORDER BY timestamp ASC
-            """, (hostname, hours))
+            """, (hostname, since))
             
             rows = cur.fetchall()
             return [
                 {
-                    "cpu_percent": float(row["cpu_percent"]) if row["cpu_percent"] else 0,
-                    "memory_percent": float(row["memory_percent"]) if row["memory_percent"] else 0,
+                    "cpu_percent": row["cpu_percent"] or 0,
+                    "memory_percent": row["memory_percent"] or 0,
+                    "swap_percent": row["swap_percent"],
+                    "disk_percent": row["disk_percent"],
+                    "net_sent_rate": row["net_sent_rate"],
+                    "net_recv_rate": row["net_recv_rate"],
+                    "process_count": row["process_count"],
                     "timestamp": row["timestamp"].isoformat()
                 }
                 for row in rows
@@ -263,6 +1097,7 @@ def get_client_history(hostname, hours=24):
         logger.error(f"Failed to fetch history for {hostname}: {e}")
         raise
 
+@timed
 def get_current_clients():
     """Get current status of all clients"""
     try:
@@ -271,22 +1106,29 @@ def get_current_clients():
                 SELECT * FROM clients_current
                 ORDER BY last_seen DESC
             """)
-            rows = cur.fetchall()
-            result = []
-            for row in rows:
-                row_dict = dict(row)
+            rows = [dict(row) for row in cur.fetchall()]
+            for row_dict in rows:
+                raw_data = row_dict.get("raw_data") or {}
+                if isinstance(raw_data, str):
+                    try:
+                        raw_data = json.loads(raw_data)
+                    except Exception:
+                        raw_data = {}
+                row_dict["raw_data"] = raw_data
+
+            # Blob'ları tek sorguda çek
+            hashes = {digest for row_dict in rows for digest in blobs.blob_refs(row_dict["raw_data"]).values()}
+            bodies = _load_blob_bodies(cur, hashes)
 
+            result = []
+            for row_dict in rows:
                 # last_seen epoch'a dönüştür
                 if isinstance(row_dict.get("last_seen"), datetime):
                     row_dict["last_seen"] = int(row_dict["last_seen"].timestamp())
 
                 # raw_data içindeki bilgileri aç
-                raw_data = row_dict.get("raw_data", {})
-                if isinstance(raw_data, str):
-                    try:
-                        raw_data = json.loads(raw_data)
-                    except Exception:
-                        raw_data = {}
+                raw_data = blobs.join_report(row_dict["raw_data"], bodies)
+                row_dict["raw_data"] = raw_data
 
                 for key in [
                     "cpu", "memory", "disk", "network", "top_processes", 
@@ -302,10 +1144,274 @@ def get_current_clients():
         raise
 
 
+@timed
+def get_client_snapshot(hostname):
+    """Get the last stored report document of one client, or None"""
+    try:
+        with get_db_cursor() as cur:
+            cur.execute("SELECT raw_data FROM clients_current WHERE hostname = %s", (hostname,))
+            row = cur.fetchone()
+            if not row or not row["raw_data"]:
+                return None
+            raw_data = row["raw_data"]
+            bodies = _load_blob_bodies(cur, set(blobs.blob_refs(raw_data).values()))
+            return blobs.join_report(raw_data, bodies)
+    except Exception as e:
+        logger.error(f"Failed to fetch snapshot for {hostname}: {e}")
+        raise
+
+def backfill_typed_metrics(window_hours=24):
+    """Fill the typed metric columns of reports written before they existed.
+
+    Works through the table one time window per transaction; byte rates are
+    derived from consecutive counters of the same host inside each window.
+    """
+    try:
+        with get_db_cursor() as cur:
+            cur.execute("SELECT MIN(timestamp) AS oldest FROM reports WHERE cpu_percent IS NULL")
+            start = cur.fetchone()["oldest"]
+        if start is None:
+            logger.info("No reports need a typed metrics backfill")
+            return 0
+
+        updated = 0
+        step = timedelta(hours=window_hours)
+        end_of_data = datetime.now(timezone.utc)
+        while start <= end_of_data:
+            with get_db_cursor() as cur:
+                cur.execute("""
+                    WITH counters AS (
+                        SELECT
+                            id,
+                            timestamp,
+                            (network_data->>'total_sent')::double precision AS sent,
+                            (network_data->>'total_recv')::double precision AS recv,
+                            LAG((network_data->>'total_sent')::double precision) OVER w AS prev_sent,
+                            LAG((network_data->>'total_recv')::double precision) OVER w AS prev_recv,
+                            EXTRACT(EPOCH FROM timestamp - LAG(timestamp) OVER w) AS elapsed
+                        FROM reports
+                        WHERE timestamp >= %s AND timestamp < %s
+                        WINDOW w AS (PARTITION BY hostname ORDER BY timestamp)
+                    )
+                    UPDATE reports r SET
+                        cpu_percent = CASE jsonb_typeof(r.cpu_data)
+                            WHEN 'object' THEN (r.cpu_data->>'percent')::real
+                            WHEN 'number' THEN (r.cpu_data #>> '{}')::real
+                        END,
+                        memory_percent = (r.memory_data->>'percent')::real,
+                        swap_percent = (r.raw_data->'swap'->>'percent')::real,
+                        disk_percent = (
+                            SELECT MAX((volume->>'percent')::real)
+                            FROM jsonb_each(CASE WHEN jsonb_typeof(r.disk_data) = 'object'
+                                                 THEN r.disk_data ELSE '{}'::jsonb END) AS d(device, volume)
+                            WHERE jsonb_typeof(volume) = 'object'
+                        ),
+                        net_sent_rate = CASE WHEN c.sent >= c.prev_sent AND c.elapsed > 0
+                                             THEN (c.sent - c.prev_sent) / c.elapsed END,
+                        net_recv_rate = CASE WHEN c.recv >= c.prev_recv AND c.elapsed > 0
+                                             THEN (c.recv - c.prev_recv) / c.elapsed END
+                    FROM counters c
+                    WHERE r.id = c.id
+                        AND r.timestamp = c.timestamp
+                        AND r.cpu_percent IS NULL
+                """, (start, start + step))
+                updated += cur.rowcount
+            logger.info(f"Backfilled typed metrics up to {start + step:%Y-%m-%d %H:%M} ({updated} reports)")
+            start += step
+
+        return updated
+
+    except Exception as e:
+        logger.error(f"Typed metrics backfill failed: {e}")
+        raise
+
+# Latest value of each metric in clients_current
+CLIENT_METRIC_COLUMNS = {
+    "cpu": "last_cpu_percent",
+    "memory": "last_memory_percent",
+    "swap": "last_swap_percent",
+    "disk": "last_disk_percent",
+    "net_sent": "last_net_sent_rate",
+    "net_recv": "last_net_recv_rate",
+}
+
+def _fleet_merge_sql(resolution, metrics, where):
+    """Per-host rollup rows of ``resolution`` merged per bucket, for the given ``metrics``"""
+    columns = ["bucket", "COUNT(*) AS hosts", "SUM(samples) AS samples"]
+    for metric in metrics:
+        columns += [
+            f"MIN({metric}_min) AS {metric}_min",
+            f"MAX({metric}_max) AS {metric}_max",
+            f"SUM({metric}_sum) AS {metric}_sum",
+            f"SUM({metric}_count) AS {metric}_count",
+            f"winperf_hist_sum({metric}_hist) AS {metric}_hist",
+        ]
+    return f"""
+        SELECT {", ".join(columns)}
+        FROM reports_rollup_{resolution}
+        {where}
+        GROUP BY bucket
+    """
+
+@timed
+def refresh_fleet_rollups(lookback_hours=rollups.FLEET_REFRESH_LOOKBACK_HOURS, since=None):
+    """Recompute the fleet_rollup tables for the closed buckets of the last ``lookback_hours``
+
+    Buckets are recomputed from scratch, so this is idempotent; pass an
+    older ``since`` after a backlog of late reports was loaded. Returns the
+    number of fleet buckets written.
+    """
+    now = time.time()
+    since = since or datetime.now(timezone.utc) - timedelta(hours=lookback_hours)
+    metrics = list(rollups.METRICS)
+    columns = ["bucket", "hosts", "samples"] + [
+        f"{metric}_{part}" for metric in metrics for part in ("min", "max", "sum", "count", "hist")
+    ]
+    updates = [f"{column} = EXCLUDED.{column}" for column in columns[1:]]
+    written = 0
+    try:
+        with get_db_cursor() as cur:
+            for resolution, seconds in rollups.RESOLUTIONS.items():
+                # The current bucket is still filling up; it is merged at query time instead
+                closed_before = rollups.bucket_start(now, seconds)
+                cur.execute(f"""
+                    INSERT INTO fleet_rollup_{resolution} ({", ".join(columns)})
+                    {_fleet_merge_sql(resolution, metrics, "WHERE bucket >= %s AND bucket < %s")}
+                    ON CONFLICT (bucket) DO UPDATE SET {", ".join(updates)}
+                """, (since, closed_before))
+                written += cur.rowcount
+        logger.info(f"Refreshed {written} fleet rollup buckets")
+        return written
+    except Exception as e:
+        logger.error(f"Failed to refresh fleet rollups: {e}")
+        raise
+
+@timed
+def get_fleet_series(metric, since, resolution, hostnames=None):
+    """Per-bucket fleet aggregates of ``metric`` since ``since``, oldest first
+
+    Buckets already in fleet_rollup_<resolution> are read from there (one row
+    per bucket); newer ones, and any query restricted to ``hostnames``, are
+    merged from the per-host rollups on the fly.
+    """
+    if metric not in rollups.METRICS:
+        raise ValueError(f"Unknown metric '{metric}'")
+    if resolution not in rollups.RESOLUTIONS:
+        raise ValueError(f"Unknown resolution '{resolution}'")
+    fields = ["bucket", "hosts", "samples"] + [f"{metric}_{part}" for part in ("min", "max", "sum", "count", "hist")]
+
+    try:
+        with get_db_cursor() as cur:
+            rows, merge_since = [], since
+            if not hostnames:
+                cur.execute(f"""
+                    SELECT {", ".join(fields)}
+                    FROM fleet_rollup_{resolution}
+                    WHERE bucket >= %s
+                    ORDER BY bucket
+                """, (since,))
+                rows = [dict(row) for row in cur.fetchall()]
+                if rows:
+                    merge_since = rows[-1]["bucket"] + timedelta(seconds=rollups.RESOLUTIONS[resolution])
+
+            where, params = "WHERE bucket >= %s", [merge_since]
+            if hostnames:
+                where += " AND hostname = ANY(%s)"
+                params.append(list(hostnames))
+            cur.execute(_fleet_merge_sql(resolution, [metric], where) + " ORDER BY bucket", params)
+            rows.extend(dict(row) for row in cur.fetchall())
+            return rows
+    except Exception as e:
+        logger.error(f"Failed to fetch fleet series for {metric}: {e}")
+        raise
+
+@timed
+def get_top_hosts(metric, k=10, since=None, resolution=None, stat="avg"):
+    """The ``k`` hosts with the highest ``metric``: latest value, or ``stat`` (avg/max) since ``since``"""
+    try:
+        with get_db_cursor() as cur:
+            if since is None:
+                if metric not in CLIENT_METRIC_COLUMNS:
+                    raise ValueError(f"Unknown metric '{metric}'")
+                column = CLIENT_METRIC_COLUMNS[metric]
+                cur.execute(f"""
+                    SELECT hostname, {column} AS value, last_seen
+                    FROM clients_current
+                    WHERE {column} IS NOT NULL
+                    ORDER BY {column} DESC
+                    LIMIT %s
+                """, (k,))
+                return [
+                    {"hostname": row["hostname"], "value": float(row["value"]),
+                     "last_seen": int(row["last_seen"].timestamp()) if row["last_seen"] else None}
+                    for row in cur.fetchall()
+                ]
+
+            if metric not in rollups.METRICS:
+                raise ValueError(f"Unknown metric '{metric}'")
+            if resolution not in rollups.RESOLUTIONS:
+                raise ValueError(f"Unknown resolution '{resolution}'")
+            if stat not in ("avg", "max"):
+                raise ValueError(f"Unknown statistic '{stat}'")
+            cur.execute(f"""
+                SELECT hostname,
+                    SUM({metric}_sum) / NULLIF(SUM({metric}_count), 0) AS avg,
+                    MAX({metric}_max) AS max
+                FROM reports_rollup_{resolution}
+                WHERE bucket >= %s
+                GROUP BY hostname
+                HAVING SUM({metric}_count) > 0
+                ORDER BY {stat} DESC
+                LIMIT %s
+            """, (since, k))
+            return [
+                {"hostname": row["hostname"], "value": float(row[stat]), "avg": row["avg"], "max": row["max"]}
+                for row in cur.fetchall()
+            ]
+    except Exception as e:
+        logger.error(f"Failed to fetch top hosts by {metric}: {e}")
+        raise
+
+@timed
+def maintain_partitions():
+    """Pre-create upcoming report partitions"""
+    try:
+        with get_db_cursor() as cur:
+            if partitions.is_partitioned(cur):
+                return partitions.ensure_partitions(cur)
+            return 0
+    except Exception as e:
+        logger.error(f"Failed to maintain partitions: {e}")
+        raise
+
+@timed
 def cleanup_old_data(days=30):
     """Clean up old data to prevent database bloat"""
     try:
         with get_db_cursor() as cur:
+            # Blobs unused for the whole retention period can no longer be referenced by any report
+            cur.execute("""
+                DELETE FROM report_blobs
+                WHERE last_used < NOW() - INTERVAL '%s days'
+                    AND hash NOT IN (
+                        SELECT refs.value
+                        FROM clients_current, jsonb_each_text(COALESCE(raw_data->'_blobs', '{}'::jsonb)) AS refs
+                    )
+            """, (days,))
+
+            for resolution, retention_days in rollups.ROLLUP_RETENTION_DAYS.items():
+                cutoff = datetime.now(timezone.utc) - timedelta(days=retention_days)
+                cur.execute(f"DELETE FROM reports_rollup_{resolution} WHERE bucket < %s", (cutoff,))
+                cur.execute(f"DELETE FROM fleet_rollup_{resolution} WHERE bucket < %s", (cutoff,))
+
+            if partitions.is_partitioned(cur):
+                # Whole partitions are dropped instead of deleting row by row
+                cutoff = datetime.now(timezone.utc) - timedelta(days=days)
+                dropped = partitions.drop_partitions_before(cur, cutoff)
+                partitions.ensure_partitions(cur)
+                logger.info(f"Dropped {len(dropped)} partitions older than {days} days")
+                return len(dropped)
+
             cur.execute("""
                 DELETE FROM reports 
                 WHERE timestamp < NOW() - INTERVAL '%s days'
@@ -321,4 +1427,33 @@ def cleanup_old_data(days=30):
 
 # Initialize database on module import
 if __name__ == "__main__":
-    init_database()
\ No newline at end of file
+    import argparse
+    from dotenv import load_dotenv
+
+    parser = argparse.ArgumentParser(description="WinPerfAgent database maintenance")
+    parser.add_argument("command", nargs="?", default="init",
+                        choices=["init", "maintain", "cleanup", "migrate-partitions", "backfill-metrics",
+                                 "refresh-fleet"])
+    parser.add_argument("--days", type=int, default=30, help="retention for cleanup (default: 30)")
+    parser.add_argument("--drop-legacy", action="store_true",
+                        help="drop reports_legacy after migrate-partitions")
+    parser.add_argument("--hours", type=float, default=rollups.FLEET_REFRESH_LOOKBACK_HOURS,
+                        help="refresh-fleet: hours of closed buckets to recompute")
+    args = parser.parse_args()
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if args.command == "init":
+        init_database()
+    elif args.command == "maintain":
+        maintain_partitions()
+    elif args.command == "cleanup":
+        cleanup_old_data(args.days)
+    elif args.command == "migrate-partitions":
+        migrate_reports_to_partitioned(drop_legacy=args.drop_legacy)
+    elif args.command == "backfill-metrics":
+        init_database()
+        backfill_typed_metrics()
+    elif args.command == "refresh-fleet":
+        refresh_fleet_rollups(lookback_hours=args.hours)
@@ -0,0 +1,188 @@
+"""Export historical metrics as CSV, Arrow or Parquet.
+
+Rows are read through a server-side cursor in chunks and each chunk is
+encoded and written before the next one is fetched, so memory stays
+constant however many reports are exported. Only the typed metric columns
+are exported; Arrow and Parquet need ``pyarrow``.
+
+    python export.py --hosts web-01,web-02 --since 2024-05-01 --until 2024-06-01 -o may.parquet
+    python export.py --since 2024-05-01 --format csv > may.csv
+"""
+import io
+import sys
+import csv
+import logging
+import argparse
+from datetime import datetime, timezone
+
+from dotenv import load_dotenv
+
+from db import METRIC_COLUMNS, iter_metric_rows
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet as pq
+except ImportError:  # optional: columnar formats
+    pa = None
+
+logger = logging.getLogger(__name__)
+
+CSV, ARROW, PARQUET = "csv", "arrow", "parquet"
+EXPORT_COLUMNS = ("timestamp", "hostname") + METRIC_COLUMNS
+CONTENT_TYPES = {
+    CSV: "text/csv",
+    ARROW: "application/vnd.apache.arrow.stream",
+    PARQUET: "application/vnd.apache.parquet",
+}
+
+def supported_formats():
+    return [CSV, ARROW, PARQUET] if pa is not None else [CSV]
+
+def arrow_schema(columns):
+    """Arrow types matching the PostgreSQL column types"""
+    types = {
+        "timestamp": pa.timestamp("us", tz="UTC"),
+        "hostname": pa.string(),
+        "cpu_percent": pa.float32(),
+        "memory_percent": pa.float32(),
+        "swap_percent": pa.float32(),
+        "disk_percent": pa.float32(),
+        "net_sent_rate": pa.float64(),
+        "net_recv_rate": pa.float64(),
+        "process_count": pa.int32(),
+    }
+    return pa.schema([(column, types[column]) for column in columns])
+
+def _record_batch(rows, schema):
+    columns = list(zip(*rows))
+    return pa.record_batch(
+        [pa.array(values, type=field.type) for values, field in zip(columns, schema)],
+        schema=schema
+    )
+
+def _csv_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return "" if value is None else value
+
+def csv_chunks(chunks, columns):
+    """Encode row chunks as CSV, yielding bytes per chunk (header first)"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    yield buffer.getvalue().encode("utf-8")
+    for rows in chunks:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows([_csv_value(value) for value in row] for row in rows)
+        yield buffer.getvalue().encode("utf-8")
+
+def arrow_chunks(chunks, columns):
+    """Encode row chunks as an Arrow IPC stream, yielding bytes per record batch"""
+    schema = arrow_schema(columns)
+    sink = io.BytesIO()
+    writer = pa.ipc.new_stream(pa.PythonFile(sink, mode="w"), schema)
+
+    def drain():
+        data = sink.getvalue()
+        sink.seek(0)
+        sink.truncate()
+        return data
+
+    yield drain()
+    for rows in chunks:
+        writer.write_batch(_record_batch(rows, schema))
+        yield drain()
+    writer.close()
+    yield drain()
+
+def write_parquet(chunks, columns, path, compression="zstd"):
+    """Write row chunks to a Parquet file, one row group per chunk; returns the row count"""
+    schema = arrow_schema(columns)
+    total = 0
+    with pq.ParquetWriter(path, schema, compression=compression) as writer:
+        for rows in chunks:
+            writer.write_batch(_record_batch(rows, schema))
+            total += len(rows)
+    return total
+
+def encode(chunks, columns, fmt):
+    """Streaming encoder for ``fmt`` (CSV or Arrow; Parquet needs a seekable file)"""
+    if fmt not in supported_formats():
+        raise ValueError(f"Unsupported export format '{fmt}' (supported: {', '.join(supported_formats())})")
+    if fmt == CSV:
+        return csv_chunks(chunks, columns)
+    if fmt == ARROW:
+        return arrow_chunks(chunks, columns)
+    raise ValueError("Parquet is written to files only, use export.py or the arrow format")
+
+def parse_time(value):
+    """Epoch seconds or ISO 8601 (UTC when no offset is given)"""
+    try:
+        epoch = float(value)
+    except ValueError:
+        parsed = datetime.fromisoformat(value)
+        return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+    try:
+        return datetime.fromtimestamp(epoch, tz=timezone.utc)
+    except (OverflowError, OSError, ValueError) as e:  # 1e20, inf, nan
+        raise ValueError(f"Timestamp out of range: {value}") from e
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export per-host metric history")
+    parser.add_argument("--hosts", help="comma-separated hostnames (default: all)")
+    parser.add_argument("--since", type=parse_time, help="start, epoch seconds or ISO 8601")
+    parser.add_argument("--until", type=parse_time, help="end (exclusive), epoch seconds or ISO 8601")
+    parser.add_argument("--columns", default=",".join(EXPORT_COLUMNS),
+                        help=f"comma-separated columns (default: {','.join(EXPORT_COLUMNS)})")
+    parser.add_argument("--format", choices=(CSV, ARROW, PARQUET),
+                        help="output format (default: from the output file extension, else csv)")
+    parser.add_argument("--chunk-rows", type=int, default=50000,
+                        help="rows fetched and written per chunk (default: 50000)")
+    parser.add_argument("-o", "--output", default="-", help="output file, or - for stdout")
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    fmt = args.format or next(
+        (name for name in (PARQUET, ARROW) if args.output.endswith(f".{name}")), CSV
+    )
+    if fmt not in supported_formats():
+        parser.error(f"{fmt} export needs pyarrow (pip install pyarrow)")
+    if fmt == PARQUET and args.output == "-":
+        parser.error("Parquet cannot be written to stdout, pass -o FILE")
+
+    columns = tuple(column.strip() for column in args.columns.split(",") if column.strip())
+    counted = {"rows": 0}
+
+    def counting(chunks):
+        for rows in chunks:
+            counted["rows"] += len(rows)
+            yield rows
+
+    chunks = counting(iter_metric_rows(
+        columns,
+        hostnames=args.hosts.split(",") if args.hosts else None,
+        since=args.since,
+        until=args.until,
+        chunk_rows=args.chunk_rows
+    ))
+
+    if fmt == PARQUET:
+        write_parquet(chunks, columns, args.output)
+    else:
+        output = sys.stdout.buffer if args.output == "-" else open(args.output, "wb")
+        try:
+            for data in encode(chunks, columns, fmt):
+                output.write(data)
+        finally:
+            if output is not sys.stdout.buffer:
+                output.close()
+
+    logger.info(f"Exported {counted['rows']} reports as {fmt}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,157 @@
+"""Latest per-host metrics in the Prometheus text format, served at /metrics/fleet.
+
+The exposition is built from the state cache, never from PostgreSQL. Each
+host's sample lines are rendered once per report and kept; a scrape asks
+the cache for the hosts changed since the last one, re-renders only
+those, and reuses the assembled body while the cache generation is
+unchanged, so an idle 10k-host scrape is a counter lookup. The kept state
+belongs to one cache instance (the identity in its ETag): when the cache is
+rebuilt, hosts it no longer holds are dropped by a full re-render.
+"""
+import json
+import logging
+import threading
+
+from metrics import format_labels, format_value
+
+logger = logging.getLogger(__name__)
+
+# name, type, help, label names (after "hostname")
+FAMILIES = (
+    ("winperf_host_info", "gauge", "Host identity, always 1", ("ip", "os", "agent_version", "status")),
+    ("winperf_host_last_seen_timestamp_seconds", "gauge", "Time of the host's latest report", ()),
+    ("winperf_host_cpu_percent", "gauge", "CPU utilization", ()),
+    ("winperf_host_memory_percent", "gauge", "Memory utilization", ()),
+    ("winperf_host_memory_used_bytes", "gauge", "Memory in use", ()),
+    ("winperf_host_memory_total_bytes", "gauge", "Installed memory", ()),
+    ("winperf_host_swap_percent", "gauge", "Swap utilization", ()),
+    ("winperf_host_disk_used_percent", "gauge", "Volume utilization", ("device", "mountpoint")),
+    ("winperf_host_disk_free_bytes", "gauge", "Free space of a volume", ("device", "mountpoint")),
+    ("winperf_host_disk_total_bytes", "gauge", "Size of a volume", ("device", "mountpoint")),
+    ("winperf_host_network_sent_bytes_total", "counter", "Bytes sent by an interface", ("interface",)),
+    ("winperf_host_network_received_bytes_total", "counter", "Bytes received by an interface", ("interface",)),
+    ("winperf_host_process_count", "gauge", "Running processes", ()),
+)
+LABEL_NAMES = {name: ("hostname",) + labels for name, _, _, labels in FAMILIES}
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def _section(data, key, field):
+    section = data.get(key)
+    if isinstance(section, dict):
+        return section.get(field)
+    return section if field == "percent" else None
+
+def host_samples(hostname, data):
+    """Sample lines of one host's latest report, one ``bytes`` block per entry of FAMILIES"""
+    samples = {}
+
+    def add(family, value, *labels):
+        if _is_number(value):
+            line = f"{family}{format_labels(LABEL_NAMES[family], (hostname,) + labels)} {format_value(value)}\n"
+            samples[family] = samples.get(family, "") + line
+
+    add("winperf_host_info", 1, data.get("ip") or "", data.get("os") or "", data.get("agent_version") or "",
+        data.get("status") or "")
+    add("winperf_host_last_seen_timestamp_seconds", data.get("last_seen"))
+    add("winperf_host_cpu_percent", _section(data, "cpu", "percent"))
+    add("winperf_host_memory_percent", _section(data, "memory", "percent"))
+    add("winperf_host_memory_used_bytes", _section(data, "memory", "used"))
+    add("winperf_host_memory_total_bytes", _section(data, "memory", "total"))
+    add("winperf_host_swap_percent", _section(data, "swap", "percent"))
+
+    disks = data.get("disk")
+    if isinstance(disks, dict):
+        for device, volume in sorted(disks.items()):
+            if isinstance(volume, dict):
+                mountpoint = volume.get("mountpoint") or device
+                add("winperf_host_disk_used_percent", volume.get("percent"), device, mountpoint)
+                add("winperf_host_disk_free_bytes", volume.get("free"), device, mountpoint)
+                add("winperf_host_disk_total_bytes", volume.get("total"), device, mountpoint)
+
+    network = data.get("network")
+    interfaces = network.get("interfaces") if isinstance(network, dict) else None
+    if isinstance(interfaces, dict):
+        for interface, counters in sorted(interfaces.items()):
+            if isinstance(counters, dict):
+                add("winperf_host_network_sent_bytes_total", counters.get("bytes_sent"), interface)
+                add("winperf_host_network_received_bytes_total", counters.get("bytes_recv"), interface)
+
+    add("winperf_host_process_count", data.get("process_count"))
+    return tuple(samples.get(name, "").encode("utf-8") for name, _, _, _ in FAMILIES)
+
+HEADERS = [f"# HELP {name} {documentation}\n# TYPE {name} {kind}\n".encode("utf-8")
+           for name, kind, documentation, _ in FAMILIES]
+
+class FleetExporter:
+    def __init__(self, cache):
+        self.cache = cache
+        self._reset()
+        self._state = None  # (cache instance, generation) the body was built from
+        self._body = None
+        self._lock = threading.Lock()
+        self.stats = {"scrapes": 0, "renders": 0, "hosts_rendered": 0}
+
+    def _reset(self):
+        self._positions = {}  # hostname -> index in the columns
+        self._columns = [[] for _ in FAMILIES]  # per family, the blocks of every host in hostname order
+
+    def _update(self, changes):
+        added = {}
+        for hostname, _, fragment in changes:
+            try:
+                blocks = host_samples(hostname, json.loads(fragment))
+            except ValueError as e:
+                logger.warning(f"Unreadable state of {hostname}: {e}")
+                continue
+            position = self._positions.get(hostname)
+            if position is None:
+                added[hostname] = blocks
+                continue
+            for column, block in zip(self._columns, blocks):
+                column[position] = block
+        self.stats["hosts_rendered"] += len(changes)
+        if added:
+            # New hosts shift the order: rebuild the columns once for all of them
+            rows = {hostname: tuple(column[position] for column in self._columns)
+                    for hostname, position in self._positions.items()}
+            rows.update(added)
+            hostnames = sorted(rows)
+            self._positions = {hostname: position for position, hostname in enumerate(hostnames)}
+            self._columns = [[rows[hostname][index] for hostname in hostnames] for index in range(len(FAMILIES))]
+
+    def _assemble(self):
+        parts = []
+        for header, column in zip(HEADERS, self._columns):
+            parts.append(header)
+            parts.extend(column)
+        return b"".join(parts)
+
+    def render(self):
+        """Exposition text of every host, rebuilt only for hosts changed since the previous call"""
+        self.stats["scrapes"] += 1
+        state = (self.cache._instance(), self.cache.generation())
+        body = self._body
+        if body is not None and state == self._state:
+            return body
+        with self._lock:
+            instance, generation = state = (self.cache._instance(), self.cache.generation())
+            if self._body is not None and state == self._state:
+                return self._body
+            if self._state is None or instance != self._state[0] or generation < self._state[1]:
+                self._reset()  # first scrape, or the cache was rebuilt
+                since = 0
+            else:
+                since = self._state[1]
+            changes = self.cache.changes_since(since)
+            self._update(changes)
+            if changes:
+                generation = max(generation, changes[-1][1])
+            self._body = self._assemble()
+            self._state = (instance, generation)
+            self.stats["renders"] += 1
+            return self._body
+
+    def get_stats(self):
+        return {**self.stats, "hosts": len(self._positions)}
@@ -0,0 +1,174 @@
+import os
+import time
+import queue
+import atexit
+import logging
+import threading
+
+import psycopg2
+import psycopg2.pool
+
+from db import insert_reports_batch
+
+logger = logging.getLogger(__name__)
+
+# Ingest configuration
+INGEST_MODE = os.getenv("INGEST_MODE", "sync").lower()  # sync | async
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "500"))
+INGEST_FLUSH_INTERVAL = float(os.getenv("INGEST_FLUSH_INTERVAL", "1.0"))
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "10000"))
+INGEST_RETRY_ATTEMPTS = int(os.getenv("INGEST_RETRY_ATTEMPTS", "3"))
+INGEST_DRAIN_TIMEOUT = float(os.getenv("INGEST_DRAIN_TIMEOUT", "10"))
+
+# Failures of the connection rather than of the reports: the same batch is retried after a backoff.
+# Any other error (DataError, IntegrityError, ...) is deterministic and the batch is split instead.
+TRANSIENT_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError, psycopg2.pool.PoolError)
+
+_STOP = object()
+
+class IngestQueue:
+    """Bounded in-process queue drained by a background batch writer.
+
+    ``submit`` never blocks: when the queue is full it returns False so the
+    caller can push back on the agent. The writer flushes whenever
+    ``batch_size`` reports are buffered or ``flush_interval`` seconds have
+    passed since the first buffered report, whichever comes first.
+    """
+
+    def __init__(self, batch_size=INGEST_BATCH_SIZE, flush_interval=INGEST_FLUSH_INTERVAL,
+                 max_queue=INGEST_QUEUE_SIZE, writer=insert_reports_batch):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.writer = writer
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._stopping = False
+        self.stats = {
+            "accepted": 0,
+            "rejected": 0,
+            "written": 0,
+            "dropped": 0,
+            "batches": 0,
+            "last_batch_size": 0,
+            "last_flush_seconds": 0.0,
+        }
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name="ingest-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def submit(self, data) -> bool:
+        """Queue a validated report; False means the queue is full"""
+        if self._stopping:
+            self.stats["rejected"] += 1
+            return False
+        try:
+            self._queue.put_nowait(data)
+        except queue.Full:
+            self.stats["rejected"] += 1
+            return False
+        self.stats["accepted"] += 1
+        return True
+
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    def get_stats(self):
+        stats = dict(self.stats)
+        stats.update({
+            "queue_depth": self.depth(),
+            "queue_capacity": self._queue.maxsize,
+            "batch_size": self.batch_size,
+            "flush_interval": self.flush_interval,
+        })
+        return stats
+
+    def _collect_batch(self):
+        """Block for the first report, then gather more until the batch is full or due"""
+        first = self._queue.get()
+        if first is _STOP:
+            return [], True
+
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _flush(self, batch):
+        started = time.monotonic()
+        written = self._write(batch)
+        self.stats["written"] += written
+        self.stats["batches"] += 1
+        self.stats["last_batch_size"] = len(batch)
+        self.stats["last_flush_seconds"] = time.monotonic() - started
+
+    def _write(self, batch):
+        """Write ``batch``, dropping only the reports the database rejects; returns the number written"""
+        for attempt in range(INGEST_RETRY_ATTEMPTS):
+            try:
+                self.writer(batch)
+                return len(batch)
+            except TRANSIENT_ERRORS as e:
+                logger.error(f"Batch write failed (Try {attempt + 1}/{INGEST_RETRY_ATTEMPTS}): {e}")
+                if attempt < INGEST_RETRY_ATTEMPTS - 1:
+                    time.sleep(min(2 ** attempt, 5))
+            except Exception as e:
+                if len(batch) == 1:
+                    self.stats["dropped"] += 1
+                    logger.error(f"Dropped report of {batch[0].get('hostname')}: {e}")
+                    return 0
+                # Retrying would fail the same way: bisect to isolate the offending reports
+                logger.warning(f"Batch of {len(batch)} reports rejected, splitting it: {e}")
+                middle = len(batch) // 2
+                return self._write(batch[:middle]) + self._write(batch[middle:])
+
+        self.stats["dropped"] += len(batch)
+        logger.error(f"Dropped {len(batch)} reports after {INGEST_RETRY_ATTEMPTS} failed writes")
+        return 0
+
+    def _run(self):
+        logger.info(
+            f"Ingest writer started (batch_size={self.batch_size}, flush_interval={self.flush_interval}s)"
+        )
+        while True:
+            batch, stop = self._collect_batch()
+            if batch:
+                self._flush(batch)
+            if stop:
+                break
+        logger.info("Ingest writer stopped")
+
+    def stop(self, timeout=INGEST_DRAIN_TIMEOUT):
+        """Stop accepting reports and flush everything already queued"""
+        if self._stopping:
+            return
+        self._stopping = True
+        if not self._thread or not self._thread.is_alive():
+            return
+        logger.info(f"Draining ingest queue ({self.depth()} pending reports)")
+        # The sentinel must not be dropped even when the queue is full
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logger.warning(f"Ingest writer did not drain within {timeout}s")
+
+def create_ingest_queue():
+    """Start a writer when INGEST_MODE=async, otherwise return None"""
+    if INGEST_MODE != "async":
+        return None
+    ingest_queue = IngestQueue()
+    ingest_queue.start()
+    return ingest_queue
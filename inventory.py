@@ -0,0 +1,132 @@
+"""Installed-programs inventory sources for the agent.
+
+Listing installed programs means launching PowerShell, which costs seconds
+of CPU, so the agent refreshes the inventory only on a long TTL or when the
+provider's cheap ``change_token()`` moves. ``StaticInventoryProvider`` stands
+in on Linux and in tests.
+"""
+import abc
+import json
+import logging
+import platform
+import subprocess
+
+try:
+    import winreg
+except ImportError:  # not on Windows
+    winreg = None
+
+logger = logging.getLogger(__name__)
+
+UNINSTALL_KEYS = (
+    "Software\\Wow6432Node\\Microsoft\\Windows\\CurrentVersion\\Uninstall",
+    "Software\\Microsoft\\Windows\\CurrentVersion\\Uninstall",
+)
+
+class InventoryProvider(abc.ABC):
+    """Source of the installed-programs list"""
+
+    @abc.abstractmethod
+    def programs(self):
+        """List of ``{"name": ..., "version": ...}`` dicts"""
+
+    def change_token(self):
+        """Cheap value that changes whenever the inventory may have changed, or None if unknown"""
+        return None
+
+class PowerShellInventoryProvider(InventoryProvider):
+    """Reads the Uninstall registry keys through PowerShell; changes are detected with winreg"""
+
+    def __init__(self, timeout=15):
+        self.timeout = timeout
+
+    def programs(self):
+        try:
+            si = None
+            if platform.system() == "Windows":
+                si = subprocess.STARTUPINFO()
+                si.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+
+            combined = []
+            for key in UNINSTALL_KEYS:
+                reg_path = f"HKLM:\\{key}\\*"
+                result = subprocess.run(
+                    ['powershell', '-Command',
+                    f"Get-ItemProperty {reg_path} | "
+                    "Where-Object { $_.DisplayName -ne $null } | "
+                    "Select-Object DisplayName, DisplayVersion | ConvertTo-Json"],
+                    capture_output=True, text=True, timeout=self.timeout,
+                    startupinfo=si
+                )
+                if result.returncode != 0 or not result.stdout.strip():
+                    continue
+                try:
+                    data = json.loads(result.stdout)
+                    if isinstance(data, dict):
+                        data = [data]
+                    combined.extend(data)
+                except json.JSONDecodeError:
+                    continue
+
+            programs = []
+            for entry in combined:
+                name = (entry.get("DisplayName") or "").strip()
+                version = (entry.get("DisplayVersion") or "Unknown").strip()
+                if name:
+                    programs.append({"name": name, "version": version})
+
+            return programs
+        except Exception as e:
+            logger.error(f"Installed programs info error: {e}")
+            return []
+
+    def change_token(self):
+        """Subkey count and last-write time of each Uninstall key (installs and removals touch both)"""
+        if winreg is None:
+            return None
+        token = []
+        for key in UNINSTALL_KEYS:
+            try:
+                with winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE, key) as handle:
+                    subkeys, _, modified = winreg.QueryInfoKey(handle)
+                token.append((subkeys, modified))
+            except OSError:
+                token.append(None)
+        return tuple(token)
+
+class StaticInventoryProvider(InventoryProvider):
+    """Fixed inventory; ``set_programs`` simulates an install or removal"""
+
+    def __init__(self, programs=None):
+        self._programs = list(programs or [])
+        self._version = 0
+
+    def programs(self):
+        return list(self._programs)
+
+    def change_token(self):
+        return self._version
+
+    def set_programs(self, programs):
+        self._programs = list(programs)
+        self._version += 1
+
+def default_provider():
+    if platform.system() == "Windows":
+        return PowerShellInventoryProvider()
+    return StaticInventoryProvider()
+
+class InventoryProbe:
+    """Collector probe for a provider, with ``changed`` as its change signal"""
+
+    def __init__(self, provider):
+        self.provider = provider
+        self._token = None
+
+    def __call__(self):
+        self._token = self.provider.change_token()
+        return self.provider.programs()
+
+    def changed(self):
+        token = self.provider.change_token()
+        return token is not None and token != self._token
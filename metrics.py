@@ -0,0 +1,346 @@
+"""Prometheus metrics of the server internals, served at /metrics.
+
+Metrics are declared once at import. Recording is an attribute or list
+increment on a pre-created child, without a lock, like the ``stats`` dicts
+of the pool and the ingest queue: under the GIL a racing update can very
+rarely be lost, an accepted trade for monitoring. Values that already live
+elsewhere (pool, queue and stream counters) are read by callbacks at scrape
+time instead of being recorded twice.
+
+Every gunicorn worker writes a snapshot of its metrics to METRICS_DIR every
+METRICS_FLUSH_INTERVAL seconds, and a scrape of any worker sums the
+snapshots of all of them, so counters cover the whole host. Counters of
+exited workers keep counting towards the totals; their gauges are dropped.
+Snapshots are named ``<pid>-<start ms>.json``, so a worker that reuses the
+pid of an exited one does not overwrite its counters.
+"""
+import os
+import json
+import time
+import logging
+import tempfile
+import functools
+import threading
+from bisect import bisect_left
+
+logger = logging.getLogger(__name__)
+
+METRICS_DIR = os.getenv(
+    "METRICS_DIR",
+    os.path.join("/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(), "winperf-metrics")
+)
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "5"))
+METRICS_RETENTION = float(os.getenv("METRICS_RETENTION", str(7 * 86400)))  # snapshots of exited workers
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CPU_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.05)
+
+class CounterValue:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+class HistogramValue:
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # the last one is +Inf
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+class Family:
+    """One metric name; ``labels(*values)`` returns its child for those label values"""
+
+    def __init__(self, name, kind, documentation, labelnames=(), buckets=None, aggregate="sum"):
+        self.name = name
+        self.kind = kind  # counter | gauge | histogram
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = buckets
+        self.aggregate = aggregate  # how gauges of several workers combine: sum | max
+        self.callback = None
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        """Child of these label values; look it up once and keep it on hot paths"""
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.get(values)
+                if child is None:
+                    child = HistogramValue(self.buckets) if self.kind == "histogram" else CounterValue()
+                    self._children[values] = child
+        return child
+
+    def set_function(self, callback):
+        """Read the samples at scrape time: ``callback()`` returns ``{label values tuple: value}``"""
+        self.callback = callback
+
+    def samples(self):
+        if self.callback is not None:
+            try:
+                return {tuple(str(value) for value in key): value for key, value in self.callback().items()}
+            except Exception as e:
+                logger.warning(f"Metric {self.name} unavailable: {e}")
+                return {}
+        if self.kind == "histogram":
+            return {key: {"counts": list(child.counts), "sum": child.sum} for key, child in self._children.items()}
+        return {key: child.value for key, child in self._children.items()}
+
+_families = {}
+
+def _family(name, kind, documentation, labelnames=(), buckets=None, aggregate="sum"):
+    family = Family(name, kind, documentation, labelnames, buckets, aggregate)
+    _families[name] = family
+    return family
+
+def counter(name, documentation, labelnames=()):
+    return _family(name, "counter", documentation, labelnames)
+
+def gauge(name, documentation, labelnames=(), aggregate="sum"):
+    return _family(name, "gauge", documentation, labelnames, aggregate=aggregate)
+
+def histogram(name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+    return _family(name, "histogram", documentation, labelnames, tuple(buckets))
+
+# HTTP
+REQUEST_SECONDS = histogram("winperf_http_request_duration_seconds", "Request handling time by route", ("route",))
+REQUESTS = counter("winperf_http_requests_total", "Requests by route and status class", ("route", "status"))
+
+# Ingest
+INGEST_REPORTS = counter("winperf_ingest_reports_total", "Reports accepted", ("endpoint",))
+INGEST_BYTES = counter("winperf_ingest_bytes_total", "Request body bytes of accepted reports", ("endpoint",))
+DECODE_SECONDS = histogram("winperf_report_decode_seconds", "Report body decompression and parsing time",
+                           buckets=CPU_BUCKETS)
+ENCODE_SECONDS = histogram("winperf_json_encode_seconds", "JSON serialization time", ("document",),
+                           buckets=CPU_BUCKETS)
+
+# Database
+DB_SECONDS = histogram("winperf_db_call_duration_seconds", "Time spent in db.py functions", ("function",))
+DB_ERRORS = counter("winperf_db_call_errors_total", "db.py calls that raised", ("function",))
+
+# Read from their owners at scrape time (set_function in app.py)
+DB_POOL_CONNECTIONS = gauge("winperf_db_pool_connections", "Connections of the pool by state", ("state",))
+DB_POOL_EVENTS = counter("winperf_db_pool_events_total", "Pool checkouts, waits, exhaustion and reconnects",
+                         ("event",))
+INGEST_QUEUE_DEPTH = gauge("winperf_ingest_queue_depth", "Reports waiting for the batch writer")
+INGEST_WRITER = counter("winperf_ingest_writer_reports_total", "Reports by batch writer outcome", ("outcome",))
+STREAM_SUBSCRIBERS = gauge("winperf_stream_subscribers", "Open /api/stream connections")
+STATE_CLIENTS = gauge("winperf_clients", "Hosts in the state cache", aggregate="max")
+RECOMMENDER_EVALUATIONS = counter("winperf_recommender_evaluations_total", "Rule engine evaluation passes")
+
+STATUS_CLASSES = ("1xx", "2xx", "3xx", "4xx", "5xx")
+
+class RouteMetrics:
+    """Pre-created children of one route, so observing a request allocates nothing"""
+
+    __slots__ = ("latency", "statuses")
+
+    def __init__(self, route):
+        self.latency = REQUEST_SECONDS.labels(route)
+        self.statuses = [REQUESTS.labels(route, status) for status in STATUS_CLASSES]
+
+    def observe(self, seconds, status):
+        self.latency.observe(seconds)
+        self.statuses[min(max(status // 100, 1), 5) - 1].inc()
+
+_routes = {}
+
+def route_metrics(route):
+    metrics = _routes.get(route)
+    if metrics is None:
+        metrics = _routes.setdefault(route, RouteMetrics(route))
+    return metrics
+
+def timed(func):
+    """Decorator recording the duration, and failures, of every call of a db.py function"""
+    latency = DB_SECONDS.labels(func.__name__)
+    failures = DB_ERRORS.labels(func.__name__)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            failures.inc()
+            raise
+        finally:
+            latency.observe(time.perf_counter() - started)
+    return wrapper
+
+def snapshot():
+    """This process' samples of every family"""
+    return {
+        name: {
+            "kind": family.kind,
+            "help": family.documentation,
+            "labelnames": family.labelnames,
+            "buckets": family.buckets,
+            "aggregate": family.aggregate,
+            "samples": [[list(key), value] for key, value in family.samples().items()],
+        }
+        for name, family in _families.items()
+    }
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def merge(snapshots):
+    """Combine worker snapshots: counters and histograms add up, gauges of live workers sum or max"""
+    merged = {}
+    for snap, alive in snapshots:
+        for name, family in snap.items():
+            target = merged.setdefault(name, dict(family, samples={}))
+            if family["kind"] == "gauge" and not alive:
+                continue
+            samples = target["samples"]
+            for key, value in family["samples"]:
+                key = tuple(key)
+                previous = samples.get(key)
+                if previous is None:
+                    samples[key] = dict(value, counts=list(value["counts"])) if isinstance(value, dict) else value
+                elif family["kind"] == "histogram":
+                    previous["counts"] = [a + b for a, b in zip(previous["counts"], value["counts"])]
+                    previous["sum"] += value["sum"]
+                elif family["kind"] == "gauge" and family.get("aggregate") == "max":
+                    samples[key] = max(previous, value)
+                else:
+                    samples[key] = previous + value
+    return merged
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)] + list(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def render(families):
+    """Prometheus text exposition of merged families"""
+    lines = []
+    for name, family in families.items():
+        kind, labelnames = family["kind"], family["labelnames"]
+        lines.append(f"# HELP {name} {family['help']}")
+        lines.append(f"# TYPE {name} {kind}")
+        for key, value in sorted(family["samples"].items()):
+            if kind == "histogram":
+                cumulative = 0
+                for bound, count in zip(list(family["buckets"]) + [float("inf")], value["counts"]):
+                    cumulative += count
+                    le = 'le="' + format_value(bound) + '"'
+                    lines.append(f"{name}_bucket{format_labels(labelnames, key, [le])} {cumulative}")
+                lines.append(f"{name}_sum{format_labels(labelnames, key)} {format_value(value['sum'])}")
+                lines.append(f"{name}_count{format_labels(labelnames, key)} {cumulative}")
+            else:
+                lines.append(f"{name}{format_labels(labelnames, key)} {format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+class Exporter:
+    """Writes this worker's snapshot to ``directory`` periodically and merges every worker's on scrape"""
+
+    def __init__(self, directory=METRICS_DIR, interval=METRICS_FLUSH_INTERVAL, retention=METRICS_RETENTION):
+        self.directory = directory
+        self.interval = interval
+        self.retention = retention
+        self._thread = None
+        self._pid = None
+        self._started = None
+        try:
+            os.makedirs(directory, exist_ok=True)
+        except OSError as e:
+            logger.warning(f"Metrics directory {directory} unusable ({e}), exposing this worker only")
+            self.directory = None
+
+    def start(self):
+        # Per process: a thread started before a fork does not run in the children
+        if self.directory is None or (self._pid == os.getpid() and self._thread.is_alive()):
+            return
+        self._pid = os.getpid()
+        self._started = int(time.time() * 1000)
+        self._thread = threading.Thread(target=self._run, name="metrics-flush", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.warning(f"Could not write metrics snapshot: {e}")
+
+    def _filename(self):
+        if self._pid != os.getpid():
+            self._pid, self._started = os.getpid(), int(time.time() * 1000)  # forked without start()
+        return f"{self._pid}-{self._started}.json"
+
+    def flush(self):
+        path = os.path.join(self.directory, self._filename())
+        temporary = f"{path}.tmp"
+        with open(temporary, "w") as f:
+            json.dump(snapshot(), f, separators=(",", ":"))
+        os.replace(temporary, path)
+
+    def _snapshots(self):
+        now = time.time()
+        own = self._filename()
+        files = []
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(".json") or entry.name == own:
+                continue
+            pid, _, started = entry.name[:-5].partition("-")
+            try:
+                files.append((int(pid), int(started), entry))
+            except ValueError:
+                continue  # not a snapshot
+        # Of several files of one pid only the newest can belong to a live worker
+        newest = {}
+        for pid, started, _ in files:
+            newest[pid] = max(started, newest.get(pid, started))
+        for pid, started, entry in files:
+            alive = started == newest[pid] and _alive(pid)
+            try:
+                if not alive and now - entry.stat().st_mtime > self.retention:
+                    os.unlink(entry.path)
+                    continue
+                with open(entry.path) as f:
+                    yield json.load(f), alive
+            except (OSError, ValueError):
+                continue  # being replaced or removed
+
+    def collect(self):
+        """Exposition text of all workers on the host"""
+        self.start()
+        own = snapshot()
+        snapshots = [(own, True)]
+        if self.directory is not None:
+            try:
+                self.flush()
+                snapshots.extend(self._snapshots())
+            except OSError as e:
+                logger.warning(f"Could not read worker metrics: {e}")
+        return render(merge(snapshots))
+
+exporter = Exporter()
@@ -3,6 +3,24 @@ import socket
 import platform
 from datetime import datetime
 
+from collector import MetricsCollector, FixedRateScheduler
+from processes import ProcessTable
+
+
+_collector = None
+_process_table = ProcessTable()
+
+
+def get_collector():
+    """Shared collector; the first call sets the CPU baseline"""
+    global _collector
+    if _collector is None:
+        _collector = MetricsCollector()
+        _collector.register("disk", get_disk_info, default={})
+        _collector.register("network_interfaces", get_network_interfaces, default={})
+        _collector.register("processes", _process_table.sample, default={"cpu": [], "memory": [], "io": []})
+    return _collector
+
 
 def get_system_metrics():
     try:
@@ -12,15 +30,7 @@ def get_system_metrics():
         hostname = platform.node()
         ip = "127.0.0.1"
 
-    cpu_percent = psutil.cpu_percent(interval=1)
-    cpu_count = psutil.cpu_count()
-    cpu_freq = psutil.cpu_freq()
-
-    memory = psutil.virtual_memory()
-    swap = psutil.swap_memory()
-    net_io = psutil.net_io_counters()
-    disks = get_disk_info()
-    process_count = len(psutil.pids())
+    sample = get_collector().collect()
 
     return {
         "timestamp": datetime.now().isoformat(),
@@ -28,32 +38,15 @@ def get_system_metrics():
         "ip": ip,
         "os": f"{platform.system()} {platform.release()}",
         "architecture": platform.architecture()[0],
-        "cpu": {
-            "percent": cpu_percent,
-            "count": cpu_count,
-            "frequency": cpu_freq._asdict() if cpu_freq else None
-        },
-        "memory": {
-            "percent": memory.percent,
-            "total": memory.total,
-            "available": memory.available,
-            "used": memory.used,
-            "free": memory.free
-        },
-        "swap": {
-            "percent": swap.percent,
-            "total": swap.total,
-            "used": swap.used,
-            "free": swap.free
-        },
-        "network": {
-            "total_sent": net_io.bytes_sent,
-            "total_recv": net_io.bytes_recv,
-            "interfaces": get_network_interfaces()
-        },
-        "disk": disks,
-        "process_count": process_count,
-        "top_processes": get_top_processes()
+        "cpu": sample["cpu"],
+        "memory": sample["memory"],
+        "swap": sample["swap"],
+        "network": {**sample["network_totals"], "interfaces": sample["network_interfaces"]},
+        "disk": sample["disk"],
+        "process_count": sample["process_count"],
+        "top_processes": sample["processes"]["cpu"],
+        "top_memory_processes": sample["processes"]["memory"],
+        "top_io_processes": sample["processes"]["io"]
     }
 
 
@@ -94,24 +87,15 @@ def get_disk_info():
 
 
 def get_top_processes(limit=5):
-    processes = []
-    for p in psutil.process_iter(['name', 'cpu_percent']):
-        try:
-            name = p.info['name'] or "Unknown"
-            cpu = p.info['cpu_percent']
-            if name.lower() != "system idle process":
-                processes.append({'name': name, 'cpu': cpu})
-        except (psutil.NoSuchProcess, psutil.AccessDenied):
-            continue
-    sorted_procs = sorted(processes, key=lambda x: x['cpu'], reverse=True)[:limit]
-    return sorted_procs
+    """Top processes by CPU over the collector's last interval (none before its second sample)"""
+    return _process_table.top(limit, "cpu")
 
 
 if __name__ == '__main__':
     import json
-    import time
 
-    while True:
+    get_collector()
+    scheduler = FixedRateScheduler(10)
+    while scheduler.wait():
         metrics = get_system_metrics()
         print(json.dumps(metrics, indent=2))
-        time.sleep(10)
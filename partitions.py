@@ -0,0 +1,116 @@
+import os
+import re
+import logging
+from datetime import datetime, timedelta, timezone
+
+logger = logging.getLogger(__name__)
+
+# Partitioning configuration
+PARTITION_INTERVAL = os.getenv("REPORTS_PARTITION_INTERVAL", "daily").lower()  # daily | weekly
+PARTITION_PREMAKE = int(os.getenv("REPORTS_PARTITION_PREMAKE", "7"))  # future partitions kept ready
+
+DEFAULT_PARTITION = "reports_default"
+
+_BOUND_RE = re.compile(r"FROM \('([^']+)'\) TO \('([^']+)'\)")
+
+def _parse_bound(value):
+    # Postgres renders offsets as "+00"; older fromisoformat() wants "+00:00"
+    if re.search(r"[+-]\d\d$", value):
+        value += ":00"
+    return datetime.fromisoformat(value)
+
+def partition_start(moment, interval=PARTITION_INTERVAL):
+    """UTC start of the partition period containing ``moment``"""
+    moment = moment.astimezone(timezone.utc) if moment.tzinfo else moment.replace(tzinfo=timezone.utc)
+    start = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    if interval == "weekly":
+        start -= timedelta(days=start.weekday())
+    return start
+
+def partition_step(interval=PARTITION_INTERVAL):
+    return timedelta(weeks=1) if interval == "weekly" else timedelta(days=1)
+
+def partition_name(start):
+    return f"reports_p{start:%Y%m%d}"
+
+def is_partitioned(cur, table="reports"):
+    """True when ``table`` exists as a declaratively partitioned table"""
+    cur.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", (table,))
+    row = cur.fetchone()
+    return bool(row) and row["relkind"] == "p"
+
+def list_partitions(cur):
+    """Range partitions of `reports` as (name, lower, upper), oldest first"""
+    cur.execute("""
+        SELECT c.relname AS name, pg_get_expr(c.relpartbound, c.oid) AS bound
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'reports'::regclass
+    """)
+    partitions = []
+    for row in cur.fetchall():
+        match = _BOUND_RE.search(row["bound"] or "")
+        if not match:
+            continue  # the DEFAULT partition
+        lower, upper = (_parse_bound(value) for value in match.groups())
+        partitions.append((row["name"], lower, upper))
+    return sorted(partitions, key=lambda p: p[1])
+
+def create_partition(cur, start, interval=PARTITION_INTERVAL):
+    """Create the partition for the period starting at ``start`` if it is missing.
+
+    Rows already routed to the default partition for that range would make
+    CREATE fail, so the attempt runs in a savepoint and is skipped on error.
+    """
+    end = start + partition_step(interval)
+    name = partition_name(start)
+    cur.execute("SAVEPOINT create_partition")
+    try:
+        cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS {name} PARTITION OF reports
+            FOR VALUES FROM (%s) TO (%s)
+        """, (start, end))
+        cur.execute("RELEASE SAVEPOINT create_partition")
+        return True
+    except Exception as e:
+        cur.execute("ROLLBACK TO SAVEPOINT create_partition")
+        logger.warning(f"Could not create partition {name}: {e}")
+        return False
+
+def ensure_partitions(cur, since=None, ahead=PARTITION_PREMAKE, interval=PARTITION_INTERVAL):
+    """Make sure partitions exist from ``since`` (default: now) up to ``ahead`` periods ahead"""
+    cur.execute(f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF reports DEFAULT")
+
+    existing = {name for name, _, _ in list_partitions(cur)}
+    now = datetime.now(timezone.utc)
+    start = partition_start(since or now, interval)
+    last = partition_start(now, interval) + partition_step(interval) * ahead
+
+    created = 0
+    while start <= last:
+        if partition_name(start) not in existing and create_partition(cur, start, interval):
+            created += 1
+        start += partition_step(interval)
+    if created:
+        logger.info(f"Created {created} report partitions")
+    return created
+
+def drop_partitions_before(cur, cutoff):
+    """Detach and drop every partition whose whole range is older than ``cutoff``.
+
+    Returns the dropped partition names. Stray old rows in the default
+    partition are deleted, which stays cheap because only out-of-range data
+    lands there.
+    """
+    dropped = []
+    for name, _, upper in list_partitions(cur):
+        if upper > cutoff:
+            break
+        cur.execute(f"ALTER TABLE reports DETACH PARTITION {name}")
+        cur.execute(f"DROP TABLE {name}")
+        dropped.append(name)
+
+    cur.execute(f"DELETE FROM {DEFAULT_PARTITION} WHERE timestamp < %s", (cutoff,))
+    if dropped:
+        logger.info(f"Dropped {len(dropped)} expired report partitions")
+    return dropped
@@ -0,0 +1,211 @@
+"""Persistent process table for top-process reporting.
+
+psutil's per-call ``cpu_percent`` is 0.0 the first time a Process object is
+asked, so a fresh ``process_iter`` every tick mostly reports noise.
+``ProcessTable`` keeps one entry per process, keyed by ``(pid, create_time)``
+so a reused PID starts a new entry, and derives CPU, RSS and IO rates from
+the counter deltas between two ticks. Process objects, names and access
+checks are only set up for newly seen PIDs and entries are dropped when their
+PID disappears, so the setup work per tick follows process churn.
+
+A tick reads only the CPU times of every process. Memory and IO counters are
+read for at most ``detail`` processes per ranking: new processes, the CPU
+leaders of this tick, the memory and IO leaders of the previous one, and the
+``detail`` entries read longest ago, so every value is refreshed within
+``processes / detail`` ticks.
+
+A table must be updated by a single caller at a fixed rate (the collector's
+``processes`` probe); other readers use ``top()``, which never updates.
+"""
+import time
+import heapq
+import logging
+import threading
+
+import psutil
+
+logger = logging.getLogger(__name__)
+
+# Never worth listing (on Windows this is the idle time of all cores)
+IGNORED_NAMES = {"system idle process"}
+
+class ProcessEntry:
+    __slots__ = ("process", "pid", "name", "cpu_time", "rss", "io_bytes", "read_at",
+                 "cpu_percent", "rss_delta", "io_rate", "denied")
+
+    def __init__(self, process, name):
+        self.process = process
+        self.pid = process.pid
+        self.name = name
+        self.cpu_time = None
+        self.rss = None
+        self.io_bytes = None
+        self.read_at = None  # clock of the last memory and IO read
+        self.cpu_percent = None  # None until two samples exist
+        self.rss_delta = None
+        self.io_rate = None
+        self.denied = False
+
+    def as_dict(self):
+        return {
+            "pid": self.pid,
+            "name": self.name,
+            "cpu": round(self.cpu_percent or 0.0, 1),
+            "memory_rss": self.rss,
+            "rss_delta": self.rss_delta,
+            "io_rate": round(self.io_rate, 1) if self.io_rate is not None else None,
+        }
+
+class ProcessTable:
+    """Processes keyed by ``(pid, create_time)`` with per-tick CPU, RSS and IO deltas"""
+
+    def __init__(self, clock=time.monotonic, detail=16):
+        self.clock = clock
+        self.detail = detail
+        self.entries = {}  # (pid, create_time) -> ProcessEntry
+        self._by_pid = {}  # pid -> key
+        self._last_update = None
+        self._lock = threading.Lock()
+        self.stats = {"processes": 0, "added": 0, "evicted": 0, "denied": 0, "detail_reads": 0}
+
+    def _add(self, pid):
+        denied = False
+        try:
+            process = psutil.Process(pid)
+            try:
+                key = (pid, process.create_time())
+            except psutil.AccessDenied:
+                # Protected system process: listed by name, counters skipped
+                key, denied = (pid, None), True
+            name = process.name() or "Unknown"
+        except (psutil.Error, OSError):
+            return None
+
+        entry = ProcessEntry(process, name)
+        entry.denied = denied
+        self.entries[key] = entry
+        self._by_pid[pid] = key
+        self.stats["added"] += 1
+        self.stats["denied"] += 1 if denied else 0
+        return key
+
+    def _evict(self, pid):
+        key = self._by_pid.pop(pid, None)
+        if key is not None and self.entries.pop(key, None) is not None:
+            self.stats["evicted"] += 1
+
+    def update(self):
+        """Take one sample of every live process"""
+        with self._lock:
+            self._update()
+        return self
+
+    def _update(self):
+        now = self.clock()
+        elapsed = now - self._last_update if self._last_update is not None else None
+        self._last_update = now
+
+        pids = set(psutil.pids())
+        for pid in set(self._by_pid) - pids:
+            self._evict(pid)
+        for pid in pids - set(self._by_pid):
+            self._add(pid)
+
+        sampled = []
+        for pid, key in list(self._by_pid.items()):
+            entry = self.entries[key]
+            if entry.denied:
+                continue
+            try:
+                cpu_times = entry.process.cpu_times()
+            except psutil.AccessDenied:
+                entry.denied = True
+                self.stats["denied"] += 1
+                continue
+            except (psutil.NoSuchProcess, psutil.ZombieProcess, OSError):
+                self._evict(pid)
+                continue
+
+            cpu_time = cpu_times.user + cpu_times.system
+            if entry.cpu_time is not None and cpu_time < entry.cpu_time:
+                # Counters went backwards: the PID was reused between two ticks. The counters just
+                # read are the new process', so they are its first sample.
+                self._evict(pid)
+                key = self._add(pid)
+                if key is not None:
+                    entry = self.entries[key]
+                    entry.cpu_time = cpu_time
+                    sampled.append(entry)
+                continue
+
+            if elapsed and entry.cpu_time is not None:
+                entry.cpu_percent = (cpu_time - entry.cpu_time) / elapsed * 100.0
+            entry.cpu_time = cpu_time
+            sampled.append(entry)
+
+        for entry in self._detail_candidates(sampled):
+            self._read_details(entry, now)
+
+        self.stats["processes"] = len(self.entries)
+
+    def _detail_candidates(self, sampled):
+        """Entries whose memory and IO counters are read this tick"""
+        if len(sampled) <= self.detail:
+            return sampled
+        chosen = {id(entry): entry for entry in sampled if entry.read_at is None}
+        rankings = (
+            heapq.nlargest(self.detail, sampled, key=lambda entry: entry.cpu_percent or 0.0),
+            heapq.nlargest(self.detail, sampled, key=lambda entry: entry.rss or 0),
+            heapq.nlargest(self.detail, sampled, key=lambda entry: entry.io_rate or 0.0),
+            heapq.nsmallest(self.detail, sampled, key=lambda entry: entry.read_at or 0.0),
+        )
+        for ranking in rankings:
+            chosen.update((id(entry), entry) for entry in ranking)
+        return chosen.values()
+
+    def _read_details(self, entry, now):
+        try:
+            with entry.process.oneshot():
+                rss = entry.process.memory_info().rss
+                try:
+                    io = entry.process.io_counters()
+                    io_bytes = io.read_bytes + io.write_bytes
+                except (psutil.AccessDenied, AttributeError, NotImplementedError):
+                    io_bytes = None
+        except psutil.AccessDenied:
+            return
+        except (psutil.NoSuchProcess, psutil.ZombieProcess, OSError):
+            self._evict(entry.pid)
+            return
+
+        self.stats["detail_reads"] += 1
+        if entry.read_at is not None:
+            entry.rss_delta = rss - entry.rss
+            if io_bytes is not None and entry.io_bytes is not None and now > entry.read_at:
+                entry.io_rate = max(io_bytes - entry.io_bytes, 0) / (now - entry.read_at)
+        entry.rss, entry.io_bytes, entry.read_at = rss, io_bytes, now
+
+    def _listed(self):
+        return (entry for entry in self.entries.values() if entry.name.lower() not in IGNORED_NAMES)
+
+    def top(self, n=5, by="cpu"):
+        """``n`` processes with the highest ``cpu``, ``memory`` or ``io`` at the last update, as dicts"""
+        with self._lock:
+            return self._top(n, by)
+
+    def _top(self, n, by):
+        if by == "memory":
+            candidates = [entry for entry in self._listed() if entry.rss is not None]
+            key = lambda entry: entry.rss
+        elif by == "io":
+            candidates = [entry for entry in self._listed() if entry.io_rate is not None]
+            key = lambda entry: entry.io_rate
+        else:
+            candidates = [entry for entry in self._listed() if entry.cpu_percent is not None]
+            key = lambda entry: entry.cpu_percent
+        return [entry.as_dict() for entry in heapq.nlargest(n, candidates, key=key)]
+
+    def sample(self, n=5):
+        """Update, then return the top ``n`` by CPU, memory and IO"""
+        self.update()
+        return {"cpu": self.top(n, "cpu"), "memory": self.top(n, "memory"), "io": self.top(n, "io")}
@@ -0,0 +1,257 @@
+"""Report protocol and wire encodings shared by the agent and the server.
+
+Version 1 is a plain metrics document per POST. Version 2 wraps reports in
+sequenced messages so the agent can send only what changed:
+
+    {"protocol": 2, "type": "full", "hostname": h, "seq": n, "data": {...}}
+    {"protocol": 2, "type": "delta", "hostname": h, "seq": n, "base_seq": n - 1,
+     "changes": {...}, "removed": [["path", "to", "key"], ...]}
+
+``changes`` is merged recursively into the last acknowledged document:
+a dict merges into an existing dict, every other value replaces it. The
+server answers 409 with ``{"status": "resync"}`` when ``base_seq`` does not
+match its snapshot, and the agent falls back to a full message.
+
+Bodies may be JSON, msgpack or CBOR (the binary formats use the fixed
+FIELD_IDS as map keys), optionally compressed with gzip or zstd. The server
+lists what it accepts in every report response; agents start with plain JSON
+and upgrade to the best common format.
+"""
+
+import gzip
+import json
+import zlib
+
+try:
+    import msgpack
+except ImportError:  # optional: binary encoding
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:  # optional: binary encoding
+    cbor2 = None
+
+try:
+    import zstandard
+except ImportError:  # optional: compression
+    zstandard = None
+
+PROTOCOL_VERSION = 2
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+CBOR = "application/cbor"
+
+GZIP = "gzip"
+ZSTD = "zstd"
+IDENTITY = "identity"
+
+# Largest accepted decompressed report body
+MAX_DECODED_SIZE = 16 * 1024 * 1024
+
+# Fixed field IDs used as map keys in the binary encodings. IDs must never be
+# reused: append new names at the end. Keys not listed stay strings, so
+# device, interface and process names pass through unchanged.
+FIELD_NAMES = (
+    "hostname", "ip", "os", "architecture", "uptime", "timestamp",
+    "cpu", "memory", "swap", "network", "disk", "installed_programs",
+    "agent_version", "top_processes", "status", "process_count",
+    "percent", "count", "frequency", "current", "min", "max",
+    "total", "available", "used", "free",
+    "total_sent", "total_recv", "interfaces",
+    "bytes_sent", "bytes_recv", "packets_sent", "packets_recv",
+    "mountpoint", "fstype", "name", "version",
+    "protocol", "type", "seq", "base_seq", "data", "changes", "removed",
+    "collected_at", "disk_partitions", "network_interfaces",
+    "top_memory_processes", "top_io_processes", "pid", "memory_rss", "rss_delta", "io_rate",
+)
+FIELD_IDS = {name: index for index, name in enumerate(FIELD_NAMES, 1)}
+
+class UnsupportedEncoding(ValueError):
+    """Raised for a content type or encoding this side cannot handle"""
+
+def supported_content_types():
+    """Body formats available here, most compact first"""
+    types = []
+    if msgpack is not None:
+        types.append(MSGPACK)
+    if cbor2 is not None:
+        types.append(CBOR)
+    types.append(JSON)
+    return types
+
+def supported_content_encodings():
+    """Compression schemes available here, preferred first"""
+    encodings = []
+    if zstandard is not None:
+        encodings.append(ZSTD)
+    encodings.append(GZIP)
+    encodings.append(IDENTITY)
+    return encodings
+
+def negotiate(server_types, server_encodings):
+    """Best (content_type, content_encoding) both sides support"""
+    content_type = next((t for t in supported_content_types() if t in (server_types or ())), JSON)
+    content_encoding = next(
+        (e for e in supported_content_encodings() if e in (server_encodings or ())), IDENTITY
+    )
+    return content_type, content_encoding
+
+def _to_field_ids(value):
+    if isinstance(value, dict):
+        return {FIELD_IDS.get(key, key): _to_field_ids(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_to_field_ids(item) for item in value]
+    return value
+
+def _from_field_ids(value):
+    if isinstance(value, dict):
+        return {
+            (FIELD_NAMES[key - 1] if isinstance(key, int) and 0 < key <= len(FIELD_NAMES) else key):
+                _from_field_ids(item)
+            for key, item in value.items()
+        }
+    if isinstance(value, list):
+        return [_from_field_ids(item) for item in value]
+    return value
+
+def encode_body(document, content_type=JSON, content_encoding=IDENTITY):
+    """Serialize and compress a report message"""
+    if content_type == JSON:
+        body = json.dumps(document, separators=(",", ":")).encode("utf-8")
+    elif content_type == MSGPACK and msgpack is not None:
+        body = msgpack.packb(_to_field_ids(document), use_bin_type=True)
+    elif content_type == CBOR and cbor2 is not None:
+        body = cbor2.dumps(_to_field_ids(document))
+    else:
+        raise UnsupportedEncoding(f"Unsupported content type: {content_type}")
+
+    if content_encoding in (None, "", IDENTITY):
+        return body
+    if content_encoding == GZIP:
+        return gzip.compress(body, compresslevel=6)
+    if content_encoding == ZSTD and zstandard is not None:
+        return zstandard.ZstdCompressor(level=3).compress(body)
+    raise UnsupportedEncoding(f"Unsupported content encoding: {content_encoding}")
+
+def _decompress(body, content_encoding):
+    if content_encoding in (None, "", IDENTITY):
+        return body
+    if content_encoding == GZIP:
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        data = decompressor.decompress(body, MAX_DECODED_SIZE + 1)
+    elif content_encoding == ZSTD and zstandard is not None:
+        with zstandard.ZstdDecompressor().stream_reader(body) as reader:
+            data = reader.read(MAX_DECODED_SIZE + 1)
+    else:
+        raise UnsupportedEncoding(f"Unsupported content encoding: {content_encoding}")
+    if len(data) > MAX_DECODED_SIZE:
+        raise ValueError("Decoded report body too large")
+    return data
+
+def decode_body(body, content_type=JSON, content_encoding=IDENTITY):
+    """Decompress and parse a report message sent with ``encode_body``"""
+    content_type = (content_type or JSON).split(";")[0].strip().lower()
+    content_encoding = (content_encoding or IDENTITY).strip().lower()
+    data = _decompress(body, content_encoding)
+
+    if content_type == JSON:
+        return json.loads(data)
+    if content_type == MSGPACK and msgpack is not None:
+        return _from_field_ids(msgpack.unpackb(data, raw=False, strict_map_key=False))
+    if content_type == CBOR and cbor2 is not None:
+        return _from_field_ids(cbor2.loads(data))
+    raise UnsupportedEncoding(f"Unsupported content type: {content_type}")
+
+def diff_documents(old, new):
+    """Return ``(changes, removed)`` that turn ``old`` into ``new``"""
+    changes, removed = {}, []
+    _diff(old, new, (), changes, removed)
+    return changes, removed
+
+def _diff(old, new, path, changes, removed):
+    for key, value in new.items():
+        if key not in old:
+            changes[key] = value
+        elif isinstance(value, dict) and isinstance(old[key], dict):
+            nested = {}
+            _diff(old[key], value, path + (key,), nested, removed)
+            if nested:
+                changes[key] = nested
+        elif old[key] != value:
+            changes[key] = value
+
+    for key in old:
+        if key not in new:
+            removed.append(list(path + (key,)))
+
+def apply_delta(base, changes, removed=()):
+    """Apply a delta without mutating ``base``; unchanged subtrees are shared"""
+    result = _merge(base, changes)
+    for path in removed:
+        result = _remove(result, list(path))
+    return result
+
+def _merge(base, changes):
+    result = dict(base)
+    for key, value in changes.items():
+        if isinstance(value, dict) and isinstance(base.get(key), dict):
+            result[key] = _merge(base[key], value)
+        else:
+            result[key] = value
+    return result
+
+def _remove(document, path):
+    if not path or not isinstance(document, dict) or path[0] not in document:
+        return document
+    result = dict(document)
+    if len(path) == 1:
+        del result[path[0]]
+    else:
+        result[path[0]] = _remove(document[path[0]], path[1:])
+    return result
+
+def full_message(data, seq):
+    return {
+        "protocol": PROTOCOL_VERSION,
+        "type": "full",
+        "hostname": data.get("hostname"),
+        "seq": seq,
+        "data": data,
+    }
+
+def delta_message(base, data, base_seq):
+    changes, removed = diff_documents(base, data)
+    return {
+        "protocol": PROTOCOL_VERSION,
+        "type": "delta",
+        "hostname": data.get("hostname"),
+        "seq": base_seq + 1,
+        "base_seq": base_seq,
+        "changes": changes,
+        "removed": removed,
+    }
+
+def resolve_message(message, load_snapshot):
+    """Turn a protocol message into a full report document.
+
+    ``load_snapshot(hostname, seq)`` returns the last reconstructed document
+    of the host (carrying its ``seq``), preferring one at sequence ``seq``, or
+    None. Returns None when a delta does not apply and the agent has to resync.
+    """
+    if message.get("protocol") != PROTOCOL_VERSION:
+        return message
+
+    hostname = message["hostname"]
+    if message.get("type") == "delta":
+        base = load_snapshot(hostname, message.get("base_seq"))
+        if not base or base.get("seq") != message.get("base_seq"):
+            return None
+        data = apply_delta(base, message.get("changes") or {}, message.get("removed") or [])
+    else:
+        data = dict(message.get("data") or {})
+
+    data["hostname"] = hostname
+    data["seq"] = message.get("seq")
+    return data
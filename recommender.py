@@ -1,4 +1,75 @@
+"""Recommendation rules evaluated over sliding windows of recent samples.
+
+Rules are declarative (see DEFAULT_RULES and ``load_rules``): a metric, a
+comparison, a threshold and optionally a duration ("CPU > 85% for 5 min").
+Process rules watch one process name in the top-process lists. Overrides
+change a rule's threshold, duration or enabled flag per host (fnmatch
+patterns).
+
+``RecommendationEngine`` keeps the last ``window_slots`` samples of every
+host in NumPy ring buffers (one row per host) and evaluates each rule for
+all hosts at once. ``RecommenderRunner`` feeds it from the state cache and
+publishes the results as state cache annotations, in one background thread
+per server host, elected with ``LeaderLock``.
+"""
+import os
+import json
+import math
+import time
+import fnmatch
+import logging
+import operator
+import tempfile
+import threading
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # not on POSIX: every process leads
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+RECOMMENDER_ENABLED = os.getenv("RECOMMENDER_ENABLED", "1") == "1"
+RECOMMENDER_RULES = os.getenv("RECOMMENDER_RULES")  # JSON rules file, default rules when unset
+RECOMMENDER_INTERVAL = float(os.getenv("RECOMMENDER_INTERVAL", "5"))
+RECOMMENDER_WINDOW_SLOTS = int(os.getenv("RECOMMENDER_WINDOW_SLOTS", "90"))  # 15 min of 10s reports
+RECOMMENDER_REPORT_INTERVAL = float(os.getenv("RECOMMENDER_REPORT_INTERVAL", "10"))  # shortest agent interval
+RECOMMENDER_STALE_AFTER = float(os.getenv("RECOMMENDER_STALE_AFTER", "120"))
+RECOMMENDER_LOCK_PATH = os.getenv(
+    "RECOMMENDER_LOCK_PATH",
+    os.path.join("/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(), "winperf-recommender.lock")
+)
+
+OPERATORS = {">": operator.gt, ">=": operator.ge, "<": operator.lt, "<=": operator.le}
+
+# Same advice as the original per-report checks, which fired on a single sample
+DEFAULT_RULES = {
+    "rules": [
+        {
+            "name": "high_cpu", "metric": "cpu", "op": ">", "threshold": 85,
+            "message": "High CPU usage detected ({value:g}%). Consider closing '{top_process}' if not needed."
+        },
+        {
+            "name": "high_memory", "metric": "memory", "op": ">", "threshold": 85,
+            "message": "Memory usage is high ({value:g}%). Try restarting heavy applications."
+        },
+        {
+            "name": "high_disk", "metric": "disk", "op": ">", "threshold": 90,
+            "message": "Disk usage is very high ({value:g}%). Consider cleaning temporary files or uninstalling unused apps."
+        },
+    ],
+    "overrides": {}
+}
+
+# Host metrics a rule can watch; process rules watch cpu, memory_rss or io_rate of a process
+HOST_METRICS = ("cpu", "memory", "swap", "disk", "process_count")
+PROCESS_METRICS = ("cpu", "memory_rss", "io_rate")
+PROCESS_LISTS = ("top_processes", "top_memory_processes", "top_io_processes")
+
 def get_recommendations(metrics, top_procs):
+    """Single-sample checks on one report (the default rules without durations)"""
     recs = []
 
     if metrics['cpu'] > 85:
@@ -12,3 +83,355 @@ def get_recommendations(metrics, top_procs):
         recs.append(f"Disk usage is very high ({metrics['disk']}%). Consider cleaning temporary files or uninstalling unused apps.")
 
     return recs
+
+class Rule:
+    """One declarative rule; ``duration`` is in seconds (0: the latest sample decides)"""
+
+    __slots__ = ("name", "metric", "process", "op", "threshold", "duration", "message", "series")
+
+    def __init__(self, name, metric, op=">", threshold=0.0, duration=0.0, message=None, process=None):
+        if op not in OPERATORS:
+            raise ValueError(f"Rule {name}: unknown operator '{op}'")
+        if process is None and metric not in HOST_METRICS:
+            raise ValueError(f"Rule {name}: unknown metric '{metric}'")
+        if process is not None and metric not in PROCESS_METRICS:
+            raise ValueError(f"Rule {name}: unknown process metric '{metric}'")
+        self.name = name
+        self.metric = metric
+        self.process = process
+        self.op = op
+        self.threshold = float(threshold)
+        self.duration = float(duration)
+        self.message = message or f"{name}: {metric} {op} {{threshold:g}} (now {{value:g}})"
+        self.series = f"process:{process.lower()}:{metric}" if process else metric
+
+    @classmethod
+    def from_dict(cls, spec):
+        return cls(
+            name=spec["name"],
+            metric=spec["metric"],
+            op=spec.get("op", ">"),
+            threshold=spec["threshold"],
+            duration=spec.get("for", 0),
+            message=spec.get("message"),
+            process=spec.get("process"),
+        )
+
+def load_rules(path=RECOMMENDER_RULES):
+    """``(rules, overrides)`` from a JSON rules file, or the defaults"""
+    config = DEFAULT_RULES
+    if path:
+        with open(path, "r", encoding="utf-8") as f:
+            config = json.load(f)
+    return [Rule.from_dict(spec) for spec in config.get("rules", [])], config.get("overrides", {})
+
+def required_slots(rules, overrides=None, report_interval=RECOMMENDER_REPORT_INTERVAL):
+    """Samples a host's buffer must hold to span the longest ``for`` of ``rules`` and ``overrides``"""
+    durations = [rule.duration for rule in rules]
+    durations += [
+        float(override["for"])
+        for rule_overrides in (overrides or {}).values() for override in rule_overrides.values()
+        if "for" in override
+    ]
+    return math.ceil(max(durations, default=0.0) / report_interval) + 1
+
+def _format_duration(seconds):
+    if seconds >= 3600:
+        return f"{seconds / 3600:g} h"
+    if seconds >= 60:
+        return f"{seconds / 60:g} min"
+    return f"{seconds:g} s"
+
+def _disk_percent(disk):
+    percents = [volume.get("percent", 0) for volume in disk.values() if isinstance(volume, dict)]
+    return max(percents) if percents else None
+
+def _section_percent(data, key):
+    section = data.get(key)
+    return section.get("percent") if isinstance(section, dict) else None
+
+def host_values(data):
+    """Host metric values of one report (None when missing)"""
+    disk = data.get("disk")
+    return {
+        "cpu": _section_percent(data, "cpu"),
+        "memory": _section_percent(data, "memory"),
+        "swap": _section_percent(data, "swap"),
+        "disk": _disk_percent(disk) if isinstance(disk, dict) else None,
+        "process_count": data.get("process_count"),
+    }
+
+class RecommendationEngine:
+    """Ring buffers of recent samples per host and vectorized rule evaluation.
+
+    ``times`` and every series in ``values`` are ``(hosts, window_slots)``
+    arrays; row ``i`` belongs to host ``hostnames[i]`` and ``positions[i]``
+    is the slot its next sample goes to. Missing values are NaN, which no
+    comparison satisfies, so a gap ends a duration. The window is widened to
+    cover the longest rule duration at ``report_interval``; a shorter one
+    could never hold a sample old enough and the rule would never fire.
+    """
+
+    def __init__(self, rules, overrides=None, window_slots=RECOMMENDER_WINDOW_SLOTS,
+                 stale_after=RECOMMENDER_STALE_AFTER, report_interval=RECOMMENDER_REPORT_INTERVAL):
+        self.rules = list(rules)
+        self.overrides = overrides or {}
+        needed = required_slots(self.rules, self.overrides, report_interval)
+        if window_slots < needed:
+            logger.warning(f"Window of {window_slots} samples is shorter than the longest rule duration "
+                           f"at {report_interval:g}s reports, keeping {needed}")
+            window_slots = needed
+        self.window_slots = window_slots
+        self.stale_after = stale_after
+        self.hostnames = []
+        self._index = {}  # hostname -> row
+        self._last_epoch = {}  # hostname -> epoch of the last observed sample
+        self._top_process = []  # row -> name of the top CPU process in the last sample
+        self._series = sorted({rule.series for rule in self.rules})
+        self._capacity = 0
+        self.times = np.empty((0, window_slots))
+        self.values = {series: np.empty((0, window_slots), dtype=np.float32) for series in self._series}
+        self.positions = np.empty(0, dtype=np.int64)
+        self._thresholds = {}  # rule name -> (hosts,) thresholds
+        self._durations = {}  # rule name -> (hosts,) durations
+        self._enabled = {}  # rule name -> (hosts,) bool
+        self._lock = threading.Lock()
+
+    def _grow(self):
+        capacity = max(self._capacity * 2, 64)
+        extra = capacity - self._capacity
+
+        def pad(array, fill):
+            return np.concatenate([array, np.full((extra,) + array.shape[1:], fill, dtype=array.dtype)])
+
+        self.times = pad(self.times, np.nan)
+        self.values = {series: pad(array, np.nan) for series, array in self.values.items()}
+        self.positions = pad(self.positions, 0)
+        for rule in self.rules:
+            self._thresholds[rule.name] = pad(self._thresholds.get(rule.name, np.empty(0)), rule.threshold)
+            self._durations[rule.name] = pad(self._durations.get(rule.name, np.empty(0)), rule.duration)
+            self._enabled[rule.name] = pad(self._enabled.get(rule.name, np.empty(0, dtype=bool)), True)
+        self._capacity = capacity
+
+    def _apply_overrides(self, row, hostname):
+        for pattern, rule_overrides in self.overrides.items():
+            if not fnmatch.fnmatchcase(hostname.lower(), pattern.lower()):
+                continue
+            for name, override in rule_overrides.items():
+                if name not in self._thresholds:
+                    continue
+                if "threshold" in override:
+                    self._thresholds[name][row] = override["threshold"]
+                if "for" in override:
+                    self._durations[name][row] = override["for"]
+                if "enabled" in override:
+                    self._enabled[name][row] = bool(override["enabled"])
+
+    def _row(self, hostname):
+        row = self._index.get(hostname)
+        if row is None:
+            row = len(self.hostnames)
+            if row >= self._capacity:
+                self._grow()
+            self.hostnames.append(hostname)
+            self._top_process.append("unknown")
+            self._index[hostname] = row
+            self._apply_overrides(row, hostname)
+        return row
+
+    def _process_value(self, data, process, metric):
+        values = [
+            entry.get(metric)
+            for key in PROCESS_LISTS for entry in data.get(key) or ()
+            if isinstance(entry, dict) and fnmatch.fnmatchcase(str(entry.get("name", "")).lower(), process)
+            and entry.get(metric) is not None
+        ]
+        return max(values) if values else None
+
+    def observe(self, data, epoch=None):
+        """Record one report; returns False for a sample already seen (same host and time)"""
+        hostname = data.get("hostname")
+        epoch = float(epoch if epoch is not None else data.get("last_seen") or time.time())
+        if not hostname or self._last_epoch.get(hostname) == epoch:
+            return False
+
+        metrics = host_values(data)
+        with self._lock:
+            row = self._row(hostname)
+            slot = self.positions[row]
+            self.times[row, slot] = epoch
+            for series, array in self.values.items():
+                if series.startswith("process:"):
+                    _, process, metric = series.split(":", 2)
+                    value = self._process_value(data, process, metric)
+                else:
+                    value = metrics.get(series)
+                array[row, slot] = np.nan if value is None else value
+            self.positions[row] = (slot + 1) % self.window_slots
+            top = data.get("top_processes") or []
+            self._top_process[row] = top[0].get("name", "unknown") if top and isinstance(top[0], dict) else "unknown"
+            self._last_epoch[hostname] = epoch
+        return True
+
+    def evaluate(self, now=None):
+        """``{hostname: [recommendation, ...]}`` for every known host"""
+        now = time.time() if now is None else now
+        with self._lock:
+            hosts = len(self.hostnames)
+            if not hosts:
+                return {}
+            times = self.times[:hosts]
+            rows = np.arange(hosts)
+            latest_slot = (self.positions[:hosts] - 1) % self.window_slots
+            latest_time = times[rows, latest_slot]
+            oldest_time = np.where(np.isnan(times), np.inf, times).min(axis=1)
+            fresh = latest_time >= now - self.stale_after  # NaN (no sample) compares False
+
+            results = {hostname: [] for hostname in self.hostnames}
+            for rule in self.rules:
+                values = self.values[rule.series][:hosts]
+                threshold = self._thresholds[rule.name][:hosts]
+                duration = self._durations[rule.name][:hosts]
+                compare = OPERATORS[rule.op]
+                latest = values[rows, latest_slot]
+
+                # Every sample of the last `duration` seconds breaches, and the buffer reaches back that far
+                window = times >= (now - duration)[:, None]
+                breach = compare(values, threshold[:, None])
+                sustained = np.all(breach | ~window, axis=1) & (oldest_time <= now - duration)
+                firing = self._enabled[rule.name][:hosts] & fresh & compare(latest, threshold) \
+                    & np.where(duration > 0, sustained, True)
+
+                for row in np.nonzero(firing)[0]:
+                    results[self.hostnames[row]].append(self._message(rule, row, latest[row], threshold[row],
+                                                                     duration[row]))
+            return results
+
+    def _message(self, rule, row, value, threshold, duration):
+        try:
+            return rule.message.format(
+                host=self.hostnames[row],
+                value=round(float(value), 1),
+                threshold=float(threshold),
+                duration=_format_duration(float(duration)),
+                process=rule.process or "",
+                top_process=self._top_process[row],
+            )
+        except (KeyError, IndexError, ValueError) as e:
+            logger.warning(f"Bad message template in rule {rule.name}: {e}")
+            return f"{rule.name}: {rule.metric} {rule.op} {threshold:g}"
+
+    def get_stats(self):
+        with self._lock:
+            return {"rules": len(self.rules), "hosts": len(self.hostnames), "window_slots": self.window_slots}
+
+class LeaderLock:
+    """Exclusive advisory lock on a file: one holder among the processes of a host"""
+
+    def __init__(self, path=RECOMMENDER_LOCK_PATH):
+        self.path = path
+        self._file = None
+
+    def acquire(self):
+        """Try to become leader without blocking; True if this process holds the lock"""
+        if self._file is not None:
+            return True
+        if fcntl is None:
+            self._file = True
+            return True
+        handle = open(self.path, "a")
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            handle.close()
+            return False
+        self._file = handle
+        return True
+
+    def release(self):
+        if self._file not in (None, True):
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+        self._file = None
+
+    @property
+    def held(self):
+        return self._file is not None
+
+class RecommenderRunner:
+    """Feeds the engine from the state cache and publishes results as annotations.
+
+    Only the process holding the leader lock evaluates; the others retry the
+    lock every ``retry_interval`` seconds and take over when the leader exits.
+    """
+
+    def __init__(self, cache, engine, interval=RECOMMENDER_INTERVAL, lock=None, retry_interval=30.0):
+        self.cache = cache
+        self.engine = engine
+        self.interval = interval
+        self.lock = lock or LeaderLock()
+        self.retry_interval = retry_interval
+        self._published = {}  # hostname -> last published recommendations
+        self._instance = None  # state cache instance the generation below belongs to
+        self._generation = 0
+        self._thread = None
+        self._stop = threading.Event()
+        self.stats = {"evaluations": 0, "published": 0, "last_evaluation_ms": 0.0}
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="recommender", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self.lock.release()
+
+    def _ingest(self):
+        instance = self.cache._instance()
+        if instance != self._instance:
+            # New or rebuilt cache: read every host again, its annotations are gone
+            self._instance, self._generation = instance, 0
+            self._published.clear()
+        for _, generation, fragment in self.cache.changes_since(self._generation):
+            self.engine.observe(json.loads(fragment))
+            self._generation = generation
+
+    def tick(self, now=None):
+        """Feed new reports, evaluate all hosts and publish the hosts whose recommendations changed"""
+        started = time.perf_counter()
+        self._ingest()
+        results = self.engine.evaluate(now)
+        for hostname, recommendations in results.items():
+            if hostname not in self._published:
+                # First look at this host: a previous leader may already have published the same
+                self._published[hostname] = self.cache.annotations(hostname).get("recommendations", [])
+            if self._published[hostname] == recommendations:
+                continue
+            if self.cache.annotate(hostname, {"recommendations": recommendations}) is not None:
+                self._published[hostname] = recommendations
+                self.stats["published"] += 1
+        self.stats["evaluations"] += 1
+        self.stats["last_evaluation_ms"] = round((time.perf_counter() - started) * 1000.0, 2)
+
+    def _run(self):
+        while not self._stop.is_set():
+            if not self.lock.acquire():
+                self._stop.wait(self.retry_interval)
+                continue
+            try:
+                self.tick()
+            except Exception as e:
+                logger.error(f"Recommendation evaluation failed: {e}")
+            self._stop.wait(self.interval)
+
+    def get_stats(self):
+        return {**self.stats, **self.engine.get_stats(), "leader": self.lock.held}
+
+def start_recommender(cache):
+    """Background rule evaluation over ``cache``, or None when disabled"""
+    if not RECOMMENDER_ENABLED:
+        return None
+    rules, overrides = load_rules()
+    return RecommenderRunner(cache, RecommendationEngine(rules, overrides)).start()
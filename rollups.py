@@ -0,0 +1,237 @@
+import os
+import math
+from datetime import datetime, timezone
+
+# Rollup resolutions (name -> bucket width in seconds), finest first
+RESOLUTIONS = {"1m": 60, "5m": 300, "1h": 3600}
+
+# How long each rollup resolution is kept, in days
+ROLLUP_RETENTION_DAYS = {
+    "1m": int(os.getenv("ROLLUP_RETENTION_1M_DAYS", "2")),
+    "5m": int(os.getenv("ROLLUP_RETENTION_5M_DAYS", "14")),
+    "1h": int(os.getenv("ROLLUP_RETENTION_1H_DAYS", "400")),
+}
+
+# Expected seconds between two reports of one agent, used to estimate raw point counts
+REPORT_INTERVAL = float(os.getenv("AGENT_REPORT_INTERVAL", "10"))
+DEFAULT_MAX_POINTS = int(os.getenv("HISTORY_MAX_POINTS", "1000"))
+
+# Closed buckets recomputed by each fleet rollup refresh; older late reports need an explicit refresh
+FLEET_REFRESH_LOOKBACK_HOURS = float(os.getenv("FLEET_REFRESH_LOOKBACK_HOURS", "6"))
+
+# Percentages use 50 linear bins of 2%; byte rates use log2 bins (bin i holds [2^i, 2^(i+1)))
+PERCENT_BINS = 50
+RATE_BINS = 48
+
+# metric -> histogram kind
+METRICS = {
+    "cpu": "percent",
+    "memory": "percent",
+    "disk": "percent",
+    "net_sent": "rate",
+    "net_recv": "rate",
+}
+
+def bucket_start(epoch, seconds):
+    return datetime.fromtimestamp(epoch - epoch % seconds, tz=timezone.utc)
+
+def hist_bin(value, kind):
+    if kind == "percent":
+        return min(max(int(value / (100.0 / PERCENT_BINS)), 0), PERCENT_BINS - 1)
+    if value < 1:
+        return 0
+    return min(int(math.log2(value)), RATE_BINS - 1)
+
+def hist_size(kind):
+    return PERCENT_BINS if kind == "percent" else RATE_BINS
+
+def bin_value(index, kind):
+    """Representative value (bin midpoint) of histogram bin ``index``"""
+    if kind == "percent":
+        width = 100.0 / PERCENT_BINS
+        return (index + 0.5) * width
+    if index == 0:
+        return 1.0
+    return 1.5 * 2 ** index
+
+def bin_bounds(index, kind):
+    """``(lower, upper)`` of histogram bin ``index``; the first rate bin also holds values below 1"""
+    if kind == "percent":
+        width = 100.0 / PERCENT_BINS
+        return index * width, (index + 1) * width
+    return (0.0 if index == 0 else float(2 ** index)), float(2 ** (index + 1))
+
+def merge_histograms(hists):
+    """Element-wise sum of histograms (None entries are skipped)"""
+    merged = None
+    for hist in hists:
+        if not hist:
+            continue
+        if merged is None:
+            merged = list(hist)
+        else:
+            merged = [a + b for a, b in zip(merged, hist)]
+    return merged
+
+def hist_percentile(hist, q, kind, lower=None, upper=None):
+    """Approximate the ``q`` quantile (0..1) from a histogram, clamped to the known min/max"""
+    total = sum(hist or ())
+    if not total:
+        return None
+    rank = q * total
+    seen = 0
+    value = bin_value(len(hist) - 1, kind)
+    for index, count in enumerate(hist):
+        seen += count
+        if count and seen >= rank:
+            value = bin_value(index, kind)
+            break
+    if lower is not None:
+        value = max(value, lower)
+    if upper is not None:
+        value = min(value, upper)
+    return value
+
+def choose_resolution(hours, max_points=DEFAULT_MAX_POINTS, report_interval=REPORT_INTERVAL):
+    """Finest resolution whose point count for ``hours`` fits in ``max_points``.
+
+    Returns "raw" when the raw samples already fit, otherwise the first rollup
+    that does, falling back to the coarsest one.
+    """
+    span = hours * 3600
+    if span / report_interval <= max_points:
+        return "raw"
+    for name, seconds in RESOLUTIONS.items():
+        if span / seconds <= max_points:
+            return name
+    return list(RESOLUTIONS)[-1]
+
+def window_resolution(hours, max_buckets=24):
+    """Finest rollup resolution covering ``hours`` in at most ``max_buckets`` buckets per host"""
+    span = hours * 3600
+    for name, seconds in RESOLUTIONS.items():
+        if span / seconds <= max_buckets:
+            return name
+    return list(RESOLUTIONS)[-1]
+
+class RateTracker:
+    """Turn monotonically increasing byte counters into per-second rates per host"""
+
+    def __init__(self):
+        self._last = {}  # hostname -> (epoch, sent, recv)
+
+    def seed(self, hostname, epoch, sent, recv):
+        if epoch is not None and sent is not None and recv is not None:
+            self._last[hostname] = (epoch, sent, recv)
+
+    def update(self, hostname, epoch, sent, recv):
+        """Return (sent_rate, recv_rate); None for the first sample or after a counter reset"""
+        previous = self._last.get(hostname)
+        if sent is None or recv is None:
+            return None, None
+        self._last[hostname] = (epoch, sent, recv)
+        if previous is None:
+            return None, None
+
+        elapsed = epoch - previous[0]
+        if elapsed <= 0 or sent < previous[1] or recv < previous[2]:
+            return None, None
+        return (sent - previous[1]) / elapsed, (recv - previous[2]) / elapsed
+
+class RollupAccumulator:
+    """Merge samples into (resolution, hostname, bucket) aggregates before writing.
+
+    Aggregates are associative, so the accumulator can be flushed at any time
+    and merged into existing rows with an upsert.
+    """
+
+    def __init__(self):
+        self.buckets = {}
+
+    def add(self, hostname, epoch, values):
+        for name, seconds in RESOLUTIONS.items():
+            key = (name, hostname, bucket_start(epoch, seconds))
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                bucket = self.buckets[key] = {"samples": 0}
+            bucket["samples"] += 1
+
+            for metric, kind in METRICS.items():
+                value = values.get(metric)
+                if value is None:
+                    continue
+                stats = bucket.get(metric)
+                if stats is None:
+                    stats = bucket[metric] = {
+                        "min": value, "max": value, "sum": 0.0, "count": 0,
+                        "hist": [0] * hist_size(kind)
+                    }
+                stats["min"] = min(stats["min"], value)
+                stats["max"] = max(stats["max"], value)
+                stats["sum"] += value
+                stats["count"] += 1
+                stats["hist"][hist_bin(value, kind)] += 1
+
+    def rows(self, resolution):
+        """Rows for one resolution table: hostname, bucket, samples, then per metric min/max/sum/count/hist"""
+        for (name, hostname, bucket), data in self.buckets.items():
+            if name != resolution:
+                continue
+            row = [hostname, bucket, data["samples"]]
+            for metric in METRICS:
+                stats = data.get(metric)
+                if stats is None:
+                    row.extend([None, None, 0.0, 0, None])
+                else:
+                    row.extend([stats["min"], stats["max"], stats["sum"], stats["count"], stats["hist"]])
+            yield tuple(row)
+
+    def clear(self):
+        self.buckets.clear()
+
+    def __len__(self):
+        return len(self.buckets)
+
+def summarize_bucket(row):
+    """Turn a rollup row into the history API shape (avg/min/max/p95 per metric)"""
+    point = {"timestamp": row["bucket"].isoformat(), "samples": row["samples"]}
+    for metric, kind in METRICS.items():
+        count = row[f"{metric}_count"]
+        if not count:
+            point.update({f"{metric}_avg": None, f"{metric}_min": None,
+                          f"{metric}_max": None, f"{metric}_p95": None})
+            continue
+        lower, upper = row[f"{metric}_min"], row[f"{metric}_max"]
+        point.update({
+            f"{metric}_avg": row[f"{metric}_sum"] / count,
+            f"{metric}_min": lower,
+            f"{metric}_max": upper,
+            f"{metric}_p95": hist_percentile(row[f"{metric}_hist"], 0.95, kind, lower, upper),
+        })
+    # Keys understood by existing history consumers
+    point["cpu_percent"] = point["cpu_avg"] or 0
+    point["memory_percent"] = point["memory_avg"] or 0
+    return point
+
+def summarize_fleet_bucket(row, metric, quantiles=(0.5, 0.95, 0.99)):
+    """Turn a fleet aggregate row of ``metric`` into avg/min/max and the requested percentiles"""
+    kind = METRICS[metric]
+    count = int(row[f"{metric}_count"] or 0)
+    point = {"timestamp": row["bucket"].isoformat(), "hosts": row["hosts"], "samples": int(row["samples"])}
+    lower, upper = row[f"{metric}_min"], row[f"{metric}_max"]
+    point.update({
+        "avg": float(row[f"{metric}_sum"]) / count if count else None,
+        "min": lower,
+        "max": upper,
+    })
+    for q in quantiles:
+        point[f"p{q * 100:g}"] = hist_percentile(row[f"{metric}_hist"], q, kind, lower, upper) if count else None
+    return point
+
+def histogram_bins(hist, kind):
+    """Non-empty bins of a histogram as ``{"lower", "upper", "count"}``"""
+    return [
+        {"lower": lower, "upper": upper, "count": count}
+        for (lower, upper), count in ((bin_bounds(index, kind), count) for index, count in enumerate(hist or ()))
+        if count
+    ]
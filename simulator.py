@@ -0,0 +1,443 @@
+"""Headless fleet simulator for capacity tests.
+
+Every virtual agent owns a ``VirtualHost`` whose reports have the shape of
+``SystemMonitor.get_metrics`` (CPU, memory, swap, per-volume disks,
+per-interface counters, top processes, installed programs) with synthetic
+values that drift per host: mean-reverting CPU with occasional spikes, slow
+memory leaks on some hosts, filling disks and growing network counters.
+Agents speak the real report protocol (a full snapshot, then deltas; a 409
+forces a full resend) over one shared aiohttp session.
+
+Scenarios on top of the steady reporting rate:
+
+- ``--burst-at``: every agent reports at the same instant, e.g. after a
+  fleet-wide wake from sleep or a config push.
+- ``--storm-at``: the server "restarts": all connections are dropped, and
+  every agent reconnects and resends a full snapshot within
+  ``--storm-jitter`` seconds.
+
+    python simulator.py --agents 5000 --interval 10 --duration 120
+    python simulator.py --agents 10000 --processes 4 --burst-at 30 --storm-at 60 --json run.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+from collections import Counter
+from datetime import datetime
+from multiprocessing import Pool
+
+import aiohttp
+
+from protocol import JSON, IDENTITY, encode_body, full_message, delta_message
+
+logger = logging.getLogger(__name__)
+
+GIB = 1024 ** 3
+HOST_PREFIX = "sim"
+AGENT_VERSION = "1.0.1"
+FULL_SNAPSHOT_INTERVAL = 360  # reports between full snapshots, as agent_config.json's default
+
+PROCESS_NAMES = (
+    "chrome.exe", "msedge.exe", "explorer.exe", "svchost.exe", "Teams.exe", "OUTLOOK.EXE", "WINWORD.EXE",
+    "EXCEL.EXE", "MsMpEng.exe", "OneDrive.exe", "sqlservr.exe", "java.exe", "python.exe", "code.exe",
+    "SearchIndexer.exe", "dwm.exe", "spoolsv.exe", "w3wp.exe", "slack.exe", "zoom.exe",
+)
+PROGRAM_NAMES = (
+    "Google Chrome", "Microsoft Edge", "Microsoft 365 Apps", "7-Zip", "Notepad++", "Adobe Acrobat Reader",
+    "Zoom", "Slack", "Visual Studio Code", "Git", "Python 3.12", "Java 17 Runtime", "VLC media player",
+    "Microsoft Teams", "WinRAR", "Mozilla Firefox", "PuTTY", "FileZilla", "Node.js", "Docker Desktop",
+)
+
+def _clamp(value, low=0.0, high=100.0):
+    return min(max(value, low), high)
+
+class VirtualHost:
+    """One simulated Windows machine; ``metrics()`` advances it to now and returns a report"""
+
+    def __init__(self, index, seed=0, prefix=HOST_PREFIX):
+        self.rng = rng = random.Random(seed * 1_000_003 + index)
+        self.hostname = f"{prefix}-{index:05d}"
+        self.ip = f"10.{index // 65536 % 256}.{index // 256 % 256}.{index % 256}"
+        self.cores = rng.choice((2, 4, 8, 16))
+        self.memory_total = rng.choice((8, 16, 32, 64)) * GIB
+        self.swap_total = self.memory_total // 2
+
+        self.cpu_mean = rng.lognormvariate(2.7, 0.6)  # median ~15%, a few busy hosts
+        self.cpu = self.cpu_mean
+        self.memory = rng.uniform(30, 70)
+        self.memory_leak = rng.uniform(0.002, 0.01) if rng.random() < 0.1 else 0.0  # percent per second
+        self.swap = rng.uniform(0, 10)
+
+        self.disks = {"C:": [rng.choice((256, 512, 1024)) * GIB, 0]}
+        if rng.random() < 0.4:
+            self.disks["D:"] = [rng.choice((1024, 2048)) * GIB, 0]
+        for disk in self.disks.values():
+            disk[1] = int(disk[0] * rng.uniform(0.3, 0.85))
+        self.disk_fill_rate = rng.uniform(0, 20_000)  # bytes per second
+
+        self.send_rate = rng.lognormvariate(9, 1.5)  # bytes per second, median ~8 KB/s
+        self.recv_rate = self.send_rate * rng.uniform(2, 10)
+        self.interfaces = {
+            "Ethernet": [rng.randint(0, 10 ** 10), rng.randint(0, 10 ** 11), 0, 0],
+            "Loopback Pseudo-Interface 1": [0, 0, 0, 0],
+        }
+        self.processes = rng.sample(PROCESS_NAMES, 10)
+        self.pids = {name: rng.randint(100, 30000) for name in self.processes}
+        self.process_count = rng.randint(90, 250)
+        self.programs = [
+            {"name": name, "version": f"{rng.randint(1, 120)}.{rng.randint(0, 9)}.{rng.randint(0, 999)}"}
+            for name in rng.sample(PROGRAM_NAMES, rng.randint(8, len(PROGRAM_NAMES)))
+        ]
+        self.boot_time = time.time() - rng.uniform(3600, 30 * 86400)
+        self.last = time.time()
+
+    def _advance(self, now):
+        rng = self.rng
+        elapsed = max(now - self.last, 0.0)
+        self.last = now
+
+        self.cpu = _clamp(self.cpu + 0.3 * (self.cpu_mean - self.cpu) + rng.gauss(0, 4))
+        if rng.random() < 0.02:
+            self.cpu = _clamp(self.cpu + rng.uniform(30, 70))  # short spike
+        self.memory = _clamp(self.memory + self.memory_leak * elapsed + rng.gauss(0, 0.5), 5, 99)
+        self.swap = _clamp(self.swap + rng.gauss(0, 0.2) + (0.05 if self.memory > 90 else -0.01))
+        for disk in self.disks.values():
+            disk[1] = min(disk[0], disk[1] + int(self.disk_fill_rate * elapsed * rng.uniform(0, 2)))
+        if rng.random() < 0.01:
+            self.process_count = max(40, self.process_count + rng.randint(-10, 10))
+
+        interface = self.interfaces["Ethernet"]
+        sent = int(self.send_rate * elapsed * rng.lognormvariate(0, 0.5))
+        recv = int(self.recv_rate * elapsed * rng.lognormvariate(0, 0.5))
+        interface[0] += sent
+        interface[1] += recv
+        interface[2] += sent // 1200
+        interface[3] += recv // 1200
+
+    def _process(self, name, cpu):
+        return {
+            "pid": self.pids[name],
+            "name": name,
+            "cpu": round(cpu, 1),
+            "memory_rss": self.rng.randint(20, 1500) * 1024 * 1024,
+            "rss_delta": self.rng.randint(-5, 5) * 1024 * 1024,
+            "io_rate": round(self.rng.uniform(0, 500_000), 1),
+        }
+
+    def metrics(self, now=None):
+        now = time.time() if now is None else now
+        self._advance(now)
+        rng = self.rng
+
+        busiest = rng.sample(self.processes, 5)
+        shares = sorted((rng.random() for _ in busiest), reverse=True)
+        top_processes = [self._process(name, self.cpu * share / 2) for name, share in zip(busiest, shares)]
+        memory_used = int(self.memory_total * self.memory / 100)
+        swap_used = int(self.swap_total * self.swap / 100)
+        interfaces = {
+            name: {"bytes_sent": sent, "bytes_recv": recv, "packets_sent": packets_sent, "packets_recv": packets_recv}
+            for name, (sent, recv, packets_sent, packets_recv) in self.interfaces.items()
+        }
+        uptime = int(now - self.boot_time)
+
+        return {
+            "timestamp": datetime.fromtimestamp(now).isoformat(),
+            "hostname": self.hostname,
+            "ip": self.ip,
+            "os": "Windows 10",
+            "architecture": "64bit",
+            "uptime": f"{uptime // 86400} days, {uptime % 86400 // 3600}:{uptime % 3600 // 60:02d}:{uptime % 60:02d}",
+            "cpu": {"percent": round(self.cpu, 1), "count": self.cores,
+                    "frequency": {"current": 2900.0, "min": 0.0, "max": 2900.0}},
+            "memory": {"percent": round(self.memory, 1), "total": self.memory_total,
+                       "available": self.memory_total - memory_used, "used": memory_used,
+                       "free": self.memory_total - memory_used},
+            "swap": {"percent": round(self.swap, 1), "total": self.swap_total, "used": swap_used,
+                     "free": self.swap_total - swap_used},
+            "network": {
+                "total_sent": sum(interface[0] for interface in self.interfaces.values()),
+                "total_recv": sum(interface[1] for interface in self.interfaces.values()),
+                "interfaces": interfaces,
+            },
+            "disk": {
+                device: {"mountpoint": f"{device}\\", "fstype": "NTFS", "total": total, "used": used,
+                         "free": total - used, "percent": used / total * 100}
+                for device, (total, used) in self.disks.items()
+            },
+            "agent_version": AGENT_VERSION,
+            "top_processes": top_processes,
+            "top_memory_processes": sorted(top_processes, key=lambda p: p["memory_rss"], reverse=True),
+            "top_io_processes": sorted(top_processes, key=lambda p: p["io_rate"], reverse=True),
+            "status": "ok",
+            "process_count": self.process_count,
+            "collected_at": {"disk_partitions": self.boot_time, "network_interfaces": self.boot_time,
+                             "installed_programs": self.boot_time},
+            "installed_programs": self.programs,
+        }
+
+class PhaseStats:
+    """Outcome of every report sent during one scenario phase"""
+
+    def __init__(self):
+        self.latencies = []  # seconds, successful reports only
+        self.outcomes = Counter()  # "200", "503", "ClientConnectorError", ...
+        self.bytes_sent = 0
+        self.first = None
+        self.last = None
+
+    def record(self, started, latency, outcome, size):
+        if outcome == "200":
+            self.latencies.append(latency)
+        self.outcomes[outcome] += 1
+        self.bytes_sent += size
+        self.first = started if self.first is None else min(self.first, started)
+        self.last = max(self.last or started, started + latency)
+
+    def merge(self, other):
+        self.latencies.extend(other.latencies)
+        self.outcomes.update(other.outcomes)
+        self.bytes_sent += other.bytes_sent
+        if other.first is not None:
+            self.first = other.first if self.first is None else min(self.first, other.first)
+            self.last = max(self.last or other.last, other.last)
+
+    def summary(self):
+        sent = sum(self.outcomes.values())
+        ok = self.outcomes["200"]
+        elapsed = max((self.last or 0) - (self.first or 0), 1e-9)
+        latencies = sorted(self.latencies)
+
+        def percentile(q):
+            return round(latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000, 1) if latencies else None
+
+        return {
+            "sent": sent,
+            "ok": ok,
+            "reports_per_s": round(ok / elapsed, 1) if sent else 0.0,
+            "mb_per_s": round(self.bytes_sent / elapsed / 1e6, 2) if sent else 0.0,
+            "p50_ms": percentile(0.5),
+            "p90_ms": percentile(0.9),
+            "p99_ms": percentile(0.99),
+            "max_ms": round(latencies[-1] * 1000, 1) if latencies else None,
+            "error_rate": round((sent - ok) / sent, 4) if sent else 0.0,
+            "errors": {outcome: count for outcome, count in self.outcomes.items() if outcome != "200"},
+        }
+
+class Fleet:
+    """Shared session, scenario clock and per-phase statistics of one process' agents"""
+
+    def __init__(self, url, token, content_type=JSON, content_encoding=IDENTITY, timeout=10.0):
+        self.url = url
+        self.headers = {"Authorization": f"Bearer {token}", "Content-Type": content_type}
+        if content_encoding != IDENTITY:
+            self.headers["Content-Encoding"] = content_encoding
+        self.content_type = content_type
+        self.content_encoding = content_encoding
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.session = None
+        self.phase = "steady"
+        self.generation = 0  # bumped by every reconnect storm
+        self.jitter = 0.0
+        self._wakeup = asyncio.Event()
+        self.stats = {}
+
+    def open_session(self):
+        return aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=0), timeout=self.timeout)
+
+    async def wait(self, delay):
+        """Sleep ``delay`` seconds or until the next scenario pulse"""
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), delay)
+        except asyncio.TimeoutError:
+            pass
+
+    def pulse(self, phase, jitter=0.0):
+        """Wake every agent now (they spread over ``jitter`` seconds)"""
+        self.phase, self.jitter = phase, jitter
+        wakeup, self._wakeup = self._wakeup, asyncio.Event()
+        wakeup.set()
+
+    async def storm(self, jitter):
+        """Drop every connection and make each agent start over with a full snapshot"""
+        old, self.session = self.session, self.open_session()
+        self.generation += 1
+        self.pulse("storm", jitter)
+        await old.close()
+
+    def record(self, phase, started, latency, outcome, size):
+        self.stats.setdefault(phase, PhaseStats()).record(started, latency, outcome, size)
+
+class VirtualAgent:
+    """Report loop of one ``VirtualHost``, with the agent's full/delta protocol state"""
+
+    def __init__(self, host, fleet, interval, delta=True):
+        self.host = host
+        self.fleet = fleet
+        self.interval = interval
+        self.delta = delta
+        self.acked_seq = 0
+        self.acked_snapshot = None
+        self.reports_since_full = 0
+        self.generation = fleet.generation
+
+    def build_message(self, data):
+        if not self.delta:
+            return data
+        if self.acked_snapshot is None or self.reports_since_full >= FULL_SNAPSHOT_INTERVAL:
+            return full_message(data, self.acked_seq + 1)
+        return delta_message(self.acked_snapshot, data, self.acked_seq)
+
+    def acknowledge(self, message, data):
+        if message is data:
+            return
+        self.acked_seq = message["seq"]
+        self.acked_snapshot = data
+        self.reports_since_full = 0 if message["type"] == "full" else self.reports_since_full + 1
+
+    async def send(self, data):
+        message = self.build_message(data)
+        body = encode_body(message, self.fleet.content_type, self.fleet.content_encoding)
+        phase = self.fleet.phase
+        started_wall, started = time.time(), time.perf_counter()
+        try:
+            async with self.fleet.session.post(self.fleet.url, data=body, headers=self.fleet.headers) as response:
+                await response.read()
+                outcome = str(response.status)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            outcome = type(e).__name__
+        self.fleet.record(phase, started_wall, time.perf_counter() - started, outcome, len(body))
+
+        if outcome == "200":
+            self.acknowledge(message, data)
+        elif outcome == "409":
+            self.acked_snapshot = None  # server lost our snapshot: full resend next time
+        return outcome
+
+    async def run(self, deadline):
+        rng = self.host.rng
+        await self.fleet.wait(rng.uniform(0, self.interval))  # agents boot at random phases
+        while time.monotonic() < deadline:
+            if self.fleet.generation != self.generation:
+                # Reconnect storm: the restarted agent has no acknowledged snapshot
+                self.generation = self.fleet.generation
+                self.acked_snapshot = None
+            if self.fleet.jitter:
+                await asyncio.sleep(rng.uniform(0, self.fleet.jitter))
+            started = time.monotonic()
+            if await self.send(self.host.metrics()) == "409":
+                await self.send(self.host.metrics())
+            await self.fleet.wait(max(0.0, self.interval - (time.monotonic() - started)))
+
+async def run_fleet(url, token, indices, interval, duration, delta=True, content_type=JSON,
+                    content_encoding=IDENTITY, burst_at=None, storm_at=None, storm_jitter=5.0, seed=0,
+                    start_at=None):
+    """Drive one agent per host index for ``duration`` seconds; returns ``{phase: PhaseStats}``"""
+    fleet = Fleet(url, token, content_type, content_encoding)
+    fleet.session = fleet.open_session()
+    agents = [VirtualAgent(VirtualHost(index, seed), fleet, interval, delta) for index in indices]
+    if start_at is not None:
+        await asyncio.sleep(max(0.0, start_at - time.time()))  # line up with the other processes
+    started = time.monotonic()
+
+    async def scenario():
+        events = sorted(
+            (at, name) for at, name in ((burst_at, "burst"), (storm_at, "storm")) if at is not None
+        )
+        for at, name in events:
+            await asyncio.sleep(max(0.0, started + at - time.monotonic()))
+            if name == "burst":
+                fleet.pulse("burst")
+            else:
+                await fleet.storm(storm_jitter)
+            # The phase lasts one reporting interval, long enough for every agent to have reported
+            await asyncio.sleep(interval + fleet.jitter)
+            fleet.phase, fleet.jitter = "steady", 0.0
+
+    control = asyncio.create_task(scenario())
+    try:
+        await asyncio.gather(*(agent.run(started + duration) for agent in agents))
+    finally:
+        control.cancel()
+        await fleet.session.close()
+    return fleet.stats
+
+def _run_shard(options):
+    return asyncio.run(run_fleet(**options))
+
+def simulate(url, token, agents, processes=1, **options):
+    """Run ``agents`` virtual agents split over ``processes`` processes; returns ``{phase: PhaseStats}``"""
+    start_at = time.time() + 1 + 0.0005 * agents / max(processes, 1)  # time to build the hosts
+    shards = [
+        dict(options, url=url, token=token, indices=range(shard, agents, processes), start_at=start_at)
+        for shard in range(processes)
+    ]
+    if processes == 1:
+        results = [_run_shard(shards[0])]
+    else:
+        with Pool(processes) as pool:
+            results = pool.map(_run_shard, shards)
+
+    merged = {}
+    for stats in results:
+        for phase, phase_stats in stats.items():
+            merged.setdefault(phase, PhaseStats()).merge(phase_stats)
+    return merged
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate a fleet of agents against /api/report")
+    parser.add_argument("--url", default="http://127.0.0.1:5000/api/report", help="report endpoint")
+    parser.add_argument("--token", default=os.getenv("API_SECRET_TOKEN", ""),
+                        help="bearer token (default: $API_SECRET_TOKEN)")
+    parser.add_argument("--agents", type=int, default=1000, help="virtual agents (default: 1000)")
+    parser.add_argument("--interval", type=float, default=10, help="seconds between reports (default: 10)")
+    parser.add_argument("--duration", type=float, default=60, help="seconds to run (default: 60)")
+    parser.add_argument("--processes", type=int, default=1, help="client processes to spread agents over")
+    parser.add_argument("--full", action="store_true", help="send plain full reports instead of deltas")
+    parser.add_argument("--content-type", default=JSON, help="body format (default: application/json)")
+    parser.add_argument("--content-encoding", default=IDENTITY, help="identity, gzip or zstd")
+    parser.add_argument("--burst-at", type=float, help="seconds in: every agent reports at once")
+    parser.add_argument("--storm-at", type=float, help="seconds in: drop all connections, full resend")
+    parser.add_argument("--storm-jitter", type=float, default=5.0,
+                        help="seconds over which storm reconnects spread (default: 5)")
+    parser.add_argument("--seed", type=int, default=0, help="fleet seed; the same seed gives the same hosts")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    logger.info(f"Simulating {args.agents} agents every {args.interval}s for {args.duration}s against {args.url}")
+    stats = simulate(
+        args.url, args.token, args.agents, processes=args.processes, interval=args.interval,
+        duration=args.duration, delta=not args.full, content_type=args.content_type,
+        content_encoding=args.content_encoding, burst_at=args.burst_at, storm_at=args.storm_at,
+        storm_jitter=args.storm_jitter, seed=args.seed
+    )
+
+    total = PhaseStats()
+    for phase_stats in stats.values():
+        total.merge(phase_stats)
+    summaries = {phase: phase_stats.summary() for phase, phase_stats in stats.items()}
+    summaries["total"] = total.summary()
+
+    print(f"{'phase':<7} {'sent':>8} {'ok':>8} {'reports/s':>10} {'MB/s':>6} {'p50 ms':>8} {'p90 ms':>8} "
+          f"{'p99 ms':>8} {'max ms':>8} {'errors':>7}")
+    for phase, summary in summaries.items():
+        print(f"{phase:<7} {summary['sent']:>8} {summary['ok']:>8} {summary['reports_per_s']:>10} "
+              f"{summary['mb_per_s']:>6} {summary['p50_ms']!s:>8} {summary['p90_ms']!s:>8} "
+              f"{summary['p99_ms']!s:>8} {summary['max_ms']!s:>8} {summary['error_rate']:>7.2%}")
+    for phase, summary in summaries.items():
+        if summary["errors"]:
+            print(f"{phase} errors: " + ", ".join(f"{outcome} x{count}" for outcome, count in summary["errors"].items()))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"agents": args.agents, "interval": args.interval, "duration": args.duration,
+                       "phases": summaries}, f, indent=2)
+    return 0 if summaries["total"]["ok"] else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,217 @@
+"""Bounded on-disk buffer for reports the agent could not deliver.
+
+Records are appended to numbered segment files as
+
+    <length: uint32 LE> <crc32: uint32 LE> <payload: UTF-8 JSON>
+
+and read back in order from a cursor kept in a small sidecar file that is
+replaced atomically. A crash can at worst leave a torn record at the end of
+the active segment; it fails its length or CRC check and is cut off when the
+spool is reopened. When the spool grows past ``max_bytes`` the oldest
+segments are deleted, so the buffer keeps the most recent data.
+"""
+import os
+import json
+import zlib
+import struct
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+HEADER = struct.Struct("<II")
+SEGMENT_PREFIX = "spool-"
+SEGMENT_SUFFIX = ".log"
+CURSOR_FILE = "cursor.json"
+
+def _segment_name(number):
+    return f"{SEGMENT_PREFIX}{number:08d}{SEGMENT_SUFFIX}"
+
+def _read_record(stream):
+    """Next record payload from ``stream``, or None at the end or at a torn/corrupt record"""
+    header = stream.read(HEADER.size)
+    if len(header) < HEADER.size:
+        return None
+    length, checksum = HEADER.unpack(header)
+    payload = stream.read(length)
+    if len(payload) < length or zlib.crc32(payload) != checksum:
+        return None
+    return payload
+
+class SpoolBuffer:
+    """Append-only, crash-safe FIFO of JSON records with a size cap"""
+
+    def __init__(self, directory, max_bytes=50 * 1024 * 1024, segment_bytes=4 * 1024 * 1024, fsync=True):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.segment_bytes = min(segment_bytes, max(max_bytes // 2, HEADER.size + 1))
+        self.fsync = fsync
+        self.dropped_records = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+        self._sizes = {}  # segment number -> bytes
+        for name in os.listdir(directory):
+            if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX):
+                try:
+                    number = int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+                except ValueError:
+                    continue
+                self._sizes[number] = os.path.getsize(self._path(number))
+        if not self._sizes:
+            self._sizes[1] = 0
+
+        self._active = max(self._sizes)
+        self._recover_tail()
+        self._cursor = self._load_cursor()
+        self._writer = open(self._path(self._active), "ab")
+
+    def _path(self, number):
+        return os.path.join(self.directory, _segment_name(number))
+
+    def _recover_tail(self):
+        """Cut a torn record left by a crash off the end of the active segment"""
+        path = self._path(self._active)
+        if not os.path.exists(path):
+            return
+        valid = 0
+        with open(path, "rb") as stream:
+            while _read_record(stream) is not None:
+                valid = stream.tell()
+        if valid < self._sizes[self._active]:
+            logger.warning(f"Spool: discarding {self._sizes[self._active] - valid} torn bytes in {path}")
+            with open(path, "r+b") as stream:
+                stream.truncate(valid)
+            self._sizes[self._active] = valid
+
+    def _load_cursor(self):
+        first = min(self._sizes)
+        try:
+            with open(os.path.join(self.directory, CURSOR_FILE), "r", encoding="utf-8") as f:
+                saved = json.load(f)
+            segment, offset = int(saved["segment"]), int(saved["offset"])
+        except (OSError, ValueError, KeyError, TypeError):
+            return first, 0
+        if segment in self._sizes:
+            return segment, min(offset, self._sizes[segment])
+        # The segment was dropped by the size cap: resume at the next one
+        later = [number for number in self._sizes if number > segment]
+        return (min(later), 0) if later else (first, 0)
+
+    def _save_cursor(self):
+        path = os.path.join(self.directory, CURSOR_FILE)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"segment": self._cursor[0], "offset": self._cursor[1]}, f)
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def _roll(self):
+        self._writer.close()
+        self._active += 1
+        self._sizes[self._active] = 0
+        self._writer = open(self._path(self._active), "ab")
+
+    def _delete_segment(self, number):
+        self._sizes.pop(number, None)
+        try:
+            os.remove(self._path(number))
+        except OSError as e:
+            logger.warning(f"Spool: could not remove segment {number}: {e}")
+
+    def _enforce_cap(self):
+        while sum(self._sizes.values()) > self.max_bytes and len(self._sizes) > 1:
+            oldest = min(self._sizes)
+            if self._cursor[0] <= oldest:
+                self.dropped_records += self._count_records(oldest, self._cursor[1] if self._cursor[0] == oldest else 0)
+                self._cursor = (min(n for n in self._sizes if n > oldest), 0)
+                self._save_cursor()
+            self._delete_segment(oldest)
+            logger.warning(f"Spool full, dropped oldest segment {oldest}")
+
+    def _count_records(self, number, offset):
+        count = 0
+        with open(self._path(number), "rb") as stream:
+            stream.seek(offset)
+            while _read_record(stream) is not None:
+                count += 1
+        return count
+
+    def append(self, record):
+        """Durably add one JSON-serializable record"""
+        payload = json.dumps(record, separators=(",", ":")).encode("utf-8")
+        entry = HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+        with self._lock:
+            if self._sizes[self._active] and self._sizes[self._active] + len(entry) > self.segment_bytes:
+                self._roll()
+            self._writer.write(entry)
+            self._writer.flush()
+            if self.fsync:
+                os.fsync(self._writer.fileno())
+            self._sizes[self._active] += len(entry)
+            self._enforce_cap()
+
+    def read_batch(self, max_records=100, max_bytes=1024 * 1024):
+        """Oldest unacknowledged records as ``(records, position)``.
+
+        Nothing is removed until ``commit(position)`` is called, so a failed
+        upload simply reads the same batch again.
+        """
+        records = []
+        size = 0
+        with self._lock:
+            segment, offset = self._cursor
+            while segment in self._sizes:
+                with open(self._path(segment), "rb") as stream:
+                    stream.seek(offset)
+                    while len(records) < max_records and size < max_bytes:
+                        payload = _read_record(stream)
+                        if payload is None:
+                            break
+                        offset = stream.tell()
+                        size += len(payload)
+                        try:
+                            records.append(json.loads(payload))
+                        except ValueError:
+                            logger.warning(f"Spool: skipping undecodable record in segment {segment}")
+
+                if len(records) >= max_records or size >= max_bytes:
+                    break
+                if offset < self._sizes[segment]:
+                    logger.warning(f"Spool: skipping corrupt tail of segment {segment}")
+                    if segment == self._active:
+                        self._roll()
+                elif segment == self._active:
+                    break
+                segment, offset = min(n for n in self._sizes if n > segment), 0
+        return records, (segment, offset)
+
+    def commit(self, position):
+        """Acknowledge everything up to ``position`` from ``read_batch``"""
+        with self._lock:
+            if position[0] not in self._sizes or position < self._cursor:
+                return  # already skipped by the size cap
+            self._cursor = position
+            self._save_cursor()
+            for number in [n for n in self._sizes if n < position[0]]:
+                self._delete_segment(number)
+            if position == (self._active, self._sizes[self._active]) and self._sizes[self._active]:
+                # Fully drained: start a fresh segment so the old one can go
+                self._roll()
+                self._cursor = (self._active, 0)
+                self._save_cursor()
+                self._delete_segment(position[0])
+
+    def pending_bytes(self):
+        with self._lock:
+            segment, offset = self._cursor
+            return sum(size for number, size in self._sizes.items() if number >= segment) - offset
+
+    def __bool__(self):
+        return self.pending_bytes() > 0
+
+    def close(self):
+        with self._lock:
+            self._writer.close()
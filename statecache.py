@@ -0,0 +1,311 @@
+"""Latest-state cache behind /api/clients.
+
+Every accepted report replaces its host's entry, which holds the report
+already serialized to JSON, and bumps a global generation counter. Reads
+never touch Postgres: ``snapshot()`` concatenates the stored fragments into
+the response body once per generation, and the generation doubles as the
+ETag, so an unchanged poll costs one counter lookup. Server-side results
+about a host (its recommendations) are attached with ``annotate()`` and
+merged into its entry when served.
+
+Two backends share the interface:
+
+- ``SQLiteStateCache`` (default): a SQLite file, by default in /dev/shm, so
+  every gunicorn worker on the host sees the same state and generation.
+- ``MemoryStateCache``: a dict, for a single process and tests.
+"""
+import os
+import abc
+import json
+import time
+import uuid
+import sqlite3
+import logging
+import tempfile
+import threading
+
+from metrics import ENCODE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+_fragment_seconds = ENCODE_SECONDS.labels("client_fragment")
+_snapshot_seconds = ENCODE_SECONDS.labels("clients_snapshot")
+
+STATE_CACHE_BACKEND = os.getenv("STATE_CACHE_BACKEND", "sqlite").lower()  # sqlite | memory
+STATE_CACHE_PATH = os.getenv(
+    "STATE_CACHE_PATH",
+    os.path.join("/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(), "winperf-state.sqlite")
+)
+
+def client_view(data):
+    """The /api/clients entry of one host: its latest report with ``last_seen`` in whole seconds"""
+    view = dict(data)
+    if isinstance(view.get("last_seen"), (int, float)):
+        view["last_seen"] = int(view["last_seen"])
+    return view
+
+def _fragment(data):
+    started = time.perf_counter()
+    fragment = json.dumps(client_view(data), separators=(",", ":"), default=str)
+    _fragment_seconds.observe(time.perf_counter() - started)
+    return fragment
+
+def _merge_fragment(fragment, annotation):
+    """Fragment with the keys of an annotation object appended (annotation keys win on JSON.parse)"""
+    if not annotation or annotation == "{}":
+        return fragment
+    if fragment == "{}":
+        return annotation
+    return fragment[:-1] + "," + annotation[1:]
+
+def _render(instance, generation, rows):
+    started = time.perf_counter()
+    body = "{" + ",".join(f"{json.dumps(hostname)}:{fragment}" for hostname, fragment in rows) + "}"
+    _snapshot_seconds.observe(time.perf_counter() - started)
+    return f"{instance}-{generation}", body.encode("utf-8")
+
+class StateCache(abc.ABC):
+    """Common interface; ``snapshot()`` results are memoized per generation"""
+
+    def __init__(self):
+        self._rendered = None  # (generation, etag, body)
+        self._render_lock = threading.Lock()
+
+    @abc.abstractmethod
+    def put(self, hostname, data):
+        """Store the latest report of ``hostname``; returns the new generation"""
+
+    @abc.abstractmethod
+    def get(self, hostname):
+        """Latest report document of ``hostname``, or None"""
+
+    @abc.abstractmethod
+    def annotate(self, hostname, fields):
+        """Attach server-computed ``fields`` (e.g. recommendations) to the entry of ``hostname``.
+
+        Annotations are kept apart from the report, survive the host's next
+        reports and are merged into its entry when served. Returns the new
+        generation, or None when the host has no entry.
+        """
+
+    @abc.abstractmethod
+    def annotations(self, hostname):
+        """Fields last attached to ``hostname`` with ``annotate``"""
+
+    @abc.abstractmethod
+    def generation(self):
+        """Counter bumped by every ``put`` and ``annotate``"""
+
+    @abc.abstractmethod
+    def changes_since(self, generation):
+        """``(hostname, generation, fragment)`` of every host updated after ``generation``, oldest first"""
+
+    @abc.abstractmethod
+    def __len__(self):
+        """Number of hosts"""
+
+    @abc.abstractmethod
+    def _rows(self):
+        """``(hostname, fragment)`` ordered by most recently seen first"""
+
+    @abc.abstractmethod
+    def _instance(self):
+        """Identity of this cache's contents, part of the ETag: changes when the cache is rebuilt"""
+
+    def load(self, documents):
+        """Warm an empty cache, e.g. from clients_current at startup"""
+        for data in documents:
+            if data.get("hostname"):
+                self.put(data["hostname"], data)
+
+    def snapshot(self):
+        """``(etag, body)`` of the whole client map, rendered at most once per generation"""
+        generation = self.generation()
+        rendered = self._rendered
+        if rendered is not None and rendered[0] == generation:
+            return rendered[1], rendered[2]
+        with self._render_lock:
+            generation = self.generation()
+            etag, body = _render(self._instance(), generation, self._rows())
+            self._rendered = (generation, etag, body)
+            return etag, body
+
+class MemoryStateCache(StateCache):
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+        self._entries = {}  # hostname -> (generation, last_seen, fragment, data)
+        self._annotations = {}  # hostname -> (fields, fragment)
+        self._generation = 0
+        self._id = uuid.uuid4().hex[:8]
+
+    def put(self, hostname, data):
+        fragment = _fragment(data)
+        with self._lock:
+            self._generation += 1
+            self._entries[hostname] = (self._generation, data.get("last_seen") or 0, fragment, data)
+            return self._generation
+
+    def get(self, hostname):
+        entry = self._entries.get(hostname)
+        return entry[3] if entry else None
+
+    def annotate(self, hostname, fields):
+        fragment = json.dumps(fields, separators=(",", ":"), default=str)
+        with self._lock:
+            entry = self._entries.get(hostname)
+            if entry is None:
+                return None
+            self._generation += 1
+            self._entries[hostname] = (self._generation,) + entry[1:]
+            self._annotations[hostname] = (dict(fields), fragment)
+            return self._generation
+
+    def annotations(self, hostname):
+        annotation = self._annotations.get(hostname)
+        return dict(annotation[0]) if annotation else {}
+
+    def _merged(self, hostname, fragment):
+        annotation = self._annotations.get(hostname)
+        return _merge_fragment(fragment, annotation[1] if annotation else None)
+
+    def generation(self):
+        return self._generation
+
+    def changes_since(self, generation):
+        with self._lock:
+            changed = [
+                (hostname, entry[0], self._merged(hostname, entry[2])) for hostname, entry in self._entries.items()
+                if entry[0] > generation
+            ]
+        return sorted(changed, key=lambda change: change[1])
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _rows(self):
+        with self._lock:
+            entries = sorted(self._entries.items(), key=lambda item: item[1][1], reverse=True)
+            return [(hostname, self._merged(hostname, entry[2])) for hostname, entry in entries]
+
+    def _instance(self):
+        return self._id
+
+class SQLiteStateCache(StateCache):
+    """State shared by all processes on the host through one SQLite file.
+
+    The file is a cache, not a store of record: it runs without fsync and is
+    rebuilt from clients_current when missing.
+    """
+
+    def __init__(self, path=STATE_CACHE_PATH):
+        super().__init__()
+        self.path = path
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+                CREATE TABLE IF NOT EXISTS clients (
+                    hostname TEXT PRIMARY KEY,
+                    generation INTEGER NOT NULL,
+                    last_seen REAL NOT NULL,
+                    fragment TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_clients_generation ON clients (generation);
+                CREATE TABLE IF NOT EXISTS annotations (hostname TEXT PRIMARY KEY, fragment TEXT NOT NULL);
+            """)
+            conn.execute("INSERT OR IGNORE INTO meta VALUES ('generation', '0')")
+            conn.execute("INSERT OR IGNORE INTO meta VALUES ('instance', ?)", (uuid.uuid4().hex[:8],))
+
+    def _connection(self):
+        # One connection per thread, never carried across a fork
+        conn, pid = getattr(self._local, "conn", None), getattr(self._local, "pid", None)
+        if conn is None or pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def _bump(self, conn):
+        conn.execute("UPDATE meta SET value = CAST(value AS INTEGER) + 1 WHERE key = 'generation'")
+        return int(conn.execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()[0])
+
+    def put(self, hostname, data):
+        fragment = _fragment(data)
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            generation = self._bump(conn)
+            conn.execute(
+                "INSERT OR REPLACE INTO clients (hostname, generation, last_seen, fragment) VALUES (?, ?, ?, ?)",
+                (hostname, generation, data.get("last_seen") or 0, fragment)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return generation
+
+    def get(self, hostname):
+        row = self._connection().execute("SELECT fragment FROM clients WHERE hostname = ?", (hostname,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def annotate(self, hostname, fields):
+        fragment = json.dumps(fields, separators=(",", ":"), default=str)
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute("SELECT 1 FROM clients WHERE hostname = ?", (hostname,)).fetchone() is None:
+                conn.execute("ROLLBACK")
+                return None
+            generation = self._bump(conn)
+            conn.execute("UPDATE clients SET generation = ? WHERE hostname = ?", (generation, hostname))
+            conn.execute("INSERT OR REPLACE INTO annotations (hostname, fragment) VALUES (?, ?)", (hostname, fragment))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return generation
+
+    def annotations(self, hostname):
+        row = self._connection().execute(
+            "SELECT fragment FROM annotations WHERE hostname = ?", (hostname,)
+        ).fetchone()
+        return json.loads(row[0]) if row else {}
+
+    def generation(self):
+        return int(self._connection().execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()[0])
+
+    def changes_since(self, generation):
+        rows = self._connection().execute("""
+            SELECT c.hostname, c.generation, c.fragment, a.fragment
+            FROM clients c LEFT JOIN annotations a ON a.hostname = c.hostname
+            WHERE c.generation > ?
+            ORDER BY c.generation
+        """, (generation,)).fetchall()
+        return [(hostname, gen, _merge_fragment(fragment, annotation)) for hostname, gen, fragment, annotation in rows]
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM clients").fetchone()[0]
+
+    def _rows(self):
+        rows = self._connection().execute("""
+            SELECT c.hostname, c.fragment, a.fragment
+            FROM clients c LEFT JOIN annotations a ON a.hostname = c.hostname
+            ORDER BY c.last_seen DESC
+        """).fetchall()
+        return [(hostname, _merge_fragment(fragment, annotation)) for hostname, fragment, annotation in rows]
+
+    def _instance(self):
+        # Read from the file, not cached: connections opened after a rebuild see the new instance
+        return self._connection().execute("SELECT value FROM meta WHERE key = 'instance'").fetchone()[0]
+
+def create_state_cache():
+    if STATE_CACHE_BACKEND == "memory":
+        return MemoryStateCache()
+    try:
+        return SQLiteStateCache()
+    except sqlite3.Error as e:
+        logger.warning(f"State cache file {STATE_CACHE_PATH} unusable ({e}), using a per-process cache")
+        return MemoryStateCache()
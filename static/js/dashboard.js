@@ -1,4 +1,5 @@
 let clientData = {};
+let clientsEtag = null;
 let charts = {};
 
 function secondsAgo(ts) {
@@ -73,9 +74,10 @@ function renderProcessList(processes) {
     return '<div>No process data available</div>';
   }
 
-  return '<ul class="process-list">' + processes.map(proc =>
-    `<li>${proc.name} - ${proc.cpu}% CPU</li>`
-  ).join('') + '</ul>';
+  return '<ul class="process-list">' + processes.map(proc => {
+    const memory = proc.memory_rss != null ? `, ${(proc.memory_rss / 1048576).toFixed(0)} MB` : '';
+    return `<li>${proc.name} - ${proc.cpu}% CPU${memory}</li>`;
+  }).join('') + '</ul>';
 }
 
 function renderProgramList(programs) {
@@ -211,117 +213,168 @@ function renderClientDetails(client) {
   openModal();
 }
 
-async function loadClients() {
-  try {
-    const res = await fetch("/api/clients");
-    if (!res.ok) {
-      throw new Error(`HTTP ${res.status}: ${res.statusText}`);
-    }
-    
-    clientData = await res.json();
-    const container = document.getElementById("clientGrid");
-    container.innerHTML = "";
+function renderCard(client) {
+  const ago = secondsAgo(client.last_seen);
+  const status = ago < 30 ? "online" : "offline";
+  const statusText = status === "online" ? "Online" : "Offline";
 
-    if (Object.keys(clientData).length === 0) {
-      container.innerHTML = '<div class="loading">No clients found</div>';
-      updateStats();
-      return;
+  const cpuPercent = client.cpu?.percent ?? 0;
+  const ramPercent = client.memory?.percent ?? 0;
+
+  // Get primary disk usage
+  let diskPercent = 0;
+  if (client.disk && typeof client.disk === 'object') {
+    const diskInfo = Object.values(client.disk);
+    if (diskInfo.length > 0) {
+      diskPercent = diskInfo[0].percent || 0;
     }
+  }
+
+  const card = document.createElement("div");
+  card.className = "card";
+  card.style.cursor = "pointer";
+  card.dataset.hostname = client.hostname;
+
+  // Add click handler for modal
+  card.addEventListener('click', () => renderClientDetails(clientData[client.hostname] || client));
+
+  card.innerHTML = `
+    <div class="card-header">
+      <h2><span class="hostname-icon">🖥️</span>${client.hostname}</h2>
+      <div class="status ${status}">${statusText}</div>
+    </div>
+
+    <div class="meta-info">
+      <div class="meta-item">
+        <div class="meta-label">IP Address</div>
+        <div class="meta-value">${client.ip || 'N/A'}</div>
+      </div>
+      <div class="meta-item">
+        <div class="meta-label">Operating System</div>
+        <div class="meta-value">${(client.os || 'Unknown').substring(0, 20)}</div>
+      </div>
+      <div class="meta-item">
+        <div class="meta-label">Last Seen</div>
+        <div class="meta-value last-seen">${formatTime(ago)} ago</div>
+      </div>
+      <div class="meta-item">
+        <div class="meta-label">Processes</div>
+        <div class="meta-value">${client.process_count || 'N/A'}</div>
+      </div>
+    </div>
 
-    Object.values(clientData).forEach(client => {
-      const ago = secondsAgo(client.last_seen);
-      const status = ago < 30 ? "online" : "offline";
-      const statusText = status === "online" ? "Online" : "Offline";
-
-      const cpuPercent = client.cpu?.percent ?? 0;
-      const ramPercent = client.memory?.percent ?? 0;
-      
-      // Get primary disk usage
-      let diskPercent = 0;
-      if (client.disk && typeof client.disk === 'object') {
-        const diskInfo = Object.values(client.disk);
-        if (diskInfo.length > 0) {
-          diskPercent = diskInfo[0].percent || 0;
-        }
-      }
-
-      const card = document.createElement("div");
-      card.className = "card";
-      card.style.cursor = "pointer";
-      
-      // Add click handler for modal
-      card.addEventListener('click', () => renderClientDetails(client));
-      
-      card.innerHTML = `
-        <div class="card-header">
-          <h2><span class="hostname-icon">🖥️</span>${client.hostname}</h2>
-          <div class="status ${status}">${statusText}</div>
+    <div class="metrics">
+      <div class="metric">
+        <div class="metric-header">
+          <div class="metric-label">💻 CPU</div>
+          <div class="metric-value">${cpuPercent.toFixed(1)}%</div>
+        </div>
+        <div class="progress-bar">
+          <div class="progress-fill cpu-bar" style="width: ${cpuPercent}%"></div>
         </div>
+      </div>
 
-        <div class="meta-info">
-          <div class="meta-item">
-            <div class="meta-label">IP Address</div>
-            <div class="meta-value">${client.ip || 'N/A'}</div>
-          </div>
-          <div class="meta-item">
-            <div class="meta-label">Operating System</div>
-            <div class="meta-value">${(client.os || 'Unknown').substring(0, 20)}</div>
-          </div>
-          <div class="meta-item">
-            <div class="meta-label">Last Seen</div>
-            <div class="meta-value">${formatTime(ago)} ago</div>
-          </div>
-          <div class="meta-item">
-            <div class="meta-label">Processes</div>
-            <div class="meta-value">${client.process_count || 'N/A'}</div>
-          </div>
+      <div class="metric">
+        <div class="metric-header">
+          <div class="metric-label">🧠 RAM</div>
+          <div class="metric-value">${ramPercent.toFixed(1)}%</div>
+        </div>
+        <div class="progress-bar">
+          <div class="progress-fill ram-bar" style="width: ${ramPercent}%"></div>
         </div>
+      </div>
 
-        <div class="metrics">
-          <div class="metric">
-            <div class="metric-header">
-              <div class="metric-label">💻 CPU</div>
-              <div class="metric-value">${cpuPercent.toFixed(1)}%</div>
-            </div>
-            <div class="progress-bar">
-              <div class="progress-fill cpu-bar" style="width: ${cpuPercent}%"></div>
-            </div>
-          </div>
-          
-          <div class="metric">
-            <div class="metric-header">
-              <div class="metric-label">🧠 RAM</div>
-              <div class="metric-value">${ramPercent.toFixed(1)}%</div>
-            </div>
-            <div class="progress-bar">
-              <div class="progress-fill ram-bar" style="width: ${ramPercent}%"></div>
-            </div>
-          </div>
-          
-          <div class="metric">
-            <div class="metric-header">
-              <div class="metric-label">💾 Disk</div>
-              <div class="metric-value">${diskPercent.toFixed(1)}%</div>
-            </div>
-            <div class="progress-bar">
-              <div class="progress-fill disk-bar" style="width: ${diskPercent}%"></div>
-            </div>
-          </div>
+      <div class="metric">
+        <div class="metric-header">
+          <div class="metric-label">💾 Disk</div>
+          <div class="metric-value">${diskPercent.toFixed(1)}%</div>
+        </div>
+        <div class="progress-bar">
+          <div class="progress-fill disk-bar" style="width: ${diskPercent}%"></div>
         </div>
+      </div>
+    </div>
 
-        ${client.recommendations && client.recommendations.length > 0 ? `
-          <div class="recommendations-preview">
-            <div class="recommendation-indicator">⚠️ ${client.recommendations.length} recommendation(s)</div>
-          </div>
-        ` : ''}
-      `;
-      
-      container.appendChild(card);
-    });
+    ${client.recommendations && client.recommendations.length > 0 ? `
+      <div class="recommendations-preview">
+        <div class="recommendation-indicator">⚠️ ${client.recommendations.length} recommendation(s)</div>
+      </div>
+    ` : ''}
+  `;
+
+  return card;
+}
+
+function markUpdated() {
+  updateStats();
+  document.getElementById('lastUpdated').textContent = `Last updated: ${new Date().toLocaleTimeString()}`;
+}
+
+function renderGrid() {
+  const container = document.getElementById("clientGrid");
+  container.innerHTML = "";
 
+  if (Object.keys(clientData).length === 0) {
+    container.innerHTML = '<div class="loading">No clients found</div>';
     updateStats();
-    document.getElementById('lastUpdated').textContent = `Last updated: ${new Date().toLocaleTimeString()}`;
-    
+    return;
+  }
+
+  Object.values(clientData).forEach(client => container.appendChild(renderCard(client)));
+  markUpdated();
+}
+
+// Replace only the cards of the hosts in `changed` ({hostname: client})
+function patchClients(changed) {
+  const container = document.getElementById("clientGrid");
+  if (Object.keys(clientData).length === 0) {
+    container.innerHTML = "";
+  }
+
+  Object.entries(changed).forEach(([hostname, client]) => {
+    clientData[hostname] = client;
+    const card = renderCard(client);
+    const existing = container.querySelector(`.card[data-hostname="${CSS.escape(hostname)}"]`);
+    if (existing) {
+      existing.replaceWith(card);
+    } else {
+      container.prepend(card);
+    }
+  });
+  markUpdated();
+}
+
+// Between updates only the "last seen" age and online status of each card move
+function refreshAges() {
+  document.querySelectorAll('#clientGrid .card').forEach(card => {
+    const client = clientData[card.dataset.hostname];
+    if (!client) return;
+    const ago = secondsAgo(client.last_seen);
+    const online = ago < 30;
+    const status = card.querySelector('.status');
+    status.className = `status ${online ? 'online' : 'offline'}`;
+    status.textContent = online ? 'Online' : 'Offline';
+    card.querySelector('.last-seen').textContent = `${formatTime(ago)} ago`;
+  });
+  updateStats();
+}
+
+async function loadClients() {
+  try {
+    // Revalidate with the last ETag: 304 means nothing changed, so only the ages move
+    const headers = clientsEtag ? { "If-None-Match": clientsEtag } : {};
+    const res = await fetch("/api/clients", { headers, cache: "no-store" });
+    if (res.status === 304) {
+      refreshAges();
+      return;
+    }
+    if (!res.ok) {
+      throw new Error(`HTTP ${res.status}: ${res.statusText}`);
+    }
+    clientData = await res.json();
+    clientsEtag = res.headers.get("ETag");
+    renderGrid();
+
   } catch (error) {
     console.error('Failed to load clients:', error);
     document.getElementById("clientGrid").innerHTML = `
@@ -348,9 +401,17 @@ document.addEventListener('keydown', (e) => {
   }
 });
 
-// Auto-refresh functionality
+// Auto-refresh functionality: live updates over /api/stream, polling when streaming is unavailable
 let autoRefresh = true;
 let refreshInterval;
+let ageInterval;
+let eventSource = null;
+let streamRetry = null;
+
+const POLL_INTERVAL_MS = 5000;
+const STREAM_RETRY_MS = 30000;
+// Off when the server mode cannot hold open streams (sync workers): poll only
+const LIVE_STREAM = document.body.dataset.liveStream === 'on';
 
 function toggleAutoRefresh() {
   autoRefresh = !autoRefresh;
@@ -367,20 +428,71 @@ function toggleAutoRefresh() {
   }
 }
 
-function startAutoRefresh() {
+function startPolling() {
   if (refreshInterval) clearInterval(refreshInterval);
   refreshInterval = setInterval(() => {
     if (autoRefresh) {
       loadClients();
     }
-  }, 5000);
+  }, POLL_INTERVAL_MS);
+}
+
+function startStream() {
+  if (!window.EventSource || !LIVE_STREAM) {
+    startPolling();
+    return;
+  }
+
+  eventSource = new EventSource("/api/stream");
+  eventSource.addEventListener('snapshot', (e) => {
+    // Sent on every (re)connect: the full client map
+    if (refreshInterval) {
+      clearInterval(refreshInterval);
+      refreshInterval = null;
+    }
+    clientData = JSON.parse(e.data);
+    clientsEtag = null;
+    renderGrid();
+  });
+  eventSource.addEventListener('update', (e) => {
+    patchClients(JSON.parse(e.data));
+  });
+  eventSource.onerror = () => {
+    // The browser reconnects by itself unless the server refused the stream (e.g. 503)
+    if (eventSource.readyState !== EventSource.CLOSED) return;
+    console.warn('Live updates unavailable, polling instead');
+    eventSource = null;
+    startPolling();
+    streamRetry = setTimeout(() => {
+      streamRetry = null;
+      if (autoRefresh && !document.hidden) startStream();
+    }, STREAM_RETRY_MS);
+  };
+}
+
+function startAutoRefresh() {
+  stopAutoRefresh();
+  startStream();
+  ageInterval = setInterval(refreshAges, POLL_INTERVAL_MS);
 }
 
 function stopAutoRefresh() {
+  if (eventSource) {
+    eventSource.close();
+    eventSource = null;
+  }
+  if (streamRetry) {
+    clearTimeout(streamRetry);
+    streamRetry = null;
+  }
   if (refreshInterval) {
     clearInterval(refreshInterval);
     refreshInterval = null;
   }
+  if (ageInterval) {
+    clearInterval(ageInterval);
+    ageInterval = null;
+  }
 }
 
 // Initialize dashboard
@@ -412,7 +524,7 @@ document.addEventListener('DOMContentLoaded', () => {
     header.appendChild(controls);
   }
 
-  // Initial load
+  // Initial load (the stream replaces it with its snapshot once connected)
   loadClients();
   startAutoRefresh();
 });
@@ -422,7 +534,8 @@ document.addEventListener('visibilitychange', () => {
   if (document.hidden) {
     stopAutoRefresh();
   } else if (autoRefresh) {
-    loadClients(); // Immediate refresh when returning to tab
+    // A reconnected stream delivers a fresh snapshot; polling would wait for its first interval
+    if (!window.EventSource || !LIVE_STREAM) loadClients();
     startAutoRefresh();
   }
 });
\ No newline at end of file
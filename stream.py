@@ -0,0 +1,170 @@
+"""Server-sent events for live dashboard updates.
+
+One ``StreamHub`` per worker follows the state cache's generation counter:
+a single poller reads ``changes_since`` (so reports accepted by any worker
+on the host are seen) and fans each batch of changed hosts out to every
+subscriber. Subscribers coalesce: a host that changes several times between
+two sends is delivered once, with its latest fragment, and no subscriber is
+sent more than ``max_rate`` updates per second.
+
+Each open stream holds a request handler for its whole lifetime, so many
+subscribers need cooperative workers (``gunicorn -k gevent``) or the ASGI
+server. With sync workers every dashboard tab would occupy a worker and
+starve report ingestion, so there the stream is refused and dashboards poll
+(``streaming_supported``).
+"""
+import os
+import json
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+STREAM_POLL_INTERVAL = float(os.getenv("STREAM_POLL_INTERVAL", "0.5"))
+STREAM_MAX_RATE = float(os.getenv("STREAM_MAX_RATE", "1.0"))  # updates per second per subscriber
+STREAM_KEEPALIVE = float(os.getenv("STREAM_KEEPALIVE", "15"))
+STREAM_MAX_SUBSCRIBERS = int(os.getenv("STREAM_MAX_SUBSCRIBERS", "5000"))
+STREAM_ENABLED = os.getenv("STREAM_ENABLED", "auto").lower()  # auto | on | off
+
+def cooperative_workers():
+    """Whether request handlers are greenlets (``gunicorn -k gevent``), so an open stream does not hold a worker"""
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched("socket")
+
+def streaming_supported():
+    """Whether the WSGI app may serve /api/stream: forced by STREAM_ENABLED, otherwise only under gevent"""
+    if STREAM_ENABLED in ("on", "off"):
+        return STREAM_ENABLED == "on"
+    return cooperative_workers()
+
+def _event(name, event_id, data):
+    return f"event: {name}\nid: {event_id}\ndata: {data}\n\n"
+
+class Subscriber:
+    """Pending per-host changes of one stream, merged until the next send"""
+
+    __slots__ = ("min_interval", "pending", "generation", "last_sent", "closed", "_wakeup", "_lock")
+
+    def __init__(self, max_rate):
+        self.min_interval = 1.0 / max_rate if max_rate > 0 else 0.0
+        self.pending = {}  # hostname -> fragment
+        self.generation = 0
+        self.last_sent = 0.0
+        self.closed = False
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+
+    def offer(self, changes, generation):
+        with self._lock:
+            for hostname, _, fragment in changes:
+                self.pending[hostname] = fragment
+            self.generation = generation
+        self._wakeup.set()
+
+    def take(self):
+        """``(generation, {hostname: fragment})`` accumulated since the last call"""
+        with self._lock:
+            pending, self.pending = self.pending, {}
+            self._wakeup.clear()
+            return self.generation, pending
+
+    def wait(self, timeout):
+        return self._wakeup.wait(timeout)
+
+class StreamHub:
+    def __init__(self, cache, poll_interval=STREAM_POLL_INTERVAL, max_subscribers=STREAM_MAX_SUBSCRIBERS,
+                 keepalive=STREAM_KEEPALIVE):
+        self.cache = cache
+        self.poll_interval = poll_interval
+        self.max_subscribers = max_subscribers
+        self.keepalive = keepalive
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self.stats = {"subscribers": 0, "connected": 0, "rejected": 0, "batches": 0, "events": 0}
+
+    def _start(self):
+        # Started on first use, so the thread belongs to the worker and not to a pre-fork master
+        if self._thread is None or not self._thread.is_alive():
+            # Read before any subscriber takes its snapshot
+            state = (self.cache._instance(), self.cache.generation())
+            self._thread = threading.Thread(target=self._run, args=state, name="stream-hub", daemon=True)
+            self._thread.start()
+
+    def subscribe(self, max_rate=STREAM_MAX_RATE):
+        """New subscriber, or None when this worker is at ``max_subscribers``"""
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                self.stats["rejected"] += 1
+                return None
+            subscriber = Subscriber(max_rate)
+            self._subscribers.add(subscriber)
+            self.stats["connected"] += 1
+            self.stats["subscribers"] = len(self._subscribers)
+            self._start()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        subscriber.closed = True
+        with self._lock:
+            self._subscribers.discard(subscriber)
+            self.stats["subscribers"] = len(self._subscribers)
+
+    def notify(self):
+        """Poll now instead of at the next interval (a report was accepted by this worker)"""
+        self._wakeup.set()
+
+    def _run(self, instance, generation):
+        while True:
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+            try:
+                current_instance, current = self.cache._instance(), self.cache.generation()
+                if current_instance != instance or current < generation:
+                    instance, generation = current_instance, 0  # the cache was rebuilt: resend every host
+                if current == generation:
+                    continue
+                changes = self.cache.changes_since(generation)
+            except Exception as e:
+                logger.error(f"Stream hub could not read the state cache: {e}")
+                continue
+            if not changes:
+                generation = current
+                continue
+
+            generation = changes[-1][1]
+            with self._lock:
+                subscribers = list(self._subscribers)
+            for subscriber in subscribers:
+                subscriber.offer(changes, generation)
+            self.stats["batches"] += 1
+
+    def events(self, subscriber):
+        """SSE text of one stream: a full snapshot, then coalesced per-host updates"""
+        try:
+            etag, body = self.cache.snapshot()
+            yield _event("snapshot", etag, body.decode("utf-8"))
+            while not subscriber.closed:
+                if not subscriber.wait(self.keepalive):
+                    yield ": keepalive\n\n"
+                    continue
+                delay = subscriber.last_sent + subscriber.min_interval - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)  # let more changes pile up into this send
+                generation, pending = subscriber.take()
+                if not pending:
+                    continue
+                subscriber.last_sent = time.monotonic()
+                self.stats["events"] += 1
+                data = "{" + ",".join(f"{json.dumps(hostname)}:{fragment}" for hostname, fragment in pending.items()) + "}"
+                yield _event("update", generation, data)
+        finally:
+            self.unsubscribe(subscriber)
+
+    def get_stats(self):
+        return dict(self.stats)
@@ -0,0 +1,157 @@
+import threading
+
+import pytest
+
+import collector as collector_module
+from collector import FixedRateScheduler, MetricsCollector
+from inventory import InventoryProbe, InventoryProvider, StaticInventoryProvider
+
+class FakeClock:
+    """Wall clock that only moves when told to; doubles as the scheduler's stop event"""
+
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def wait(self, delay):
+        self.now += delay
+        return False
+
+def test_ticks_land_on_interval_boundaries():
+    clock = FakeClock(1003.0)
+    scheduler = FixedRateScheduler(10, clock=clock)
+    ticks = []
+    for work in (0.5, 4.0, 9.0):
+        assert scheduler.wait(clock)
+        ticks.append(clock.now)
+        clock.now += work  # time spent collecting and sending
+    assert ticks == [1010.0, 1020.0, 1030.0]
+    assert scheduler.skipped == 0
+
+def test_overrun_skips_missed_ticks_instead_of_bursting():
+    clock = FakeClock(1000.0)
+    scheduler = FixedRateScheduler(10, clock=clock)
+    scheduler.wait(clock)
+    clock.now += 25.0  # one tick took two and a half intervals
+    scheduler.wait(clock)  # the 1020 tick, late; 1030 is skipped
+    assert scheduler.skipped == 1
+    assert scheduler.last_lag == pytest.approx(15.0)
+    assert scheduler.next_tick == 1040.0
+    scheduler.wait(clock)
+    assert clock.now == 1040.0
+
+def test_wait_returns_false_when_stopped():
+    class Stopped:
+        def wait(self, delay):
+            return True
+
+    scheduler = FixedRateScheduler(10, clock=FakeClock(1001.0))
+    assert scheduler.wait(Stopped()) is False
+
+def test_set_interval_realigns():
+    clock = FakeClock(1003.0)
+    scheduler = FixedRateScheduler(10, clock=clock)
+    scheduler.set_interval(60)
+    assert scheduler.next_tick == 1020.0
+
+@pytest.fixture
+def collector():
+    collector = MetricsCollector(max_workers=2, probe_timeout=0.05)
+    yield collector
+    collector.shutdown()
+
+def test_slow_probe_keeps_its_last_value(collector):
+    release = threading.Event()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        if len(calls) > 1:
+            release.wait(5)
+        return len(calls)
+
+    collector.register("slow", slow, default="none")
+    assert collector.collect(["slow"])["slow"] == 1
+    assert collector.collect(["slow"])["slow"] == 1  # timed out: previous value
+    assert collector.collect(["slow"])["slow"] == 1  # still running: not submitted again
+    assert len(calls) == 2
+    assert collector.get_timings()["slow"]["timeouts"] == 1
+
+    release.set()
+    collector._running["slow"].result(timeout=5)
+    assert collector.collect(["slow"])["slow"] in (2, 3)  # harvested, then refreshed
+
+def test_failing_probe_falls_back_to_default(collector):
+    def broken():
+        raise OSError("no such device")
+
+    collector.register("broken", broken, concurrent=False, default={})
+    assert collector.collect(["broken"]) == {"broken": {}}
+    assert collector.get_timings()["broken"]["errors"] == 1
+
+def test_builtin_probes(collector):
+    sample = collector.collect()
+    assert 0.0 <= sample["cpu"]["percent"] <= 100.0
+    assert sample["memory"]["total"] > 0
+    assert sample["process_count"] > 0
+
+def counter():
+    calls = []
+    return calls, lambda: calls.append(1) or len(calls)
+
+def test_tiered_probe_runs_every_n_ticks(collector):
+    calls, probe = counter()
+    collector.register("tiered", probe, concurrent=False, every=3)
+    values = [collector.collect(["tiered"])["tiered"] for _ in range(7)]
+    assert values == [1, 1, 1, 2, 2, 2, 3]
+
+def test_ttl_probe_refreshes_once_its_value_is_old(collector, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(collector_module.time, "time", lambda: now[0])
+    calls, probe = counter()
+    collector.register("inventory", probe, concurrent=False, every=None, ttl=60)
+    assert collector.collect(["inventory"])["inventory"] == 1
+    now[0] += 59
+    assert collector.collect(["inventory"])["inventory"] == 1
+    now[0] += 1
+    assert collector.collect(["inventory"])["inventory"] == 2
+    assert collector.get_freshness(["inventory"]) == {"inventory": 1060.0}
+
+def test_change_signal_triggers_a_refresh(collector):
+    provider = StaticInventoryProvider([{"name": "Office"}])
+    probe = InventoryProbe(provider)
+    collector.register("programs", probe, concurrent=False, every=None, changed=probe.changed)
+    assert collector.collect(["programs"])["programs"] == [{"name": "Office"}]
+
+    provider._programs.append({"name": "unnoticed"})  # no change token bump: not re-read
+    assert collector.collect(["programs"])["programs"] == [{"name": "Office"}]
+
+    provider.set_programs([{"name": "Office"}, {"name": "Steam"}])
+    assert collector.collect(["programs"])["programs"] == [{"name": "Office"}, {"name": "Steam"}]
+
+def test_background_probe_is_never_waited_for(collector):
+    release = threading.Event()
+
+    def slow():
+        release.wait(5)
+        return "done"
+
+    collector.register("slow", slow, default="pending", every=None, ttl=3600, background=True)
+    assert collector.collect(["slow"])["slow"] == "pending"
+    assert collector.get_timings()["slow"]["timeouts"] == 0
+    assert collector.get_freshness(["slow"]) == {"slow": None}
+
+    release.set()
+    collector._running["slow"].result(timeout=5)
+    assert collector.collect(["slow"])["slow"] == "done"
+
+def test_inventory_providers_must_implement_the_interface():
+    class Partial(InventoryProvider):
+        def change_token(self):
+            return None
+
+    with pytest.raises(TypeError):
+        Partial()
+    assert StaticInventoryProvider().programs() == []
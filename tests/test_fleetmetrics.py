@@ -0,0 +1,106 @@
+from fleetmetrics import FleetExporter, host_samples
+from statecache import MemoryStateCache
+
+def report(hostname, cpu, **fields):
+    return {
+        "hostname": hostname, "ip": "10.0.0.1", "os": "Windows", "last_seen": 1000, "status": "online",
+        "cpu": {"percent": cpu}, "memory": {"percent": 40, "used": 4 << 30, "total": 8 << 30},
+        "disk": {"C:": {"percent": 70, "free": 30, "total": 100, "mountpoint": "C:\\"}},
+        "network": {"interfaces": {"eth0": {"bytes_sent": 10, "bytes_recv": 20}}},
+        "process_count": 120, **fields
+    }
+
+def lines(body):
+    return [line for line in body.decode("utf-8").splitlines() if not line.startswith("#")]
+
+def test_host_samples_render_every_family():
+    blocks = host_samples("a", report("a", 12.5))
+    text = b"".join(blocks).decode("utf-8")
+    assert 'winperf_host_cpu_percent{hostname="a"} 12.5\n' in text
+    assert 'winperf_host_disk_free_bytes{hostname="a",device="C:",mountpoint="C:\\\\"} 30\n' in text
+    assert 'winperf_host_network_received_bytes_total{hostname="a",interface="eth0"} 20\n' in text
+    assert 'winperf_host_process_count{hostname="a"} 120\n' in text
+
+def test_missing_and_non_numeric_values_are_left_out():
+    text = b"".join(host_samples("a", {"hostname": "a", "cpu": {"percent": None}, "process_count": True}))
+    assert b"winperf_host_cpu_percent" not in text
+    assert b"winperf_host_process_count" not in text
+    assert b"winperf_host_info" in text
+
+def test_unchanged_generation_reuses_the_body():
+    cache = MemoryStateCache()
+    cache.put("a", report("a", 10))
+    exporter = FleetExporter(cache)
+    body = exporter.render()
+    assert exporter.render() is body
+    assert exporter.stats["renders"] == 1
+    assert exporter.stats["scrapes"] == 2
+
+def test_only_changed_hosts_are_rendered_again():
+    cache = MemoryStateCache()
+    for hostname in ("a", "b", "c"):
+        cache.put(hostname, report(hostname, 10))
+    exporter = FleetExporter(cache)
+    exporter.render()
+    assert exporter.stats["hosts_rendered"] == 3
+
+    cache.put("b", report("b", 55))
+    body = exporter.render()
+    assert exporter.stats["hosts_rendered"] == 4
+    assert 'winperf_host_cpu_percent{hostname="b"} 55' in lines(body)
+    assert 'winperf_host_cpu_percent{hostname="a"} 10' in lines(body)
+
+def test_incremental_body_matches_a_fresh_render():
+    cache = MemoryStateCache()
+    cache.put("m", report("m", 10))
+    cache.put("c", report("c", 20))
+    exporter = FleetExporter(cache)
+    exporter.render()
+
+    cache.put("a", report("a", 30))
+    cache.put("m", report("m", 40, process_count=99))
+    cache.put("z", report("z", 50))
+    cache.annotate("c", {"recommendations": ["x"]})
+    body = exporter.render()
+
+    assert body == FleetExporter(cache).render()
+    cpu = [line for line in lines(body) if line.startswith("winperf_host_cpu_percent")]
+    assert [line.split('"')[1] for line in cpu] == ["a", "c", "m", "z"]
+    assert exporter.get_stats()["hosts"] == 4
+
+def test_rebuilt_cache_triggers_a_full_rebuild():
+    cache = MemoryStateCache()
+    for hostname in ("a", "b", "c"):
+        cache.put(hostname, report(hostname, 10))
+    exporter = FleetExporter(cache)
+    exporter.render()
+
+    rebuilt = MemoryStateCache()
+    rebuilt.put("b", report("b", 77))
+    exporter.cache = rebuilt
+    body = exporter.render()
+    assert [line for line in lines(body) if "hostname=\"a\"" in line] == []
+    assert 'winperf_host_cpu_percent{hostname="b"} 77' in lines(body)
+    assert exporter.get_stats()["hosts"] == 1
+
+def test_rebuilt_cache_with_a_higher_generation_drops_vanished_hosts():
+    cache = MemoryStateCache()
+    for hostname in ("a", "b"):
+        cache.put(hostname, report(hostname, 10))
+    exporter = FleetExporter(cache)
+    exporter.render()
+
+    rebuilt = MemoryStateCache()
+    for cpu in range(5):
+        rebuilt.put("c", report("c", cpu))
+    assert rebuilt.generation() > cache.generation()
+    exporter.cache = rebuilt
+    body = exporter.render()
+    assert [line.split('"')[1] for line in lines(body) if line.startswith("winperf_host_cpu_percent")] == ["c"]
+    assert body == FleetExporter(rebuilt).render()
+
+def test_headers_are_present_without_hosts():
+    body = FleetExporter(MemoryStateCache()).render()
+    assert b"# TYPE winperf_host_cpu_percent gauge\n" in body
+    assert b"# TYPE winperf_host_network_sent_bytes_total counter\n" in body
+    assert lines(body) == []
@@ -0,0 +1,80 @@
+import psycopg2
+import pytest
+
+import ingest
+from ingest import IngestQueue
+
+class FakeWriter:
+    """Rejects every batch holding a report marked ``bad``; fails the first ``outages`` calls"""
+
+    def __init__(self, outages=0):
+        self.outages = outages
+        self.calls = []
+        self.rows = []
+
+    def __call__(self, batch):
+        self.calls.append(len(batch))
+        if self.outages:
+            self.outages -= 1
+            raise psycopg2.OperationalError("connection lost")
+        if any(report.get("bad") for report in batch):
+            raise psycopg2.DataError("value out of range")
+        self.rows.extend(batch)
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(ingest.time, "sleep", sleeps.append)
+    return sleeps
+
+def reports(count, bad=()):
+    return [{"hostname": f"h{index}", "bad": index in bad} for index in range(count)]
+
+def test_batch_is_written_once():
+    writer = FakeWriter()
+    queue = IngestQueue(writer=writer)
+    queue._flush(reports(8))
+    assert writer.calls == [8]
+    assert queue.stats["written"] == 8 and queue.stats["dropped"] == 0
+
+def test_rejected_reports_are_isolated_and_dropped():
+    writer = FakeWriter()
+    queue = IngestQueue(writer=writer)
+    queue._flush(reports(16, bad={3, 11}))
+    assert sorted(report["hostname"] for report in writer.rows) == sorted(f"h{i}" for i in range(16) if i not in {3, 11})
+    assert queue.stats["written"] == 14
+    assert queue.stats["dropped"] == 2
+    assert queue.stats["batches"] == 1
+
+def test_transient_errors_retry_the_same_batch(no_backoff):
+    writer = FakeWriter(outages=2)
+    queue = IngestQueue(writer=writer)
+    queue._flush(reports(4))
+    assert writer.calls == [4, 4, 4]
+    assert no_backoff == [1, 2]
+    assert queue.stats["written"] == 4 and queue.stats["dropped"] == 0
+
+def test_batch_is_dropped_after_the_last_retry(no_backoff):
+    writer = FakeWriter(outages=ingest.INGEST_RETRY_ATTEMPTS)
+    queue = IngestQueue(writer=writer)
+    queue._flush(reports(5))
+    assert len(writer.calls) == ingest.INGEST_RETRY_ATTEMPTS
+    assert len(no_backoff) == ingest.INGEST_RETRY_ATTEMPTS - 1
+    assert queue.stats["written"] == 0 and queue.stats["dropped"] == 5
+
+def test_full_queue_rejects_without_blocking():
+    queue = IngestQueue(max_queue=2, writer=FakeWriter())
+    assert queue.submit({"hostname": "a"})
+    assert queue.submit({"hostname": "b"})
+    assert not queue.submit({"hostname": "c"})
+    assert queue.stats["accepted"] == 2 and queue.stats["rejected"] == 1
+
+def test_stop_drains_queued_reports():
+    writer = FakeWriter()
+    queue = IngestQueue(batch_size=3, flush_interval=60, writer=writer)
+    for report in reports(7):
+        queue.submit(report)
+    queue.start()
+    queue.stop(timeout=5)
+    assert len(writer.rows) == 7
+    assert not queue.submit({"hostname": "late"})
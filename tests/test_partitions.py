@@ -0,0 +1,105 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import partitions
+from partitions import (DEFAULT_PARTITION, drop_partitions_before, ensure_partitions, list_partitions,
+                        partition_name, partition_start, partition_step)
+
+UTC = timezone.utc
+
+class FakeCursor:
+    """Keeps the range partitions of ``reports`` and answers the catalog query partitions.py makes"""
+
+    def __init__(self, *starts, interval="daily"):
+        self.partitions = {}  # name -> (lower, upper)
+        for start in starts:
+            self.partitions[partition_name(start)] = (start, start + partition_step(interval))
+        self.statements = []
+        self._rows = []
+
+    def execute(self, sql, params=None):
+        sql = " ".join(sql.split())
+        self.statements.append(sql)
+        if "FROM pg_inherits" in sql:
+            self._rows = [{"name": DEFAULT_PARTITION, "bound": "DEFAULT"}] + [
+                {"name": name, "bound": f"FOR VALUES FROM ('{lower:%Y-%m-%d %H:%M:%S}+00') "
+                                        f"TO ('{upper:%Y-%m-%d %H:%M:%S}+00')"}
+                for name, (lower, upper) in self.partitions.items()
+            ]
+        elif sql.startswith("CREATE TABLE IF NOT EXISTS reports_p"):
+            self.partitions[sql.split()[5]] = params
+        elif sql.startswith("DROP TABLE"):
+            del self.partitions[sql.split()[2]]
+
+    def fetchall(self):
+        return self._rows
+
+@pytest.fixture
+def now(monkeypatch):
+    moment = datetime(2026, 10, 16, 13, 45, tzinfo=UTC)
+
+    class FrozenDatetime(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return moment
+
+    monkeypatch.setattr(partitions, "datetime", FrozenDatetime)
+    return moment
+
+def day(n):
+    return datetime(2026, 10, n, tzinfo=UTC)
+
+def test_daily_periods_start_at_utc_midnight():
+    assert partition_start(datetime(2026, 10, 16, 23, 59, tzinfo=UTC), "daily") == day(16)
+    assert partition_start(datetime(2026, 10, 17, 1, 30, tzinfo=timezone(timedelta(hours=3))), "daily") == day(16)
+    assert partition_start(datetime(2026, 10, 16, 12, 0), "daily") == day(16)  # naive means UTC
+
+def test_weekly_periods_start_on_monday():
+    assert partition_start(datetime(2026, 10, 16, 9, 0, tzinfo=UTC), "weekly") == day(12)
+    assert partition_start(day(12), "weekly") == day(12)
+    assert partition_step("weekly") == timedelta(weeks=1)
+    assert partition_step("daily") == timedelta(days=1)
+
+def test_partition_names_sort_by_period():
+    assert partition_name(day(5)) == "reports_p20261005"
+    names = [partition_name(day(1) + timedelta(days=offset)) for offset in (40, 3, 20)]
+    assert sorted(names) == [partition_name(day(1) + timedelta(days=offset)) for offset in (3, 20, 40)]
+
+def test_list_partitions_parses_bounds_and_skips_default():
+    cur = FakeCursor(day(16), day(14), day(15))
+    assert list_partitions(cur) == [
+        ("reports_p20261014", day(14), day(15)),
+        ("reports_p20261015", day(15), day(16)),
+        ("reports_p20261016", day(16), day(17)),
+    ]
+
+def test_ensure_partitions_fills_gaps_up_to_the_premade_range(now):
+    cur = FakeCursor(day(14), day(16))
+    created = ensure_partitions(cur, since=day(13), ahead=2, interval="daily")
+    assert created == 4  # 13, 15, 17 and 18; 14 and 16 already exist
+    assert sorted(cur.partitions) == [partition_name(day(n)) for n in range(13, 19)]
+    assert cur.partitions["reports_p20261018"] == (day(18), day(19))
+    assert f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF reports DEFAULT" in cur.statements
+
+def test_ensure_partitions_is_idempotent(now):
+    cur = FakeCursor()
+    ensure_partitions(cur, ahead=3, interval="daily")
+    assert ensure_partitions(cur, ahead=3, interval="daily") == 0
+    assert sorted(cur.partitions) == [partition_name(day(n)) for n in range(16, 20)]
+
+def test_weekly_partitions_cover_whole_weeks(now):
+    cur = FakeCursor(interval="weekly")
+    ensure_partitions(cur, ahead=1, interval="weekly")
+    assert cur.partitions == {
+        "reports_p20261012": (day(12), day(19)),
+        "reports_p20261019": (day(19), day(26)),
+    }
+
+def test_drop_keeps_partitions_that_reach_past_the_cutoff():
+    cur = FakeCursor(day(13), day(14), day(15), day(16))
+    dropped = drop_partitions_before(cur, datetime(2026, 10, 15, 6, 0, tzinfo=UTC))
+    assert dropped == ["reports_p20261013", "reports_p20261014"]
+    assert sorted(cur.partitions) == ["reports_p20261015", "reports_p20261016"]
+    assert "ALTER TABLE reports DETACH PARTITION reports_p20261013" in cur.statements
+    assert cur.statements[-1] == f"DELETE FROM {DEFAULT_PARTITION} WHERE timestamp < %s"
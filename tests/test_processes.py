@@ -0,0 +1,194 @@
+import contextlib
+from types import SimpleNamespace
+
+import psutil
+import pytest
+
+import processes
+from processes import ProcessTable
+
+class FakeSystem:
+    """Process list behind the psutil calls ProcessTable makes"""
+
+    def __init__(self):
+        self.processes = {}  # pid -> dict
+        self.created = 0  # psutil.Process objects constructed
+        self.detail_reads = 0  # memory_info calls
+
+    def start(self, pid, name, create_time=1.0, cpu=0.0, rss=1000, io=0, denied=False):
+        self.processes[pid] = {"name": name, "create_time": create_time, "cpu": cpu, "rss": rss, "io": io,
+                               "denied": denied}
+
+    def pids(self):
+        return list(self.processes)
+
+    def Process(self, pid):
+        if pid not in self.processes:
+            raise psutil.NoSuchProcess(pid)
+        self.created += 1
+        return FakeProcess(self, pid)
+
+class FakeProcess:
+    def __init__(self, system, pid):
+        self.system = system
+        self.pid = pid
+
+    def _state(self):
+        state = self.system.processes.get(self.pid)
+        if state is None:
+            raise psutil.NoSuchProcess(self.pid)
+        return state
+
+    def create_time(self):
+        if self._state()["denied"]:
+            raise psutil.AccessDenied(self.pid)
+        return self._state()["create_time"]
+
+    def name(self):
+        return self._state()["name"]
+
+    def oneshot(self):
+        return contextlib.nullcontext()
+
+    def cpu_times(self):
+        if self._state()["denied"]:
+            raise psutil.AccessDenied(self.pid)
+        return SimpleNamespace(user=self._state()["cpu"], system=0.0)
+
+    def memory_info(self):
+        self.system.detail_reads += 1
+        return SimpleNamespace(rss=self._state()["rss"])
+
+    def io_counters(self):
+        return SimpleNamespace(read_bytes=self._state()["io"], write_bytes=0)
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def system(monkeypatch):
+    system = FakeSystem()
+    monkeypatch.setattr(processes.psutil, "pids", system.pids)
+    monkeypatch.setattr(processes.psutil, "Process", system.Process)
+    return system
+
+def tick(table, clock, system, seconds=10.0, **usage):
+    """Advance time by ``seconds`` during which each named pid used ``usage[pid]`` CPU seconds"""
+    clock.now += seconds
+    for pid, cpu_seconds in usage.items():
+        system.processes[int(pid[1:])]["cpu"] += cpu_seconds
+    table.update()
+
+def test_cpu_percent_comes_from_deltas_between_ticks(system):
+    system.start(1, "busy.exe")
+    system.start(2, "idle.exe")
+    clock = Clock()
+    table = ProcessTable(clock=clock)
+    table.update()
+    assert table.top(5, "cpu") == []  # one sample: no delta yet
+
+    tick(table, clock, system, p1=5.0, p2=0.1)
+    top = table.top(5, "cpu")
+    assert [entry["name"] for entry in top] == ["busy.exe", "idle.exe"]
+    assert top[0]["cpu"] == pytest.approx(50.0)
+    assert top[1]["cpu"] == pytest.approx(1.0)
+
+def test_top_by_memory_and_io(system):
+    system.start(1, "small.exe", rss=10)
+    system.start(2, "large.exe", rss=500)
+    system.start(3, "medium.exe", rss=50)
+    clock = Clock()
+    table = ProcessTable(clock=clock)
+    table.update()
+    system.processes[3]["io"] += 2000
+    system.processes[2]["rss"] += 100
+    tick(table, clock, system)
+
+    assert [entry["name"] for entry in table.top(2, "memory")] == ["large.exe", "medium.exe"]
+    assert table.top(1, "memory")[0]["rss_delta"] == 100
+    assert table.top(1, "io")[0] == {**table.top(1, "io")[0], "name": "medium.exe", "io_rate": 200.0}
+
+def test_setup_work_follows_churn(system):
+    for pid in range(1, 101):
+        system.start(pid, f"p{pid}.exe")
+    clock = Clock()
+    table = ProcessTable(clock=clock)
+    table.update()
+    assert system.created == 100
+
+    tick(table, clock, system)
+    assert system.created == 100  # no new processes, no new Process objects
+
+    del system.processes[5]
+    system.start(200, "new.exe")
+    tick(table, clock, system)
+    assert system.created == 101
+    assert {key: table.stats[key] for key in ("processes", "added", "evicted", "denied")} == \
+        {"processes": 100, "added": 101, "evicted": 1, "denied": 0}
+
+def test_memory_and_io_are_read_only_for_candidates(system):
+    for pid in range(1, 201):
+        system.start(pid, f"p{pid}.exe", rss=pid)
+    clock = Clock()
+    table = ProcessTable(clock=clock, detail=4)
+    table.update()
+    assert system.detail_reads == 200  # every process once, when it is new
+
+    system.detail_reads = 0
+    for _ in range(5):
+        tick(table, clock, system, p7=3.0)
+    assert 4 * 5 <= system.detail_reads <= 4 * 4 * 5
+    assert table.stats["detail_reads"] == 200 + system.detail_reads
+    assert table.top(1, "cpu")[0]["name"] == "p7.exe"
+    assert [entry["name"] for entry in table.top(2, "memory")] == ["p200.exe", "p199.exe"]
+
+def test_every_entry_is_refreshed_within_processes_per_detail_ticks(system):
+    for pid in range(1, 41):
+        system.start(pid, f"p{pid}.exe", rss=1000)
+    clock = Clock()
+    table = ProcessTable(clock=clock, detail=4)
+    table.update()
+
+    system.processes[33]["rss"] = 10 ** 9
+    for ticks in range(1, 11):
+        tick(table, clock, system)
+        if table.top(1, "memory")[0]["name"] == "p33.exe":
+            break
+    assert table.top(1, "memory")[0] == {**table.top(1, "memory")[0], "name": "p33.exe", "memory_rss": 10 ** 9}
+    assert ticks <= 40 // 4
+
+def test_reused_pid_starts_a_new_entry(system):
+    system.start(7, "old.exe", create_time=1.0, cpu=50.0)
+    clock = Clock()
+    table = ProcessTable(clock=clock)
+    table.update()
+
+    system.start(7, "new.exe", create_time=2.0, cpu=1.0)  # exited and replaced between two ticks
+    tick(table, clock, system)
+    assert list(table.entries) == [(7, 2.0)]
+    assert table.entries[(7, 2.0)].name == "new.exe"
+    assert table.top(5, "cpu") == []  # the new process has a single sample
+
+    tick(table, clock, system, p7=2.0)
+    assert table.top(5, "cpu")[0]["cpu"] == pytest.approx(20.0)
+
+def test_protected_processes_are_listed_without_counters(system):
+    system.start(4, "System", denied=True)
+    system.start(0, "System Idle Process", cpu=1000.0)
+    clock = Clock()
+    table = ProcessTable(clock=clock)
+    table.update()
+    tick(table, clock, system, p0=10.0)
+
+    assert (4, None) in table.entries
+    assert table.stats["denied"] == 1
+    assert table.top(5, "cpu") == []  # the idle process is never listed
+
+def test_sample_returns_all_three_rankings(system):
+    system.start(1, "a.exe")
+    table = ProcessTable(clock=Clock())
+    assert set(table.sample()) == {"cpu", "memory", "io"}
@@ -0,0 +1,111 @@
+import copy
+import gzip
+
+import pytest
+
+import protocol
+from protocol import (CBOR, GZIP, IDENTITY, JSON, MSGPACK, PROTOCOL_VERSION, ZSTD, UnsupportedEncoding,
+                      apply_delta, cbor2, decode_body, delta_message, diff_documents, encode_body, full_message,
+                      msgpack, negotiate, resolve_message, zstandard)
+
+BASE = {
+    "hostname": "pc-01",
+    "cpu": {"percent": 12.5, "count": 8, "frequency": {"current": 2900.0, "max": 2900.0}},
+    "memory": {"percent": 40.0, "used": 4096},
+    "disk": {"C:": {"percent": 51.0, "free": 100}, "D:": {"percent": 10.0, "free": 900}},
+    "top_processes": [{"pid": 1, "name": "a.exe", "cpu": 3.0}],
+    "process_count": 120,
+}
+
+def changed(document):
+    new = copy.deepcopy(document)
+    new["cpu"]["percent"] = 80.0
+    new["cpu"]["frequency"]["current"] = 3100.0
+    del new["disk"]["D:"]
+    new["disk"]["E:"] = {"percent": 1.0, "free": 5}
+    new["top_processes"] = [{"pid": 2, "name": "b.exe", "cpu": 70.0}]
+    del new["process_count"]
+    new["swap"] = {"percent": 3.0}
+    return new
+
+def test_diff_then_apply_round_trips():
+    new = changed(BASE)
+    changes, removed = diff_documents(BASE, new)
+    assert apply_delta(BASE, changes, removed) == new
+
+def test_diff_contains_only_what_changed():
+    changes, removed = diff_documents(BASE, changed(BASE))
+    assert changes["cpu"] == {"percent": 80.0, "frequency": {"current": 3100.0}}
+    assert "memory" not in changes
+    assert sorted(removed) == [["disk", "D:"], ["process_count"]]
+
+def test_identical_documents_give_an_empty_delta():
+    assert diff_documents(BASE, copy.deepcopy(BASE)) == ({}, [])
+
+def test_apply_delta_does_not_mutate_the_base():
+    original = copy.deepcopy(BASE)
+    changes, removed = diff_documents(BASE, changed(BASE))
+    apply_delta(BASE, changes, removed)
+    assert BASE == original
+
+def test_apply_delta_ignores_missing_removed_paths():
+    assert apply_delta(BASE, {}, [["nope"], ["cpu", "nope", "deeper"]]) == BASE
+
+def test_resolve_delta_against_matching_snapshot():
+    new = changed(BASE)
+    snapshot = dict(BASE, seq=7)
+    message = delta_message(BASE, new, 7)
+    data = resolve_message(message, lambda hostname, seq: snapshot)
+    assert data == dict(new, seq=8)
+
+def test_resolve_delta_with_stale_base_asks_for_resync():
+    message = delta_message(BASE, changed(BASE), 7)
+    assert resolve_message(message, lambda hostname, seq: dict(BASE, seq=6)) is None
+    assert resolve_message(message, lambda hostname, seq: None) is None
+
+def test_resolve_full_and_legacy_messages():
+    data = resolve_message(full_message(BASE, 1), lambda hostname, seq: None)
+    assert data == dict(BASE, seq=1)
+    assert resolve_message(BASE, lambda hostname, seq: None) is BASE
+    assert full_message(BASE, 1)["protocol"] == PROTOCOL_VERSION
+
+@pytest.mark.parametrize("content_encoding", [IDENTITY, GZIP, ZSTD])
+@pytest.mark.parametrize("content_type", [JSON, MSGPACK, CBOR])
+def test_encode_decode_round_trip(content_type, content_encoding):
+    if (content_type == MSGPACK and msgpack is None or content_type == CBOR and cbor2 is None
+            or content_encoding == ZSTD and zstandard is None):
+        pytest.skip("optional codec not installed")
+    message = delta_message(BASE, changed(BASE), 3)
+    body = encode_body(message, content_type, content_encoding)
+    assert decode_body(body, content_type, content_encoding) == message
+
+@pytest.mark.skipif(msgpack is None, reason="msgpack not installed")
+def test_binary_bodies_use_field_ids_and_keep_unknown_keys():
+    document = dict(BASE, custom_field={"percent": 1})
+    body = encode_body(document, MSGPACK)
+    assert b"percent" not in body
+    assert b"custom_field" in body
+    assert len(body) < len(encode_body(document, JSON))
+    assert decode_body(body, MSGPACK) == document
+
+def test_content_type_parameters_and_case_are_ignored():
+    body = encode_body(BASE, JSON, GZIP)
+    assert decode_body(body, "Application/JSON; charset=utf-8", " GZIP ") == BASE
+
+def test_unknown_encoding_is_rejected():
+    with pytest.raises(UnsupportedEncoding):
+        decode_body(b"{}", JSON, "br")
+    with pytest.raises(UnsupportedEncoding):
+        encode_body({}, "text/plain")
+
+def test_oversized_bodies_are_refused(monkeypatch):
+    monkeypatch.setattr(protocol, "MAX_DECODED_SIZE", 1024)
+    body = gzip.compress(b"[" + b"0," * 4096 + b"0]")
+    with pytest.raises(ValueError):
+        decode_body(body, JSON, GZIP)
+
+def test_negotiate_picks_the_best_format_both_sides_support():
+    assert negotiate([JSON], [GZIP, IDENTITY]) == (JSON, GZIP)
+    assert negotiate(None, None) == (JSON, IDENTITY)
+    if msgpack is not None and zstandard is not None:
+        assert negotiate([JSON, MSGPACK], [IDENTITY, GZIP, ZSTD]) == (MSGPACK, ZSTD)
@@ -0,0 +1,147 @@
+import pytest
+
+from recommender import RecommendationEngine, RecommenderRunner, Rule, load_rules, required_slots
+from statecache import MemoryStateCache
+
+def sample(hostname, epoch, cpu=10.0, memory=10.0, **fields):
+    return {"hostname": hostname, "last_seen": epoch, "cpu": {"percent": cpu}, "memory": {"percent": memory}, **fields}
+
+def cpu_rule(duration=0, threshold=80):
+    return Rule("high_cpu", "cpu", ">", threshold, duration, message="{host} cpu {value:g} for {duration}")
+
+def feed(engine, hostname, start, values, interval=10):
+    for offset, value in enumerate(values):
+        engine.observe(sample(hostname, start + offset * interval, cpu=value))
+    return start + (len(values) - 1) * interval
+
+def test_rule_without_duration_follows_the_latest_sample():
+    engine = RecommendationEngine([cpu_rule()], window_slots=10)
+    now = feed(engine, "a", 1000, [10, 95])
+    assert engine.evaluate(now) == {"a": ["a cpu 95 for 0 s"]}
+    now = feed(engine, "a", now + 10, [10])
+    assert engine.evaluate(now) == {"a": []}
+
+def test_duration_needs_every_sample_in_the_window_to_breach():
+    engine = RecommendationEngine([cpu_rule(duration=60)], window_slots=20)
+    now = feed(engine, "a", 1000, [90] * 6)
+    assert engine.evaluate(now) == {"a": []}  # 50 s of history, not 60
+    now = feed(engine, "a", now + 10, [90])
+    assert engine.evaluate(now) == {"a": ["a cpu 90 for 1 min"]}
+    now = feed(engine, "a", now + 10, [50, 90])
+    assert engine.evaluate(now) == {"a": []}
+
+def test_a_gap_in_the_metric_ends_the_duration():
+    engine = RecommendationEngine([cpu_rule(duration=30)], window_slots=10)
+    feed(engine, "a", 1000, [90, 90])
+    engine.observe({"hostname": "a", "last_seen": 1020})
+    now = feed(engine, "a", 1030, [90, 90, 90])
+    assert engine.evaluate(now) == {"a": []}
+    now = feed(engine, "a", now + 10, [90])
+    assert engine.evaluate(now) == {"a": ["a cpu 90 for 30 s"]}
+
+def test_stale_hosts_are_not_reported():
+    engine = RecommendationEngine([cpu_rule()], window_slots=10, stale_after=120)
+    now = feed(engine, "a", 1000, [95])
+    assert engine.evaluate(now + 120) == {"a": ["a cpu 95 for 0 s"]}
+    assert engine.evaluate(now + 121) == {"a": []}
+
+def test_repeated_sample_is_ignored():
+    engine = RecommendationEngine([cpu_rule()], window_slots=10)
+    assert engine.observe(sample("a", 1000, cpu=95))
+    assert not engine.observe(sample("a", 1000, cpu=10))
+    assert engine.evaluate(1000) == {"a": ["a cpu 95 for 0 s"]}
+
+def test_overrides_match_hostname_patterns():
+    overrides = {
+        "db-*": {"high_cpu": {"threshold": 95, "for": 20}},
+        "BUILD-*": {"high_cpu": {"enabled": False}},
+    }
+    engine = RecommendationEngine([cpu_rule()], overrides, window_slots=10)
+    for hostname in ("web-1", "db-1", "build-7"):
+        now = feed(engine, hostname, 1000, [90, 90, 90])
+    assert engine.evaluate(now) == {"web-1": ["web-1 cpu 90 for 0 s"], "db-1": [], "build-7": []}
+
+    now = feed(engine, "db-1", now + 10, [97, 97])
+    assert engine.evaluate(now)["db-1"] == []
+    now = feed(engine, "db-1", now + 10, [97])
+    assert engine.evaluate(now)["db-1"] == ["db-1 cpu 97 for 20 s"]
+
+def test_process_rule_watches_matching_processes():
+    rule = Rule("java_memory", "memory_rss", ">", 1000, process="java*", message="{process} {value:g}")
+    engine = RecommendationEngine([rule], window_slots=10)
+    engine.observe(sample("a", 1000, top_memory_processes=[{"name": "Java.exe", "memory_rss": 1500}]))
+    engine.observe(sample("b", 1000, top_memory_processes=[{"name": "python", "memory_rss": 5000}]))
+    assert engine.evaluate(1000) == {"a": ["java* 1500"], "b": []}
+
+def test_many_hosts_grow_the_buffers():
+    engine = RecommendationEngine([cpu_rule()], window_slots=4)
+    for index in range(150):
+        engine.observe(sample(f"h{index:03d}", 1000, cpu=90 if index % 2 else 10))
+    results = engine.evaluate(1000)
+    assert len(results) == 150
+    assert sum(1 for recommendations in results.values() if recommendations) == 75
+
+def test_required_slots_covers_rules_and_overrides():
+    rules = [cpu_rule(duration=60), cpu_rule()]
+    assert required_slots(rules, report_interval=10) == 7
+    assert required_slots(rules, {"*": {"high_cpu": {"for": 300}}}, report_interval=10) == 31
+    assert required_slots([], report_interval=10) == 1
+
+def test_window_is_widened_for_long_durations():
+    engine = RecommendationEngine([cpu_rule(duration=300)], window_slots=10, report_interval=10)
+    assert engine.window_slots == 31
+    now = feed(engine, "a", 1000, [90] * 31)
+    assert engine.evaluate(now) == {"a": ["a cpu 90 for 5 min"]}
+
+def test_rules_are_validated():
+    with pytest.raises(ValueError):
+        Rule("bad", "cpu", op="!=")
+    with pytest.raises(ValueError):
+        Rule("bad", "temperature")
+    with pytest.raises(ValueError):
+        Rule("bad", "swap", process="java")
+
+def test_default_rules_load():
+    rules, overrides = load_rules(None)
+    assert [rule.name for rule in rules] == ["high_cpu", "high_memory", "high_disk"]
+    assert overrides == {}
+
+class HeldLock:
+    held = True
+
+    def acquire(self):
+        return True
+
+    def release(self):
+        pass
+
+def test_runner_publishes_only_changed_recommendations():
+    cache = MemoryStateCache()
+    engine = RecommendationEngine([cpu_rule()], window_slots=10)
+    runner = RecommenderRunner(cache, engine, lock=HeldLock())
+
+    cache.put("a", sample("a", 1000, cpu=95))
+    runner.tick(now=1000)
+    assert cache.annotations("a") == {"recommendations": ["a cpu 95 for 0 s"]}
+    generation = cache.generation()
+    runner.tick(now=1000)
+    assert cache.generation() == generation
+
+    cache.put("a", sample("a", 1010, cpu=10))
+    runner.tick(now=1010)
+    assert cache.annotations("a") == {"recommendations": []}
+    assert runner.stats["published"] == 2
+
+def test_runner_starts_over_on_a_rebuilt_cache():
+    cache = MemoryStateCache()
+    engine = RecommendationEngine([cpu_rule()], window_slots=10)
+    runner = RecommenderRunner(cache, engine, lock=HeldLock())
+    for epoch in range(1000, 1050, 10):
+        cache.put("a", sample("a", epoch, cpu=10))
+    runner.tick(now=1040)
+
+    rebuilt = MemoryStateCache()
+    rebuilt.put("b", sample("b", 1050, cpu=95))
+    runner.cache = rebuilt
+    runner.tick(now=1050)
+    assert rebuilt.annotations("b") == {"recommendations": ["b cpu 95 for 0 s"]}
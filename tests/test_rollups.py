@@ -0,0 +1,174 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from rollups import (
+    PERCENT_BINS, RATE_BINS, RateTracker, RollupAccumulator, bin_bounds, bin_value, bucket_start,
+    choose_resolution, hist_bin, hist_percentile, hist_size, histogram_bins, merge_histograms, summarize_bucket,
+    summarize_fleet_bucket, window_resolution
+)
+
+ROW_FIELDS = ["hostname", "bucket", "samples"] + [
+    f"{metric}_{field}"
+    for metric in ("cpu", "memory", "disk", "net_sent", "net_recv")
+    for field in ("min", "max", "sum", "count", "hist")
+]
+
+@pytest.mark.parametrize("value, expected", [(-5, 0), (0, 0), (1.99, 0), (2, 1), (50, 25), (99.9, 49), (100, 49), (250, 49)])
+def test_percent_bins_are_two_percent_wide(value, expected):
+    assert hist_bin(value, "percent") == expected
+
+@pytest.mark.parametrize("value, expected", [(0, 0), (0.5, 0), (1, 0), (2, 1), (3, 1), (4, 2), (1023, 9), (1024, 10), (2.0 ** 60, RATE_BINS - 1)])
+def test_rate_bins_are_powers_of_two(value, expected):
+    assert hist_bin(value, "rate") == expected
+
+@pytest.mark.parametrize("kind, size", [("percent", PERCENT_BINS), ("rate", RATE_BINS)])
+def test_every_bin_holds_its_own_representative_value(kind, size):
+    assert hist_size(kind) == size
+    for index in range(size):
+        assert hist_bin(bin_value(index, kind), kind) == index
+
+def test_percentile_of_empty_histogram_is_none():
+    assert hist_percentile([0] * PERCENT_BINS, 0.95, "percent") is None
+    assert hist_percentile(None, 0.5, "rate") is None
+
+def test_percentile_walks_the_cumulative_counts():
+    hist = [0] * PERCENT_BINS
+    hist[hist_bin(10, "percent")] = 90
+    hist[hist_bin(80, "percent")] = 10
+    assert hist_percentile(hist, 0.5, "percent") == bin_value(5, "percent")
+    assert hist_percentile(hist, 0.9, "percent") == bin_value(5, "percent")
+    assert hist_percentile(hist, 0.95, "percent") == bin_value(40, "percent")
+    assert hist_percentile(hist, 1.0, "percent") == bin_value(40, "percent")
+
+def test_percentile_is_clamped_to_known_min_and_max():
+    hist = [0] * PERCENT_BINS
+    hist[hist_bin(50.3, "percent")] = 4
+    assert hist_percentile(hist, 0.5, "percent") == 51.0
+    assert hist_percentile(hist, 0.5, "percent", lower=50.3, upper=50.4) == 50.4
+    assert hist_percentile(hist, 0.5, "percent", lower=51.5, upper=51.9) == 51.5
+
+def test_rate_percentile_lands_in_the_right_power_of_two():
+    hist = [0] * RATE_BINS
+    for value in (100, 200, 300, 5000):
+        hist[hist_bin(value, "rate")] += 1
+    assert 128 <= hist_percentile(hist, 0.5, "rate") < 256
+    assert hist_percentile(hist, 0.99, "rate", upper=5000) == 5000
+
+def test_bucket_start_floors_to_the_resolution():
+    assert bucket_start(3725, 300) == datetime(1970, 1, 1, 1, 0, tzinfo=timezone.utc)
+    assert bucket_start(3725, 60) == datetime(1970, 1, 1, 1, 2, tzinfo=timezone.utc)
+
+def test_choose_resolution_prefers_raw_then_the_finest_rollup_that_fits():
+    assert choose_resolution(1, max_points=1000, report_interval=10) == "raw"
+    assert choose_resolution(10, max_points=1000, report_interval=10) == "1m"
+    assert choose_resolution(24, max_points=1000, report_interval=10) == "5m"
+    assert choose_resolution(24 * 30, max_points=1000, report_interval=10) == "1h"
+    assert choose_resolution(24 * 365, max_points=1000, report_interval=10) == "1h"
+
+def test_rate_tracker_ignores_first_sample_and_counter_resets():
+    tracker = RateTracker()
+    assert tracker.update("a", 100, 1000, 2000) == (None, None)
+    assert tracker.update("a", 110, 2000, 2500) == (100.0, 50.0)
+    assert tracker.update("a", 120, 10, 2600) == (None, None)
+    assert tracker.update("a", 120, 20, 2700) == (None, None)
+    assert tracker.update("a", 130, 120, 2800) == (10.0, 10.0)
+
+def test_accumulator_rows_match_summarize_bucket():
+    accumulator = RollupAccumulator()
+    for offset, cpu in enumerate((10.0, 20.0, 30.0, 95.0)):
+        accumulator.add("a", 600 + offset, {"cpu": cpu, "net_sent": 1000.0 * (offset + 1)})
+    assert len(accumulator) == 3
+
+    (row,) = accumulator.rows("5m")
+    point = summarize_bucket(dict(zip(ROW_FIELDS, row)))
+
+    assert point["samples"] == 4
+    assert point["cpu_avg"] == pytest.approx(38.75)
+    assert (point["cpu_min"], point["cpu_max"]) == (10.0, 95.0)
+    assert point["cpu_p95"] == 95.0
+    assert point["cpu_percent"] == pytest.approx(38.75)
+    assert point["memory_avg"] is None and point["memory_p95"] is None
+    assert point["memory_percent"] == 0
+    assert 1000.0 <= point["net_sent_p95"] <= 4000.0
+
+@pytest.mark.parametrize("kind, size", [("percent", PERCENT_BINS), ("rate", RATE_BINS)])
+def test_bin_bounds_enclose_their_bin(kind, size):
+    for index in range(size):
+        lower, upper = bin_bounds(index, kind)
+        assert lower <= bin_value(index, kind) < upper
+        if index:
+            assert hist_bin(lower, kind) == index
+            assert bin_bounds(index - 1, kind)[1] == lower
+
+def test_merge_histograms_sums_and_skips_missing():
+    assert merge_histograms([[1, 0, 2], None, [0, 3, 1], []]) == [1, 3, 3]
+    assert merge_histograms(iter([None, []])) is None
+
+def test_merge_does_not_alias_its_input():
+    first = [1, 2]
+    merged = merge_histograms([first])
+    merged[0] = 9
+    assert first == [1, 2]
+
+def test_merged_host_histograms_give_the_fleet_percentile():
+    per_host = {"a": [5.0] * 90, "b": [60.0] * 5, "c": [97.0] * 5}
+    hists = []
+    for values in per_host.values():
+        hist = [0] * PERCENT_BINS
+        for value in values:
+            hist[hist_bin(value, "percent")] += 1
+        hists.append(hist)
+    merged = merge_histograms(hists)
+
+    everything = [0] * PERCENT_BINS
+    for value in (value for values in per_host.values() for value in values):
+        everything[hist_bin(value, "percent")] += 1
+    assert merged == everything
+    assert hist_percentile(merged, 0.9, "percent") == bin_value(hist_bin(5.0, "percent"), "percent")
+    assert hist_percentile(merged, 0.95, "percent") == bin_value(hist_bin(60.0, "percent"), "percent")
+    assert hist_percentile(merged, 0.99, "percent", upper=97.0) == 97.0
+
+def test_window_resolution_caps_buckets_per_host():
+    assert window_resolution(0.25) == "1m"
+    assert window_resolution(1) == "5m"
+    assert window_resolution(24) == "1h"
+    assert window_resolution(24 * 7) == "1h"
+
+def test_summarize_fleet_bucket():
+    hist = [0] * PERCENT_BINS
+    for value in (10.0, 20.0, 30.0, 90.0):
+        hist[hist_bin(value, "percent")] += 1
+    row = {
+        "bucket": datetime(2026, 10, 16, 12, 0, tzinfo=timezone.utc), "hosts": 2, "samples": 4,
+        "cpu_min": 10.0, "cpu_max": 90.0, "cpu_sum": 150.0, "cpu_count": 4, "cpu_hist": hist,
+    }
+    point = summarize_fleet_bucket(row, "cpu", quantiles=(0.5, 0.999))
+    assert point == {
+        "timestamp": "2026-10-16T12:00:00+00:00", "hosts": 2, "samples": 4,
+        "avg": 37.5, "min": 10.0, "max": 90.0,
+        "p50": bin_value(hist_bin(20.0, "percent"), "percent"), "p99.9": 90.0,
+    }
+
+def test_summarize_fleet_bucket_without_samples():
+    row = {
+        "bucket": datetime(2026, 10, 16, tzinfo=timezone.utc), "hosts": 3, "samples": 6,
+        "net_sent_min": None, "net_sent_max": None, "net_sent_sum": 0.0, "net_sent_count": 0, "net_sent_hist": None,
+    }
+    point = summarize_fleet_bucket(row, "net_sent")
+    assert (point["avg"], point["p50"], point["p95"], point["p99"]) == (None, None, None, None)
+
+def test_histogram_bins_lists_non_empty_bins():
+    hist = [0] * PERCENT_BINS
+    hist[0], hist[3] = 2, 1
+    assert histogram_bins(hist, "percent") == [
+        {"lower": 0.0, "upper": 2.0, "count": 2},
+        {"lower": 6.0, "upper": 8.0, "count": 1},
+    ]
+    rate = [0] * RATE_BINS
+    rate[0], rate[10] = 4, 1
+    assert histogram_bins(rate, "rate") == [
+        {"lower": 0.0, "upper": 2.0, "count": 4},
+        {"lower": 1024.0, "upper": 2048.0, "count": 1},
+    ]
+    assert histogram_bins(None, "rate") == []
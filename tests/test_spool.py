@@ -0,0 +1,84 @@
+import os
+
+from spool import HEADER, SpoolBuffer, _segment_name
+
+def open_spool(directory, **options):
+    options.setdefault("fsync", False)
+    return SpoolBuffer(str(directory), **options)
+
+def drain(spool, **options):
+    records = []
+    while True:
+        batch, position = spool.read_batch(**options)
+        if not batch:
+            return records
+        records.extend(batch)
+        spool.commit(position)
+
+def test_records_come_back_in_order(tmp_path):
+    spool = open_spool(tmp_path)
+    for index in range(10):
+        spool.append({"seq": index})
+    assert [record["seq"] for record in drain(spool, max_records=3)] == list(range(10))
+    assert not spool
+
+def test_uncommitted_batch_is_read_again(tmp_path):
+    spool = open_spool(tmp_path)
+    for index in range(5):
+        spool.append({"seq": index})
+    first, _ = spool.read_batch(max_records=3)
+    again, position = spool.read_batch(max_records=3)
+    assert first == again == [{"seq": 0}, {"seq": 1}, {"seq": 2}]
+    spool.commit(position)
+    rest, _ = spool.read_batch()
+    assert rest == [{"seq": 3}, {"seq": 4}]
+
+def test_cursor_survives_a_restart(tmp_path):
+    spool = open_spool(tmp_path)
+    for index in range(6):
+        spool.append({"seq": index})
+    _, position = spool.read_batch(max_records=4)
+    spool.commit(position)
+    spool.close()
+
+    reopened = open_spool(tmp_path)
+    assert [record["seq"] for record in drain(reopened)] == [4, 5]
+
+def test_torn_tail_is_cut_off_on_reopen(tmp_path):
+    spool = open_spool(tmp_path)
+    spool.append({"seq": 0})
+    spool.append({"seq": 1})
+    spool.close()
+    path = os.path.join(tmp_path, _segment_name(1))
+    intact = os.path.getsize(path)
+    with open(path, "ab") as f:
+        f.write(HEADER.pack(100, 0) + b'{"seq": 2')  # crash in the middle of a write
+
+    reopened = open_spool(tmp_path)
+    assert os.path.getsize(path) == intact
+    reopened.append({"seq": 3})
+    assert [record["seq"] for record in drain(reopened)] == [0, 1, 3]
+
+def test_crc_mismatch_ends_the_segment(tmp_path):
+    spool = open_spool(tmp_path)
+    for index in range(3):
+        spool.append({"seq": index})
+    spool.close()
+    path = os.path.join(tmp_path, _segment_name(1))
+    with open(path, "r+b") as f:
+        data = f.read()
+        second = data.index(b'{"seq":1}')
+        f.seek(second)
+        f.write(b'{"seq":9}')  # same length, wrong checksum
+
+    reopened = open_spool(tmp_path)
+    assert [record["seq"] for record in drain(reopened)] == [0]
+
+def test_size_cap_drops_the_oldest_segments(tmp_path):
+    spool = open_spool(tmp_path, max_bytes=2000, segment_bytes=500)
+    for index in range(100):
+        spool.append({"seq": index, "padding": "x" * 20})
+    records = drain(spool)
+    assert spool.dropped_records > 0
+    assert len(records) + spool.dropped_records == 100
+    assert [record["seq"] for record in records] == list(range(100 - len(records), 100))
@@ -0,0 +1,119 @@
+import json
+import threading
+
+import pytest
+
+from statecache import MemoryStateCache, SQLiteStateCache, StateCache
+
+@pytest.fixture(params=["memory", "sqlite"])
+def cache(request, tmp_path):
+    if request.param == "memory":
+        return MemoryStateCache()
+    return SQLiteStateCache(str(tmp_path / "state.sqlite"))
+
+def report(hostname, last_seen, **fields):
+    return {"hostname": hostname, "last_seen": last_seen, **fields}
+
+def test_put_bumps_the_generation(cache):
+    assert cache.generation() == 0
+    assert cache.put("a", report("a", 1)) == 1
+    assert cache.put("b", report("b", 2)) == 2
+    assert cache.put("a", report("a", 3)) == 3
+    assert cache.generation() == 3
+    assert len(cache) == 2
+
+def test_get_returns_the_latest_report(cache):
+    assert cache.get("a") is None
+    cache.put("a", report("a", 1, cpu=5))
+    cache.put("a", report("a", 2.7, cpu=7))
+    assert cache.get("a")["cpu"] == 7
+
+def test_snapshot_is_ordered_by_last_seen_with_whole_seconds(cache):
+    cache.put("old", report("old", 100.9))
+    cache.put("new", report("new", 200.2))
+    _, body = cache.snapshot()
+    clients = json.loads(body)
+    assert list(clients) == ["new", "old"]
+    assert clients["old"]["last_seen"] == 100
+
+def test_snapshot_is_memoized_per_generation(cache):
+    cache.put("a", report("a", 1))
+    etag, body = cache.snapshot()
+    assert cache.snapshot()[1] is body
+    cache.put("a", report("a", 2))
+    new_etag, new_body = cache.snapshot()
+    assert new_etag != etag
+    assert new_body is not body
+    assert etag.rsplit("-", 1)[1] == "1" and new_etag.rsplit("-", 1)[1] == "2"
+
+def test_etag_differs_between_rebuilt_caches():
+    first, second = MemoryStateCache(), MemoryStateCache()
+    first.put("a", report("a", 1))
+    second.put("a", report("a", 1))
+    assert first.snapshot()[0] != second.snapshot()[0]
+
+def test_changes_since_lists_each_host_once_oldest_first(cache):
+    cache.put("a", report("a", 1))
+    cache.put("b", report("b", 1))
+    cache.put("c", report("c", 1))
+    cache.put("a", report("a", 2))
+    changes = cache.changes_since(1)
+    assert [(hostname, generation) for hostname, generation, _ in changes] == [("b", 2), ("c", 3), ("a", 4)]
+    assert json.loads(changes[-1][2])["last_seen"] == 2
+    assert cache.changes_since(cache.generation()) == []
+
+def test_annotations_are_merged_and_survive_new_reports(cache):
+    assert cache.annotate("missing", {"recommendations": []}) is None
+    cache.put("a", report("a", 1, cpu=5))
+    generation = cache.annotate("a", {"recommendations": ["add memory"]})
+    assert generation == cache.generation() == 2
+    assert cache.annotations("a") == {"recommendations": ["add memory"]}
+    assert cache.get("a") == report("a", 1, cpu=5)
+
+    cache.put("a", report("a", 2, cpu=6))
+    clients = json.loads(cache.snapshot()[1])
+    assert clients["a"]["recommendations"] == ["add memory"]
+    assert clients["a"]["cpu"] == 6
+    (change,) = cache.changes_since(2)
+    assert json.loads(change[2])["recommendations"] == ["add memory"]
+
+def test_annotate_reports_the_host_as_changed(cache):
+    cache.put("a", report("a", 1))
+    cache.put("b", report("b", 1))
+    cache.annotate("a", {"flag": True})
+    assert [hostname for hostname, _, _ in cache.changes_since(2)] == ["a"]
+
+def test_load_skips_documents_without_hostname(cache):
+    cache.load([report("a", 1), {"last_seen": 2}, report("", 3)])
+    assert len(cache) == 1
+
+def test_sqlite_cache_is_shared_through_its_file(tmp_path):
+    path = str(tmp_path / "state.sqlite")
+    writer, reader = SQLiteStateCache(path), SQLiteStateCache(path)
+    writer.put("a", report("a", 1))
+    assert reader.generation() == 1
+    assert reader.get("a") == report("a", 1)
+    assert reader.snapshot()[0] == writer.snapshot()[0]
+
+def test_rebuilt_sqlite_file_has_a_new_instance(tmp_path):
+    path = tmp_path / "state.sqlite"
+    cache = SQLiteStateCache(str(path))
+    cache.put("a", report("a", 1))
+    before = cache.snapshot()[0]
+    for leftover in tmp_path.iterdir():
+        leftover.unlink()
+
+    rebuilt = SQLiteStateCache(str(path))
+    result = {}
+    reader = threading.Thread(target=lambda: result.update(instance=cache._instance()))
+    reader.start()
+    reader.join()
+    assert result["instance"] == rebuilt._instance() != before.rsplit("-", 1)[0]
+
+def test_incomplete_backend_cannot_be_instantiated():
+    class Partial(StateCache):
+        def put(self, hostname, data):
+            return 0
+
+    with pytest.raises(TypeError):
+        Partial()
@@ -0,0 +1,143 @@
+import pytest
+
+from transport import (CircuitBreaker, CircuitOpenError, LatencyHistogram, Response, Transport, TransportError,
+                       backoff_delay)
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def open_breaker(clock, threshold=3, reset_timeout=30.0):
+    breaker = CircuitBreaker(failure_threshold=threshold, reset_timeout=reset_timeout, clock=clock)
+    for _ in range(threshold):
+        assert breaker.allow()
+        breaker.record_failure()
+    return breaker
+
+def test_opens_after_consecutive_failures():
+    clock = Clock()
+    breaker = CircuitBreaker(failure_threshold=3, clock=clock)
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+def test_success_resets_the_failure_count():
+    breaker = CircuitBreaker(failure_threshold=3, clock=Clock())
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+def test_half_open_lets_a_single_probe_through():
+    clock = Clock()
+    breaker = open_breaker(clock)
+    clock.now = 29.0
+    assert not breaker.allow()
+    clock.now = 30.0
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()  # the probe is in flight
+
+def test_successful_probe_closes():
+    clock = Clock()
+    breaker = open_breaker(clock)
+    clock.now = 30.0
+    breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow()
+
+def test_failed_probe_reopens_with_a_doubled_timeout():
+    clock = Clock()
+    breaker = open_breaker(clock)
+    breaker.max_reset_timeout = 100.0
+    for reopened_at, timeout in ((30.0, 60.0), (90.0, 100.0), (190.0, 100.0)):
+        clock.now = reopened_at
+        assert breaker.allow()
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.OPEN
+        assert breaker.reset_timeout == timeout
+
+    clock.now = 290.0
+    breaker.allow()
+    breaker.record_success()
+    assert breaker.reset_timeout == 30.0
+
+class StubTransport(Transport):
+    """Transport whose ``_send`` replays scripted outcomes"""
+
+    def __init__(self, outcomes, breaker):
+        super().__init__(http2=False, breaker=breaker)
+        self.outcomes = list(outcomes)
+
+    def _send(self, method, url, data, headers, timeout):
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return Response(outcome, {}, b"{}")
+
+def test_transport_feeds_the_breaker():
+    clock = Clock()
+    breaker = CircuitBreaker(failure_threshold=2, clock=clock)
+    transport = StubTransport([503, TransportError("refused")], breaker)
+    assert transport.post("http://server/api/report").status_code == 503
+    with pytest.raises(TransportError):
+        transport.post("http://server/api/report")
+    with pytest.raises(CircuitOpenError):
+        transport.post("http://server/api/report")
+    assert transport.get_stats()["rejected"] == 1
+
+def test_unexpected_error_settles_the_half_open_probe():
+    clock = Clock()
+    breaker = open_breaker(clock, threshold=1)
+    transport = StubTransport([ValueError("bad url"), 200], breaker)
+    clock.now = 30.0
+    with pytest.raises(ValueError):
+        transport.post("http://server/api/report")
+    assert breaker.state == CircuitBreaker.OPEN
+
+    clock.now = 100.0
+    assert transport.post("http://server/api/report").status_code == 200
+    assert breaker.state == CircuitBreaker.CLOSED
+
+def test_interrupt_is_not_a_server_failure():
+    clock = Clock()
+    breaker = CircuitBreaker(failure_threshold=1, clock=clock)
+    transport = StubTransport([KeyboardInterrupt(), 200], breaker)
+    with pytest.raises(KeyboardInterrupt):
+        transport.post("http://server/api/report")
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert transport.get_stats()["errors"] == 0
+
+def test_interrupted_probe_is_released():
+    clock = Clock()
+    breaker = open_breaker(clock, threshold=1)
+    transport = StubTransport([SystemExit(), 200], breaker)
+    clock.now = 30.0
+    with pytest.raises(SystemExit):
+        transport.post("http://server/api/report")
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.reset_timeout == 30.0  # not doubled: the probe had no outcome
+
+    assert transport.post("http://server/api/report").status_code == 200  # probes again at once
+    assert breaker.state == CircuitBreaker.CLOSED
+
+def test_backoff_delay_is_capped():
+    for attempt in range(10):
+        assert 0 <= backoff_delay(attempt, base=1.0, cap=8.0) <= min(8.0, 2 ** attempt)
+
+def test_latency_histogram_percentiles():
+    histogram = LatencyHistogram()
+    for ms in (5, 5, 5, 40, 400):
+        histogram.observe(ms / 1000)
+    assert histogram.percentile(0.5) == 10
+    assert histogram.percentile(0.95) == 500
+    assert histogram.snapshot()["count"] == 5
@@ -0,0 +1,240 @@
+"""HTTP transport for the agent.
+
+All requests go through one long-lived client, so reports reuse pooled
+keep-alive connections instead of paying a TCP/TLS handshake each time.
+With ``httpx`` and ``h2`` installed, HTTPS servers are spoken to over
+HTTP/2; otherwise a ``requests.Session`` is used. A circuit breaker fails
+fast while the server is down, and every request's latency is recorded in
+a per-endpoint histogram.
+"""
+import json
+import time
+import random
+import logging
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import httpx
+    import h2  # noqa: F401  (httpx needs it for http2=True)
+except ImportError:  # optional: HTTP/2
+    httpx = None
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the latency histogram buckets, in milliseconds
+LATENCY_BUCKETS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, float("inf"))
+
+class TransportError(Exception):
+    """The request did not produce an HTTP response"""
+
+class TransportTimeout(TransportError):
+    pass
+
+class CircuitOpenError(TransportError):
+    """Not attempted: the circuit breaker is open"""
+
+class Response:
+    """The parts of a response the agent uses, independent of the HTTP client"""
+
+    def __init__(self, status_code, headers, content):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+    @property
+    def ok(self):
+        return self.status_code < 400
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8", errors="replace")
+
+    def json(self):
+        return json.loads(self.content)
+
+def backoff_delay(attempt, base=1.0, cap=30.0):
+    """Exponential backoff with full jitter: uniform in [0, min(cap, base * 2^attempt)]"""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+class LatencyHistogram:
+    def __init__(self, buckets=LATENCY_BUCKETS_MS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.total_ms = 0.0
+
+    def observe(self, seconds):
+        ms = seconds * 1000.0
+        self.count += 1
+        self.total_ms += ms
+        for index, bound in enumerate(self.buckets):
+            if ms <= bound:
+                self.counts[index] += 1
+                break
+
+    def percentile(self, q):
+        """Upper bound of the bucket holding the ``q`` quantile"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.buckets[-1]
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total_ms / self.count, 1) if self.count else None,
+            "p50_ms": self.percentile(0.5),
+            "p95_ms": self.percentile(0.95),
+            "buckets": list(zip(self.buckets, self.counts)),
+        }
+
+class CircuitBreaker:
+    """Opens after ``failure_threshold`` consecutive failures.
+
+    While open, requests fail immediately. After ``reset_timeout`` seconds
+    (doubling on every failed probe, up to ``max_reset_timeout``) one probe
+    request is let through: success closes the circuit, failure reopens it.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half-open"
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, max_reset_timeout=300.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.base_reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.clock = clock
+        self.state = self.CLOSED
+        self.failures = 0
+        self.reset_timeout = reset_timeout
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and self.clock() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                return True
+            return False  # open, or a half-open probe is already in flight
+
+    def record_success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info("Circuit closed, server reachable again")
+            self.state = self.CLOSED
+            self.failures = 0
+            self.reset_timeout = self.base_reset_timeout
+
+    def release(self):
+        """Give back a half-open probe that ended without an outcome; the next request probes again"""
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self.state = self.OPEN
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN:
+                self.reset_timeout = min(self.reset_timeout * 2, self.max_reset_timeout)
+            elif self.failures < self.failure_threshold:
+                return
+            if self.state != self.OPEN:
+                logger.warning(f"Circuit open for {self.reset_timeout:.0f}s after {self.failures} failures")
+            self.state = self.OPEN
+            self.opened_at = self.clock()
+
+class Transport:
+    def __init__(self, timeout=5.0, pool_size=2, http2=True, breaker=None):
+        self.timeout = timeout
+        self.breaker = breaker or CircuitBreaker()
+        self.latency = {}  # label -> LatencyHistogram
+        self.stats = {"requests": 0, "errors": 0, "rejected": 0}
+        self._lock = threading.Lock()
+
+        if http2 and httpx is not None:
+            self.http_version = "HTTP/2 if offered"  # updated from the first response
+            self._client = httpx.Client(
+                http2=True,
+                timeout=timeout,
+                limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+            )
+        else:
+            self.http_version = "HTTP/1.1"
+            self._client = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+            self._client.mount("http://", adapter)
+            self._client.mount("https://", adapter)
+
+    def _send(self, method, url, data, headers, timeout):
+        if isinstance(self._client, requests.Session):
+            try:
+                response = self._client.request(method, url, data=data, headers=headers, timeout=timeout)
+            except requests.exceptions.Timeout as e:
+                raise TransportTimeout(str(e)) from e
+            except requests.exceptions.RequestException as e:
+                raise TransportError(str(e)) from e
+            return Response(response.status_code, response.headers, response.content)
+
+        try:
+            response = self._client.request(method, url, content=data, headers=headers, timeout=timeout)
+        except httpx.TimeoutException as e:
+            raise TransportTimeout(str(e)) from e
+        except httpx.HTTPError as e:
+            raise TransportError(str(e)) from e
+        self.http_version = response.http_version
+        return Response(response.status_code, response.headers, response.content)
+
+    def request(self, method, url, data=None, headers=None, timeout=None, label="report"):
+        """Send one request; 5xx responses and network errors count against the breaker"""
+        if not self.breaker.allow():
+            with self._lock:
+                self.stats["rejected"] += 1
+            raise CircuitOpenError("Circuit open, server considered down")
+
+        started = time.perf_counter()
+        try:
+            response = self._send(method, url, data, headers, timeout or self.timeout)
+        except Exception:
+            self.breaker.record_failure()
+            with self._lock:
+                self.stats["requests"] += 1
+                self.stats["errors"] += 1
+            raise
+        except BaseException:
+            # Interrupted (KeyboardInterrupt, SystemExit): not a server failure, but an unsettled
+            # half-open probe would block every later request
+            self.breaker.release()
+            raise
+
+        with self._lock:
+            self.stats["requests"] += 1
+            self.latency.setdefault(label, LatencyHistogram()).observe(time.perf_counter() - started)
+        if response.status_code >= 500:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return response
+
+    def post(self, url, data=None, headers=None, timeout=None, label="report"):
+        return self.request("POST", url, data=data, headers=headers, timeout=timeout, label=label)
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                **self.stats,
+                "http_version": self.http_version,
+                "circuit": self.breaker.state,
+                "latency": {label: histogram.snapshot() for label, histogram in self.latency.items()},
+            }
+
+    def close(self):
+        self._client.close()